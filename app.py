@@ -1,6 +1,9 @@
 #!/user/bin/env python
+import time
+
 import click
 from app import models, forms, create_app, db
+from app.monitoring.telemetry import start_telemetry_collectors
 
 
 app = create_app()
@@ -27,5 +30,27 @@ def drop_db():
     db.drop_all()
 
 
+@app.cli.command()
+@click.option(
+    "--station",
+    "station_ids",
+    type=int,
+    multiple=True,
+    help="Database ID of a station to record, all stations by default.",
+)
+def collect_telemetry(station_ids):
+    """Record the updates of the stations in the telemetry store until Ctrl+C."""
+    collectors = start_telemetry_collectors(app, list(station_ids) or None)
+    print(f"***** Recording {len(collectors)} stations, stop with Ctrl+C *****")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for collector in collectors:
+            collector.stop(timeout=app.config["TELEMETRY_FLUSH_INTERVAL"])
+
+
 if __name__ == "__main__":
     app.run()
@@ -15,11 +15,14 @@ def create_app(environment="development"):
     from config import config
     from .views import main_blueprint
     from .auth.views import auth_blueprint
-    from .auth.models import User, AnonymousUser
+    from .auth.models import User, AnonymousUser, get_user_cache
 
     # from .experiments.models import ExperimentalDesign, ExperimentalStation
     from .monitoring.views import monitoring_blueprint
     from .experiments.views import experiments_blueprint
+    from .jobs.models import Job
+    from .jobs.views import jobs_blueprint, remove_expired_exports
+    from .utils import get_engine_options, register_sqlite_pragmas
 
     # Instantiate app.
     app = Flask(__name__)
@@ -31,6 +34,7 @@ def create_app(environment="development"):
 
     # Set up extensions.
 
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = get_engine_options(app.config)
     db.init_app(app)
     login_manager.init_app(app)
     migrate.init_app(app, db, render_as_batch=True)
@@ -41,22 +45,27 @@ def create_app(environment="development"):
     app.register_blueprint(main_blueprint)
     app.register_blueprint(monitoring_blueprint)
     app.register_blueprint(experiments_blueprint)
+    app.register_blueprint(jobs_blueprint)
 
     # user_manager = UserManager(app, db, User)
 
     # Set up flask login.
     @login_manager.user_loader
     def get_user(id):
-        return User.query.get(int(id))
+        return get_user_cache().get_user(int(id))
 
     login_manager.login_view = "auth.login"
     login_manager.login_message_category = "info"
     login_manager.anonymous_user = AnonymousUser
 
     with app.app_context():
+        register_sqlite_pragmas(app)
         # create database tables
         # create default admin
         User.add_admin_user()
+        # jobs and exports of the previous run of the server
+        Job.fail_interrupted_jobs()
+        remove_expired_exports(app.config["JOB_EXPORT_TTL"])
 
     # Error handlers.
     @app.errorhandler(HTTPException)
@@ -1,15 +1,17 @@
 from datetime import datetime
 from os import abort
-from random import random
+import random
 import string
-from flask import url_for
+import threading
+import time
+from flask import current_app, has_app_context, url_for
 from flask_admin import Admin
 from flask_admin.contrib.sqla import ModelView
 from flask_login import UserMixin, AnonymousUserMixin, current_user
 
 from sqlalchemy.ext.hybrid import hybrid_property
 from werkzeug.security import generate_password_hash, check_password_hash
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import Session, joinedload, relationship
 
 # from flask_user import roles_required
 
@@ -56,6 +58,14 @@ class Group(db.Model, ModelMixin):
             return True
         return False
 
+    def delete(self):
+        # the cached members still know the group
+        member_ids = [user.id for user in self.users()]
+        super().delete()
+        for user_id in member_ids:
+            forget_cached_user(user_id)
+        return self
+
     @classmethod
     def get_group(cls, group_id):
         group = cls.query.filter_by(id=group_id).first()
@@ -81,6 +91,7 @@ class Group(db.Model, ModelMixin):
         if user is not None and group is not None:
             user.groups.append(group)
             db.session.commit()
+            forget_cached_user(user.id)
             return True
         return False
 
@@ -89,6 +100,7 @@ class Group(db.Model, ModelMixin):
         if user is not None:
             user.groups.append(self)
             db.session.commit()
+            forget_cached_user(user.id)
             return True
         return False
 
@@ -97,6 +109,7 @@ class Group(db.Model, ModelMixin):
         if user is not None and (current_user.id == self.owner or user == current_user):
             user.groups.remove(self)
             self.save()
+            forget_cached_user(user.id)
             # if no more users in the group, delete the group
             if len(self.users()) == 0:
                 self.delete()
@@ -175,23 +188,27 @@ class User(db.Model, UserMixin, ModelMixin):
         ):
             self.password_hash = generate_password_hash(new_password1)
             db.session.commit()
+            forget_cached_user(self.id)
             return True
         return False
 
     def change_email(self, new_email):
         self.email = new_email
         db.session.commit()
+        forget_cached_user(self.id)
         return True
 
     def change_name(self, new_firstName, new_lastName):
         self.firstName = new_firstName
         self.lastName = new_lastName
         db.session.commit()
+        forget_cached_user(self.id)
         return True
 
     def change_shortID(self, new_shortID):
         self.shortID = new_shortID
         db.session.commit()
+        forget_cached_user(self.id)
         return True
 
     def is_active(self):
@@ -217,6 +234,7 @@ class User(db.Model, UserMixin, ModelMixin):
         if group is not False:
             self.groups.append(group)
             self.save()
+            forget_cached_user(self.id)
         return True
 
     @classmethod
@@ -225,6 +243,7 @@ class User(db.Model, UserMixin, ModelMixin):
         if user is not None:
             user.activated = True
             db.session.commit()
+            forget_cached_user(user.id)
             return True
         return False
 
@@ -234,6 +253,7 @@ class User(db.Model, UserMixin, ModelMixin):
         if user is not None:
             user.activated = False
             db.session.commit()
+            forget_cached_user(user.id)
             return True
         return False
 
@@ -243,6 +263,7 @@ class User(db.Model, UserMixin, ModelMixin):
         if user is not None:
             user.is_admin = True
             db.session.commit()
+            forget_cached_user(user.id)
             return True
         return False
 
@@ -252,6 +273,7 @@ class User(db.Model, UserMixin, ModelMixin):
         if user is not None:
             user.is_admin = False
             db.session.commit()
+            forget_cached_user(user.id)
             return True
         return False
 
@@ -260,6 +282,7 @@ class User(db.Model, UserMixin, ModelMixin):
         user = cls.query.filter_by(id=user_id).first()
         if user is not None:
             user.delete()
+            forget_cached_user(user_id)
             return True
         return False
 
@@ -274,6 +297,27 @@ class User(db.Model, UserMixin, ModelMixin):
     def get_all_users(cls):
         return cls.query.all()
 
+    @classmethod
+    def load_user_with_roles_and_groups(cls, user_id):
+        """Loads a user with its roles and groups in one query, outside of the session of the request.
+
+        Args:
+            user_id (int): Database ID of the user
+
+        Returns:
+            User: detached user with loaded roles and groups, None if the user does not exist
+        """
+        with Session(db.engine) as session:
+            return (
+                session.scalars(
+                    db.select(cls)
+                    .options(joinedload(cls.roles), joinedload(cls.groups))
+                    .where(cls.id == user_id)
+                )
+                .unique()
+                .first()
+            )
+
     @classmethod
     def add_admin_user(cls):
         from sqlalchemy import inspect
@@ -360,3 +404,57 @@ group_shared_designs = db.Table(
 
 class AnonymousUser(AnonymousUserMixin):
     pass
+
+
+class UserCache(object):
+    """Users of the flask-login user_loader with their roles and groups.
+    A cached user is merged into the session of the request without a query until it is ttl seconds old
+    or forgotten because it was changed. Changes made by other processes are visible after ttl seconds.
+
+    Args:
+        ttl (float): seconds a loaded user is reused, 0 disables the cache
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._users = {}
+        self._lock = threading.Lock()
+
+    def get_user(self, user_id):
+        if self.ttl <= 0:
+            return User.query.get(user_id)
+        with self._lock:
+            entry = self._users.get(user_id)
+        if entry is None or entry[0] < time.monotonic():
+            user = User.load_user_with_roles_and_groups(user_id)
+            if user is None:
+                self.forget(user_id)
+                return None
+            entry = (time.monotonic() + self.ttl, user)
+            with self._lock:
+                self._users[user_id] = entry
+        return db.session.merge(entry[1], load=False)
+
+    def forget(self, user_id=None):
+        """Drops a user from the cache, all users if no user_id is given."""
+        with self._lock:
+            if user_id is None:
+                self._users.clear()
+            else:
+                self._users.pop(user_id, None)
+
+
+def get_user_cache():
+    """Returns the UserCache of the current app, created with the USER_CACHE_TTL of its config."""
+    cache = current_app.extensions.get("user_cache")
+    if cache is None:
+        cache = current_app.extensions.setdefault(
+            "user_cache", UserCache(current_app.config["USER_CACHE_TTL"])
+        )
+    return cache
+
+
+def forget_cached_user(user_id=None):
+    """Drops a changed user from the user cache of the current app."""
+    if has_app_context():
+        get_user_cache().forget(int(user_id) if user_id is not None else None)
@@ -2,7 +2,7 @@ from flask import Blueprint, render_template, url_for, redirect, flash, request
 from flask_login import login_user, logout_user, login_required, current_user
 
 from .. import db
-from .models import Group, User
+from .models import Group, User, forget_cached_user
 from .forms import AddGroupForm, LoginForm, RegistrationForm, PasswordChangeForm
 
 auth_blueprint = Blueprint("auth", __name__)
@@ -58,6 +58,7 @@ def user_password_change():
             user.password = form.password.data
             db.session.add(user)
             db.session.commit()
+            forget_cached_user(user.id)
             flash("Password has been updated!", "success")
     return form
 
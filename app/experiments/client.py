@@ -0,0 +1,247 @@
+"""HTTP client for the station API.
+
+Every call to a station goes through the :class:`StationClient` of its
+address. The client keeps a pooled keep-alive ``requests.Session`` with
+connect/read timeouts, bounded retries with backoff and a limit for the
+number of simultaneous connections to the station. The parsed run tables of
+the station are cached for a short time, see :class:`RunTablesCache`.
+"""
+import json
+import threading
+import time
+
+import requests
+from flask import current_app
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import orjson
+except ImportError:  # optional, the responses are parsed with json without it
+    orjson = None
+
+
+def loads(content):
+    """Parses a JSON response of a station, with orjson if it is installed.
+
+    Args:
+        content (bytes): body of the response, str works as well
+
+    Raises:
+        ValueError: if the response is not valid JSON
+
+    Returns:
+        the parsed document
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(content)
+        except orjson.JSONDecodeError:
+            # NaN and Infinity are written by Python stations, but only accepted by json
+            pass
+    return json.loads(content)
+
+
+class StationClient(object):
+    """Pooled connection to the API of one station.
+
+    Failed connection attempts are retried for all requests, since the station did not receive them.
+    Read errors and 502/503/504 responses are only retried for GET requests, the station API is not
+    idempotent for POST requests like ``add_experiment``.
+
+    Args:
+        address (str): address of the station (host:port).
+        connect_timeout (float): seconds to wait for the connection.
+        read_timeout (float): seconds to wait for the response.
+        retries (int): number of retries per request.
+        backoff_factor (float): backoff between retries, see urllib3.util.retry.Retry.
+        pool_size (int): maximum number of simultaneous connections to the station.
+        run_tables_ttl (float): seconds the run tables of the station are cached.
+    """
+
+    def __init__(
+        self,
+        address,
+        connect_timeout=3.05,
+        read_timeout=10.0,
+        retries=2,
+        backoff_factor=0.3,
+        pool_size=4,
+        run_tables_ttl=2.0,
+    ):
+        self.address = address
+        self.timeout = (connect_timeout, read_timeout)
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=backoff_factor,
+            allowed_methods=frozenset(["GET"]),
+            status_forcelist=(502, 503, 504),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            pool_block=True,
+            max_retries=retry,
+        )
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.run_tables = RunTablesCache(self, run_tables_ttl)
+
+    def url(self, endpoint):
+        return f"http://{self.address}/api/{endpoint}"
+
+    def get(self, endpoint, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.get(self.url(endpoint), **kwargs)
+
+    def post(self, endpoint, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.post(self.url(endpoint), **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+class _RunTablesFetch(object):
+    """A running request for the run tables, concurrent callers wait for its result."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.run_tables = None
+        self.content = None
+        self.error = None
+
+
+class RunTablesCache(object):
+    """Parsed ``station_run_tables`` response of a station, shared for ``ttl`` seconds.
+
+    Concurrent callers of an expired cache wait for a single request instead of sending their own.
+    Besides the tables the parameters of the running experiment are kept, so looking up a
+    parameter of the running experiment is a dict lookup. The raw response is kept as well, so
+    it can be forwarded without serialising the tables again, see :meth:`get_content`.
+
+    Args:
+        client (StationClient): client for the API of the station.
+        ttl (float): seconds a response is reused.
+    """
+
+    def __init__(self, client, ttl):
+        self.client = client
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._fetched_at = None
+        self._run_tables = None
+        self._content = None
+        self._active_parameters = None
+        self._fetch = None
+
+    def get_run_tables(self):
+        """Returns the run tables of the station.
+
+        Returns:
+            list: one dict per run, with ``state``, ``type`` and ``parameters``.
+        """
+        return self._get()[0]
+
+    def get_content(self):
+        """Returns the run tables of the station as JSON, the body of the station response.
+
+        Returns:
+            bytes: the response, already validated by parsing it once per ttl.
+        """
+        return self._get()[1]
+
+    def _get(self):
+        with self._lock:
+            if (
+                self._fetched_at is not None
+                and time.monotonic() - self._fetched_at < self.ttl
+            ):
+                return self._run_tables, self._content
+            fetch = self._fetch
+            if fetch is None:
+                self._fetch = _RunTablesFetch()
+        if fetch is not None:
+            fetch.done.wait()
+            if fetch.error is not None:
+                raise fetch.error
+            return fetch.run_tables, fetch.content
+        return self._refresh()
+
+    def get_active_parameters(self):
+        """Returns the parameters of the running experiment, None if no experiment is running.
+
+        Returns:
+            dict: parameter name -> value.
+        """
+        self.get_run_tables()
+        return self._active_parameters
+
+    def invalidate(self):
+        with self._lock:
+            self._fetched_at = None
+
+    def _refresh(self):
+        fetch = self._fetch
+        try:
+            ### the station is asked with POST like the run tables stream always did
+            r = self.client.post("station_run_tables")
+            content = r.content
+            run_tables = loads(content)
+            active_parameters = None
+            for run in run_tables:
+                if run["state"] == "Running":
+                    active_parameters = run["parameters"]
+                    break
+        except Exception as e:
+            # waiting callers get the same error, the next call tries again
+            fetch.error = e
+            with self._lock:
+                self._fetch = None
+            fetch.done.set()
+            raise
+        with self._lock:
+            self._run_tables = run_tables
+            self._content = content
+            self._active_parameters = active_parameters
+            self._fetched_at = time.monotonic()
+            self._fetch = None
+        fetch.run_tables = run_tables
+        fetch.content = content
+        fetch.done.set()
+        return run_tables, content
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_station_client(address):
+    """Returns the client for a station address, creating it with the settings of the current app on first use.
+
+    Args:
+        address (str): address of the station (host:port).
+
+    Returns:
+        StationClient: client for the station.
+    """
+    with _clients_lock:
+        client = _clients.get(address)
+        if client is None:
+            config = current_app.config
+            client = StationClient(
+                address,
+                connect_timeout=config["STATION_CONNECT_TIMEOUT"],
+                read_timeout=config["STATION_READ_TIMEOUT"],
+                retries=config["STATION_RETRIES"],
+                backoff_factor=config["STATION_RETRY_BACKOFF"],
+                pool_size=config["STATION_POOL_SIZE"],
+                run_tables_ttl=config["STATION_RUN_TABLES_TTL"],
+            )
+            _clients[address] = client
+        return client
@@ -0,0 +1,82 @@
+"""Sending experimental runs to a station.
+
+The payloads of all runs are built up front, then posted to ``/api/add_experiment``
+one after another, or by a bounded pool of threads sharing the pooled
+:class:`StationClient` of the station if more than one worker is configured. Every run gets a :class:`RunDispatchResult`, a failing run does not
+stop the others. Once the station is unreachable the remaining runs are not
+sent anymore.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+
+
+class RunDispatchResult(object):
+    """Outcome of sending one run to the station.
+
+    Args:
+        run_id (int): Database ID of the run.
+        experiment_id (str): ID of the experiment on the station (design - stage - run id).
+        error (str, optional): reason the run was not accepted, None if it was sent.
+    """
+
+    def __init__(self, run_id, experiment_id, error=None):
+        self.run_id = run_id
+        self.experiment_id = experiment_id
+        self.error = error
+
+    @property
+    def sent(self):
+        return self.error is None
+
+
+def dispatch_runs(client, payloads, max_workers=1, progress=None):
+    """Posts the payloads to ``add_experiment`` of a station.
+
+    With more than one worker the station may receive the runs in a different order than given.
+
+    Args:
+        client (StationClient): client for the API of the station.
+        payloads (list): ``(run_id, payload)`` tuples, payload is the form data of ``add_experiment``.
+        max_workers (int): maximum number of runs sent at the same time, 1 sends them in the given order.
+        progress (callable, optional): called with the number of finished runs and the number of runs.
+
+    Returns:
+        list: one RunDispatchResult per payload, in the order of the payloads.
+    """
+    station_unreachable = threading.Event()
+
+    def send(run_id, payload):
+        experiment_id = payload["experiment_id"]
+        if station_unreachable.is_set():
+            return RunDispatchResult(
+                run_id, experiment_id, "Not sent, the station is unreachable."
+            )
+        try:
+            r = client.post("add_experiment", data=payload)
+        except requests.exceptions.ConnectionError as e:
+            station_unreachable.set()
+            return RunDispatchResult(run_id, experiment_id, str(e))
+        except requests.exceptions.RequestException as e:
+            return RunDispatchResult(run_id, experiment_id, str(e))
+        if not r.ok:
+            return RunDispatchResult(
+                run_id, experiment_id, f"HTTP {r.status_code}: {r.text}"
+            )
+        return RunDispatchResult(run_id, experiment_id)
+
+    if not payloads:
+        return []
+    with ThreadPoolExecutor(
+        max_workers=max(1, min(max_workers, len(payloads))),
+        thread_name_prefix=f"dispatch-{client.address}",
+    ) as executor:
+        futures = [
+            executor.submit(send, run_id, payload) for run_id, payload in payloads
+        ]
+        if progress is not None:
+            # called from this thread, the worker threads do not touch the database
+            for done, _ in enumerate(as_completed(futures), 1):
+                progress(done, len(futures))
+        return [future.result() for future in futures]
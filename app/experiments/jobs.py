@@ -0,0 +1,82 @@
+"""Job functions of the experiments blueprint, executed by the JobRunner, see app/jobs/runner.py.
+
+The functions get the ids of the objects they work on, never model instances of the request.
+"""
+import os
+
+import pandas as pd
+from flask import current_app
+
+from .models import ExperimentalDesign, ExperimentalStation, Stage
+from ..jobs.views import get_job_export_path, remove_expired_exports
+
+
+def get_dispatch_result(job, results):
+    """Stores a summary of sent runs in the job and returns the job result."""
+    failed = [
+        {"run_id": result.run_id, "error": result.error}
+        for result in results
+        if not result.sent
+    ]
+    job.message = (
+        f"{len(results) - len(failed)} of {len(results)} runs were sent to the station."
+    )
+    return {"sent": len(results) - len(failed), "failed": failed}
+
+
+def send_stages_job(job, design_id, stage_ids):
+    """Sends all runs of the stages to the station of the design."""
+    design = ExperimentalDesign.get_experimental_design_by_id(design_id)
+    stages = [stage for stage in design.stages if stage.id in stage_ids]
+    results = design.sent_stages_to_station(stages, progress=job.set_progress)
+    return get_dispatch_result(job, results)
+
+
+def sync_routines_job(job, station_id):
+    """Synchronises the routines of a station with its experiment types."""
+    station = ExperimentalStation.get_station_by_id(station_id)
+    plan = station.sync_routines()
+    job.message = plan.get_message()
+    return plan.get_summary()
+
+
+def sync_all_stations_job(job):
+    """Synchronises the routines of all stations, a station that can not be reached does not stop the others."""
+    results = ExperimentalStation.sync_all_stations(progress=job.set_progress)
+    stations = []
+    errors = []
+    for station, plan, error in results:
+        if error is None:
+            stations.append({"station": station.name, **plan.get_summary()})
+        else:
+            errors.append(f"{station.name}: {error}")
+    job.message = f"{len(stations)} of {len(results)} stations were synchronised."
+    return {"stations": stations, "errors": errors}
+
+
+def import_stage_job(job, stage_id, path, dynamic_only):
+    """Imports an uploaded Excel file into a stage, the file is deleted afterwards."""
+    try:
+        stage = Stage.get_stage_by_id(stage_id)
+        df = pd.read_excel(path)
+        added_runs, updated_runs = stage.add_or_update_runs_from_dataframe(
+            df, dynamic_only
+        )
+    finally:
+        os.remove(path)
+    job.message = f"{added_runs} runs were added and {updated_runs} runs were updated."
+    return {"added": added_runs, "updated": updated_runs}
+
+
+def export_stage_job(job, stage_id, dynamic_only, file_format):
+    """Writes the runs of a stage into a file of the exports folder, see jobs.job_download."""
+    stage = Stage.get_stage_by_id(stage_id)
+    file_name = f"job-{job.id}.{file_format}"
+    path = get_job_export_path(file_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    remove_expired_exports(current_app.config["JOB_EXPORT_TTL"])
+    stage.write_run_table_file(path, dynamic_only, file_format)
+    return {
+        "file": file_name,
+        "download_name": stage.get_download_filename(dynamic_only, file_format),
+    }
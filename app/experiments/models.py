@@ -1,24 +1,258 @@
 from datetime import datetime
 from sqlalchemy.ext.hybrid import hybrid_property
 from .. import db
-from ..utils import ModelMixin
+from ..utils import ModelMixin, commit, db_batch
+from .client import get_station_client
+from .dispatch import dispatch_runs
+from .sync import diff_catalog, fetch_catalog, fetch_catalogs
+from ..monitoring.models import TelemetrySample
 import builtins
-import requests
+import collections
 import json
 import io
-from requests.exceptions import HTTPError
+import re
+import csv
+import itertools
+import uuid
+import numpy as np
 import pandas as pd
 from flask import (
-    url_for,
-    redirect,
+    current_app,
+    g,
+    has_app_context,
     flash,
     Response,
     abort,
+    stream_with_context,
 )
 
 from ..auth.models import User
 
 
+def _cast_int(var):
+    return int(float(var))
+
+
+### spellings of bool values, bool() would read every non empty string like "False" as True
+BOOL_STRINGS = {
+    "true": True,
+    "1": True,
+    "1.0": True,
+    "false": False,
+    "0": False,
+    "0.0": False,
+}
+
+
+def _cast_bool(var):
+    """Casts true/false/1/0 (any case, also as number) to bool.
+
+    Stored values are not validated on import, any other value is read as None
+    instead of failing the pages that show it.
+    """
+    if isinstance(var, (bool, int, float)) and var in (0, 1):
+        return bool(var)
+    return BOOL_STRINGS.get(str(var).strip().lower())
+
+
+### caster per trusted data type name, values of other data types are kept as they are
+VALUE_CASTERS = {
+    "int": _cast_int,
+    "float": float,
+    "complex": complex,
+    "bool": _cast_bool,
+    "str": str,
+}
+
+
+def cast_value_by_dtype_name(data_type, var):
+    """Casts a value_as_str string to the data type of its parameter."""
+    caster = VALUE_CASTERS.get(data_type)
+    if caster is None:
+        return var
+    return caster(var)
+
+
+### pandas dtype per data type name, for the analysis dataframe of a stage
+DATAFRAME_DTYPES = {
+    "int": "Int64",
+    "float": "float64",
+    "complex": "complex128",
+    "bool": "boolean",
+    "str": "string",
+}
+
+### data types whose values are also stored in Values.value_as_float
+NUMERIC_DATA_TYPES = ["int", "float", "bool"]
+
+
+def get_value_as_float(data_type, value_as_str):
+    """Returns the number stored in Values.value_as_float, None for values of non numeric parameters.
+
+    Args:
+        data_type (str): data type name of the parameter
+        value_as_str (str): value as stored in Values.value_as_str
+
+    Returns:
+        float: casted value, None if the parameter is not numeric or the value can not be casted
+    """
+    if data_type not in NUMERIC_DATA_TYPES:
+        return None
+    try:
+        value = cast_value_by_dtype_name(data_type, value_as_str)
+        return None if value is None else float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+ParameterInfo = collections.namedtuple(
+    "ParameterInfo", ["id", "name", "data_type", "static_param", "default_value"]
+)
+
+
+def get_parameter_info(parameter_id):
+    """Returns the metadata of a parameter needed to cast its values.
+    The metadata is cached for the current request (or job), so the parameter is loaded once per request.
+
+    Args:
+        parameter_id (int): Database ID of the parameter
+
+    Returns:
+        ParameterInfo: id, name, data_type, static_param and the casted default_value of the parameter
+    """
+    cache = g.setdefault("parameter_infos", {}) if has_app_context() else {}
+    info = cache.get(parameter_id)
+    if info is None:
+        parameter = Parameters.get_parameter(parameter_id)
+        info = ParameterInfo(
+            parameter.id,
+            parameter.name,
+            parameter.data_type,
+            parameter.static_param,
+            parameter.get_default_value(),
+        )
+        cache[parameter_id] = info
+    return info
+
+
+def forget_parameter_info(parameter_id):
+    """Drops a changed parameter from the metadata cache of the current request."""
+    if has_app_context():
+        g.setdefault("parameter_infos", {}).pop(parameter_id, None)
+
+
+def get_experiment_id(design_name, stage_name, run_id):
+    """Returns the experiment_id a run is sent to the station with, the station reports it as current_experiment."""
+    ## build run id from design name - stage name - run id
+    return f"{design_name}-{stage_name}-{run_id}"
+
+
+### "<design name>-<stage name>-<run id>", the names may contain "-" themselves
+EXPERIMENT_ID_PATTERN = re.compile(r".+-.+-([0-9]+)")
+
+
+def parse_run_id(experiment_id):
+    """Returns the Database ID of the run from an experiment_id, see get_experiment_id.
+    Only the exact experiment_id of an existing run is accepted, including the names of its design and stage.
+
+    Args:
+        experiment_id (str): experiment_id or current_experiment of a station
+
+    Returns:
+        int: ID of the run, None if the experiment was not sent as a run
+    """
+    if not experiment_id:
+        return None
+    match = EXPERIMENT_ID_PATTERN.fullmatch(str(experiment_id))
+    if match is None:
+        return None
+    run_id = int(match.group(1))
+    names = db.session.execute(
+        db.select(ExperimentalDesign.name, Stage.name)
+        .join(Stage, Stage.experimental_design_id == ExperimentalDesign.id)
+        .join(ExperimentalRuns, ExperimentalRuns.stage_id == Stage.id)
+        .where(ExperimentalRuns.id == run_id)
+    ).first()
+    if names is None or get_experiment_id(*names, run_id) != experiment_id:
+        return None
+    return run_id
+
+
+def new_layout_version():
+    """Returns a new value for ExperimentalRoutines.layout_version.
+    Random versions are never reused, not even by a new routine that gets the ID of a deleted one.
+    """
+    return uuid.uuid4().hex
+
+
+class RoutineLayout(object):
+    """Column layout of the runs of a routine, shared by all run serialisers.
+
+    Args:
+        version (str): layout_version of the routine the layout was built from
+        parameters (list): parameters of the routine in their order
+    """
+
+    def __init__(self, version, parameters):
+        self.version = version
+        self.parameter_ids = [parameter.id for parameter in parameters]
+        self.names = [parameter.name for parameter in parameters]
+        self.data_types = [parameter.data_type for parameter in parameters]
+        ### True for the columns of dynamic parameters
+        self.dynamic = [not parameter.static_param for parameter in parameters]
+        self.positions = {name: position for position, name in enumerate(self.names)}
+        self.positions_by_id = {
+            parameter_id: position
+            for position, parameter_id in enumerate(self.parameter_ids)
+        }
+        ### casted default values of the static parameters by position
+        self.static_defaults = {
+            position: parameter.get_default_value()
+            for position, parameter in enumerate(parameters)
+            if parameter.static_param
+        }
+
+    def __len__(self):
+        return len(self.parameter_ids)
+
+    def get_columns(self, dynamic_only):
+        """Returns the positions of the parameters included in a run table."""
+        if dynamic_only:
+            return [
+                position for position, dynamic in enumerate(self.dynamic) if dynamic
+            ]
+        return list(range(len(self)))
+
+    def get_cell(self, position, value_as_str):
+        """Returns the value of a run in a column, the default value for static parameters."""
+        if position in self.static_defaults:
+            return self.static_defaults[position]
+        return cast_value_by_dtype_name(self.data_types[position], value_as_str)
+
+
+### layouts by routine ID, a layout is rebuilt once the layout_version of its routine changed
+_routine_layouts = {}
+
+
+def cast_column_by_dtype_name(column, data_type):
+    """Casts a column of value_as_str strings like Values.value casts a single value.
+
+    Args:
+        column (pandas.Series): values as strings, missing values as None/NaN
+        data_type (str): data type name of the parameter
+
+    Returns:
+        pandas.Series: casted column
+    """
+    if data_type == "float":
+        return column.astype(float)
+    if data_type == "int":
+        return np.trunc(column.astype(float)).astype("Int64")
+    if data_type in ["complex", "bool"]:
+        return column.map(VALUE_CASTERS[data_type], na_action="ignore")
+    return column
+
+
 ### Association Tables ###
 
 Parameters_in_Routines = db.Table(
@@ -28,6 +262,7 @@ Parameters_in_Routines = db.Table(
         "experimental_routines_id",
         db.Integer,
         db.ForeignKey("experimental_routines.id"),
+        index=True,
     ),
     db.Column("parameters_id", db.Integer, db.ForeignKey("parameters.id")),
 )
@@ -35,7 +270,7 @@ Parameters_in_Routines = db.Table(
 Routines_in_Stations = db.Table(
     "association_Routines_in_Stations",
     db.Model.metadata,
-    db.Column("Station_id", db.Integer, db.ForeignKey("stations.id")),
+    db.Column("Station_id", db.Integer, db.ForeignKey("stations.id"), index=True),
     db.Column(
         "experimental_routines_id",
         db.Integer,
@@ -58,6 +293,10 @@ class ExperimentalRoutines(db.Model, ModelMixin):
         lazy="subquery",
         backref=db.backref("parameters_in_routine", lazy=True),
     )
+    ### changes whenever the parameters of the routine change, see get_layout
+    layout_version = db.Column(
+        db.String(32), unique=False, nullable=False, default=new_layout_version
+    )
 
     @classmethod
     def add_routine(cls, name):
@@ -71,7 +310,7 @@ class ExperimentalRoutines(db.Model, ModelMixin):
         """
         routine = cls(name=name)
         db.session.add(routine)
-        db.session.commit()
+        commit()
         return routine
 
     @classmethod
@@ -124,6 +363,36 @@ class ExperimentalRoutines(db.Model, ModelMixin):
             parameter.name: parameter.id for parameter in cls.get_routine(id).parameters
         }
 
+    @classmethod
+    def get_layout_by_id(cls, id):
+        """Returns the column layout of a routine, the parameters are only loaded if the cached layout is outdated.
+
+        Args:
+            id (int): Database ID of the routine
+
+        Returns:
+            RoutineLayout: positions, dynamic mask and static default values of the parameters
+        """
+        version = db.session.scalar(db.select(cls.layout_version).where(cls.id == id))
+        if version is None:
+            abort(404)
+        layout = _routine_layouts.get(id)
+        if layout is None or layout.version != version:
+            return cls.get_routine(id).get_layout()
+        return layout
+
+    def get_layout(self):
+        """Returns the column layout of the routine, cached until its layout_version changes."""
+        layout = _routine_layouts.get(self.id)
+        if layout is None or layout.version != self.layout_version:
+            layout = RoutineLayout(self.layout_version, self.parameters)
+            _routine_layouts[self.id] = layout
+        return layout
+
+    def invalidate_layout(self):
+        """Marks the layout of the routine as outdated, committed together with the change of the parameters."""
+        self.layout_version = new_layout_version()
+
     @classmethod
     def get_routine_by_name(cls, name):
         return cls.query.filter_by(name=name).first()
@@ -136,20 +405,24 @@ class ExperimentalRoutines(db.Model, ModelMixin):
         routine.name = name
         routine.note = note
         routine.parameters = parameters
+        routine.invalidate_layout()
         db.session.commit()
 
     def delete_routine(self, id):
         routine = self.query.get(id)
         db.session.delete(routine)
         db.session.commit()
+        _routine_layouts.pop(id, None)
 
     def set_parameters(self, parameters):
         self.parameters = parameters
-        db.session.commit()
+        self.invalidate_layout()
+        commit()
 
     def add_parameter(self, parameter):
         self.parameters.append(parameter)
-        db.session.commit()
+        self.invalidate_layout()
+        commit()
 
     def get_parameters_in_routine(self):
         return self.parameters
@@ -179,7 +452,9 @@ class ExperimentalRuns(db.Model, ModelMixin):
     __tablename__ = "experimental_runs"
 
     id = db.Column(db.Integer, primary_key=True)
-    stage_id = db.Column(db.Integer, db.ForeignKey("stage.id"), nullable=False)
+    stage_id = db.Column(
+        db.Integer, db.ForeignKey("stage.id"), nullable=False, index=True
+    )
     status = db.Column(db.Integer, default=0, unique=False, nullable=False)
     run_values = db.relationship(
         "Values", backref="experimental_runs", lazy=True, cascade="all,delete"
@@ -189,13 +464,27 @@ class ExperimentalRuns(db.Model, ModelMixin):
     def add_new_run(cls, stage_id, status=0):
         run = cls(stage_id=stage_id, status=status)
         db.session.add(run)
-        db.session.commit()
+        commit()
         return run
 
     def set_status(self, status):
         self.status = status
         self.save()
 
+    @classmethod
+    def set_status_by_ids(cls, runs_ids, status, chunk_size=500):
+        """Sets the status of several runs in one transaction.
+        The IDs are bound in chunks of chunk_size, SQLite limits the number of parameters of a statement.
+        """
+        runs_ids = list(runs_ids)
+        for start in range(0, len(runs_ids), chunk_size):
+            db.session.execute(
+                db.update(cls)
+                .where(cls.id.in_(runs_ids[start : start + chunk_size]))
+                .values(status=status)
+            )
+        db.session.commit()
+
     def add_values_to_run(self, run_values):
         self.run_values.append(run_values)
         self.save()
@@ -205,42 +494,24 @@ class ExperimentalRuns(db.Model, ModelMixin):
         return cls.query.get_or_404(id)
 
     def get_parameter_value_pairs_in_run_dynamic_only(self):
-        dynamic_parameters_in_routine = (
-            Stage.get_stage_by_id(self.stage_id)
-            .get_experimental_routine()
-            .get_dynamic_parameter_names_in_routine()
-        )
-        parameter_value_pairs = [
-            value.get_parameter_value_pair() for value in self.run_values
-        ]
-
-        # get only the dynamic parameters
-        parameter_value_pairs = [
-            pair
-            for pair in parameter_value_pairs
-            if pair[0] in dynamic_parameters_in_routine
-        ]
-
-        # sort the parameter_value_pairs by the order of parameters in the routine
-        parameter_value_pairs.sort(  # sort by the first element of the tuple
-            key=lambda x: dynamic_parameters_in_routine.index(x[0])
-        )
-        return parameter_value_pairs
+        return self._get_parameter_value_pairs(dynamic_only=True)
 
     def get_parameter_value_pairs_in_run(self):
-        parameters_in_routine = (
-            Stage.get_stage_by_id(self.stage_id)
-            .get_experimental_routine()
-            .get_parameter_names_in_routine()
-        )
-        parameter_value_pairs = [
-            value.get_parameter_value_pair() for value in self.run_values
-        ]
-        # sort the parameter_value_pairs by the order of parameters in the routine
-        parameter_value_pairs.sort(  # sort by the first element of the tuple
-            key=lambda x: parameters_in_routine.index(x[0])
+        return self._get_parameter_value_pairs(dynamic_only=False)
+
+    def _get_parameter_value_pairs(self, dynamic_only):
+        layout = ExperimentalRoutines.get_layout_by_id(
+            Stage.get_stage_by_id(self.stage_id).experimental_Routine_id
         )
-        return parameter_value_pairs
+        cells = []
+        for value in self.run_values:
+            position = layout.positions_by_id.get(value.parameter_id)
+            if position is None or (dynamic_only and not layout.dynamic[position]):
+                continue
+            cells.append((position, layout.get_cell(position, value.value_as_str)))
+        # sort the pairs by the order of parameters in the routine
+        cells.sort(key=lambda cell: cell[0])
+        return [(layout.names[position], value) for position, value in cells]
 
 
 class Parameters(db.Model, ModelMixin):
@@ -273,16 +544,23 @@ class Parameters(db.Model, ModelMixin):
         parameter.note = note
         parameter.data_type = data_type
         parameter.static_param = static_param
+        parameter.invalidate_routine_layouts()
         db.session.commit()
+        forget_parameter_info(id)
+        Values.update_values_as_float_of_parameter(id)
 
     def toggle_static_parameter(self):
         self.static_param = not self.static_param
+        self.invalidate_routine_layouts()
         db.session.commit()
+        forget_parameter_info(self.id)
 
     def delete_parameter(self, id):
         parameter = self.query.get(id)
+        parameter.invalidate_routine_layouts()
         db.session.delete(parameter)
         db.session.commit()
+        forget_parameter_info(id)
 
     def set_default_value(self, value):
         def _cast_by_dtype_name(var):
@@ -296,18 +574,17 @@ class Parameters(db.Model, ModelMixin):
             return var
 
         self.default_value = _cast_by_dtype_name(value)
+        self.invalidate_routine_layouts()
         db.session.commit()
+        forget_parameter_info(self.id)
 
-    def get_default_value(self):
-        def _cast_by_dtype_name(var):
-            trusted_types = ["int", "float", "complex", "bool", "str"]
-            if self.data_type in trusted_types:
-                if self.data_type == "int":
-                    return getattr(builtins, self.data_type)(float(var))
-                return getattr(builtins, self.data_type)(var)
-            return var
+    def invalidate_routine_layouts(self):
+        """Marks the layouts of all routines with the parameter as outdated."""
+        for routine in self.parameters_in_routine:
+            routine.invalidate_layout()
 
-        return _cast_by_dtype_name(self.default_value)
+    def get_default_value(self):
+        return cast_value_by_dtype_name(self.data_type, self.default_value)
 
     def get_if_static_param(self):
         return self.static_param
@@ -319,8 +596,10 @@ class ExperimentalDesign(db.Model, ModelMixin):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(60), unique=False, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.now)
-    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
-    station_id = db.Column(db.Integer, db.ForeignKey("stations.id"))
+    user_id = db.Column(
+        db.Integer, db.ForeignKey("users.id"), nullable=False, index=True
+    )
+    station_id = db.Column(db.Integer, db.ForeignKey("stations.id"), index=True)
     stages = db.relationship(
         "Stage",
         backref="experimental_design",
@@ -345,6 +624,45 @@ class ExperimentalDesign(db.Model, ModelMixin):
         design.save()
         flash("Successfuly added new experimental design.", "success")
 
+    def sent_run_payloads_to_station(self, payloads, progress=None):
+        """Sends runs to the station of the design and sets the status of all accepted runs in one transaction.
+
+        Args:
+            payloads (list): (run id, payload) tuples, see Stage.get_run_payloads
+            progress (callable, optional): called with the number of sent runs and the number of runs
+
+        Returns:
+            list: one RunDispatchResult per payload
+        """
+        station = self.get_experimental_station()
+        results = dispatch_runs(
+            station.get_client(),
+            payloads,
+            max_workers=current_app.config["STATION_DISPATCH_WORKERS"],
+            progress=progress,
+        )
+        ExperimentalRuns.set_status_by_ids(
+            [result.run_id for result in results if result.sent], 1
+        )
+        return results
+
+    def sent_stages_to_station(self, stages, progress=None):
+        """Sends all runs of several stages of the design to the station at once.
+
+        Args:
+            stages (list): stages of the design
+            progress (callable, optional): called with the number of sent runs and the number of runs
+
+        Returns:
+            list: one RunDispatchResult per run
+        """
+        payloads = [
+            payload
+            for stage in stages
+            for payload in stage.get_run_payloads(stage.get_run_ids_in_stage())
+        ]
+        return self.sent_run_payloads_to_station(payloads, progress)
+
     @classmethod
     def get_experimental_designs(cls):
         return cls.query.all()
@@ -417,7 +735,7 @@ class Stage(db.Model, ModelMixin):
     )
     status = db.Column(db.Integer, default=0)
     experimental_design_id = db.Column(
-        db.Integer, db.ForeignKey("experimental_design.id"), nullable=False
+        db.Integer, db.ForeignKey("experimental_design.id"), nullable=False, index=True
     )
 
     @classmethod
@@ -502,271 +820,513 @@ class Stage(db.Model, ModelMixin):
     def get_run_ids_in_stage(self):
         return [run.id for run in self.experimental_runs]
 
-    def sent_all_runs_to_station(self):
-        run_data_to_send = self.sent_runs_to_station_by_ids(self.get_run_ids_in_stage())
-
-    def add_or_update_run(self, run_data, parameter_in_routine):
-        if run_data.run_id == "" or pd.isna(run_data.run_id):
-            new_run = ExperimentalRuns.add_new_run(stage_id=self.id)
-            for parameter_name, value in run_data.items():
-                if parameter_name == "run_id":
-                    pass
-                else:
-                    parameter = [
-                        parameter
-                        for parameter in parameter_in_routine
-                        if parameter.name == parameter_name
-                    ][0]
-
-                    new_value = Values.add_value(
-                        value=value,
-                        parameter_id=parameter.id,
-                        experimental_run_id=new_run.id,
-                    )
-                    new_run.add_values_to_run(new_value)
+    def sent_all_runs_to_station(self, progress=None):
+        return self.sent_runs_to_station_by_ids(self.get_run_ids_in_stage(), progress)
 
-        else:
-            run_to_update = ExperimentalRuns.get_run_by_id(int(run_data.run_id))
-            for parameter_name, value in run_data.items():
-                if parameter_name == "run_id":
-                    pass
-                else:
-                    parameter = [
-                        parameter
-                        for parameter in parameter_in_routine
-                        if parameter.name == parameter_name
-                    ][0]
-                    value_to_update = Values.get_value_by_run_id_and_parameter_id(
-                        run_to_update.id, parameter.id
-                    )
-                    value_to_update.update_value(value)
-
-    def add_or_update_runs_from_excel_upload(self, excel_file, dynamic_only):
-        """accepts an excel file and adds the data to the stage
+    def add_or_update_runs_from_dataframe(self, df, dynamic_only):
+        """Adds the rows of a dataframe as runs to the stage, rows with a run_id update the values of the existing run.
+        The dataframe is validated as a whole and all runs and values are written in one transaction, nothing is written if any row is invalid.
 
         Args:
-            excel_file (_type_): _description_
+            df (pandas.DataFrame): one column per parameter name and an optional run_id column
             dynamic_only (bool): switch to toggel between dynamic only and all parameters
 
+        Raises:
+            ValueError: if the dataframe does not match the parameters of the routine
+
         Returns:
-            _type_: _description_
+            tuple: number of added runs, number of updated runs
         """
+        # if no run_id column is present, add it with empty values
+        if not "run_id" in df.columns:
+            df = df.assign(run_id="")
 
-        try:
-            # read the excel file into a dataframe
-            df = pd.read_excel(excel_file)
+        ### get the parameters in the routine
+        if dynamic_only:
+            parameters_in_routine = (
+                ExperimentalRoutines.get_dynamic_parameters_in_routine_by_id(
+                    self.experimental_Routine_id
+                )
+            )
+        else:
+            parameters_in_routine = (
+                ExperimentalRoutines.get_parameters_in_routine_by_id(
+                    self.experimental_Routine_id
+                )
+            )
+        parameters_by_name = {
+            parameter.name: parameter for parameter in parameters_in_routine
+        }
+        parameter_columns = [column for column in df.columns if column != "run_id"]
 
-            # if no run_id column is present, add it with empty values
-            if not "run_id" in df.columns:
-                df["run_id"] = ""
+        # check if the dataframe contails empty values (exept for run_id column)
+        parameters_with_missing_values = df[parameter_columns].isna().any()
+        if parameters_with_missing_values.any():
+            raise ValueError(
+                f"The parameters {', '.join(map(str, parameters_with_missing_values[parameters_with_missing_values].index))} contain empty values. Please check the dataset and try again."
+            )
 
-            # check if the dataframe contails empty values (exept for run_id column)
-            parameters_with_missing_values = (
-                df.loc[:, df.columns != "run_id"].isna().any()
+        # check if all parameters in the dataframe are present in the routine
+        if not all(column in parameters_by_name for column in parameter_columns):
+            raise ValueError(
+                "The dataset contains parameters that are not present in the routine. Please check the dataset and try again."
             )
-            for parameter, missing in parameters_with_missing_values.iteritems():
-                # this gets only the first occuring error #TODO: add all errors
-                if missing:
-                    flash(
-                        f"The parameter {parameter} contains empty values. Please check the dataset and try again.",
-                        "danger",
-                    )
-                    raise Exception(f"The parameter {parameter} contains empty values.")
-
-            ### check if all parameters in the dataframe are present in the routine
-            ### get the parameter names in the routine
-            if dynamic_only:
-                parameter_names_in_routine = (
-                    ExperimentalRoutines.get_dynamic_parameter_names_in_routine_by_id(
-                        self.experimental_Routine_id
-                    )
+
+        # check if the number of parameters in the dataframe matches the number of parameters in the routine
+        if len(parameter_columns) != len(parameters_by_name):
+            raise ValueError(
+                "The number of parameters in the dataset does not match the number of parameters in the routine. Please check the dataset and try again."
+            )
+
+        # rows without run_id are new runs, all others must be runs of this stage
+        is_new_run = df["run_id"].isna() | (df["run_id"].astype(str).str.strip() == "")
+        run_ids = pd.to_numeric(df.loc[~is_new_run, "run_id"], errors="coerce")
+        if run_ids.isna().any() or (run_ids % 1 != 0).any():
+            raise ValueError("The run_id column contains invalid run ids.")
+        run_ids = run_ids.astype(int).tolist()
+        run_ids_in_stage = set(
+            db.session.scalars(
+                db.select(ExperimentalRuns.id).where(
+                    ExperimentalRuns.stage_id == self.id
                 )
-                parameters_in_routine = (
-                    ExperimentalRoutines.get_dynamic_parameters_in_routine_by_id(
-                        self.experimental_Routine_id
-                    )
+            )
+        )
+        unknown_run_ids = set(run_ids) - run_ids_in_stage
+        if unknown_run_ids:
+            raise ValueError(
+                f"The runs {', '.join(map(str, sorted(unknown_run_ids)))} are not part of the stage {self.name}."
+            )
+
+        parameter_ids = [parameters_by_name[name].id for name in parameter_columns]
+        data_types = [parameters_by_name[name].data_type for name in parameter_columns]
+        values_as_str = df[parameter_columns].astype(str)
+
+        try:
+            new_runs = [
+                ExperimentalRuns(stage_id=self.id) for _ in range(int(is_new_run.sum()))
+            ]
+            db.session.add_all(new_runs)
+            # assigns the ids of the new runs
+            db.session.flush()
+
+            value_rows = [
+                {
+                    "parameter_id": parameter_id,
+                    "value_as_str": value,
+                    "value_as_float": get_value_as_float(data_type, value),
+                    "experimental_runs_id": run.id,
+                }
+                for run, row in zip(
+                    new_runs,
+                    values_as_str[is_new_run].itertuples(index=False, name=None),
                 )
-            else:
-                parameter_names_in_routine = (
-                    ExperimentalRoutines.get_parameter_names_in_routine_by_id(
-                        self.experimental_Routine_id
-                    )
+                for parameter_id, data_type, value in zip(
+                    parameter_ids, data_types, row
                 )
-                parameters_in_routine = (
-                    ExperimentalRoutines.get_parameters_in_routine_by_id(
-                        self.experimental_Routine_id
+            ]
+
+            # map (run id, parameter id) to the value ids of the stage once
+            value_ids = {
+                (run_id, parameter_id): value_id
+                for value_id, run_id, parameter_id in db.session.execute(
+                    db.select(
+                        Values.id, Values.experimental_runs_id, Values.parameter_id
                     )
+                    .join(ExperimentalRuns)
+                    .where(ExperimentalRuns.stage_id == self.id)
                 )
-            # add the run_id column to the list of parameter names
-            parameter_names_in_routine.insert(0, "run_id")
-
-            # check if all parameters in the dataframe are present in the routine
-            if not all(
-                item in parameter_names_in_routine for item in df.columns.tolist()
+            }
+            updated_value_rows = []
+            for run_id, row in zip(
+                run_ids, values_as_str[~is_new_run].itertuples(index=False, name=None)
             ):
-                flash(
-                    "The dataset contains parameters that are not present in the routine. Please check the dataset and try again.",
-                    "danger",
-                )
-                raise Exception(
-                    "The dataset contains parameters that are not present in the routine."
-                )
+                for parameter_id, data_type, value in zip(
+                    parameter_ids, data_types, row
+                ):
+                    value_id = value_ids.get((run_id, parameter_id))
+                    value_as_float = get_value_as_float(data_type, value)
+                    if value_id is None:
+                        value_rows.append(
+                            {
+                                "parameter_id": parameter_id,
+                                "value_as_str": value,
+                                "value_as_float": value_as_float,
+                                "experimental_runs_id": run_id,
+                            }
+                        )
+                    else:
+                        updated_value_rows.append(
+                            {
+                                "id": value_id,
+                                "value_as_str": value,
+                                "value_as_float": value_as_float,
+                            }
+                        )
+
+            if value_rows:
+                db.session.execute(db.insert(Values), value_rows)
+            if updated_value_rows:
+                db.session.execute(db.update(Values), updated_value_rows)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
 
-            # check if the number of parameters in the dataframe matches the number of parameters in the routine
-            if (len(df.columns)) != len(parameter_names_in_routine):
-                flash(
-                    "The number of parameters in the dataset does not match the number of parameters in the routine. Please check the dataset and try again.",
-                    "danger",
-                )
-                raise Exception(
-                    "The number of parameters in the dataset does not match the number of parameters in the routine."
-                )
+        return len(new_runs), len(set(run_ids))
+
+    def get_download_filename(self, dynamic_only, extension):
+        # alter the filename to inform about the dynamic_only parameter
+        if dynamic_only:
+            return f"{self.get_sanitized_name()}_dynamic_parameters.{extension}"
+        return f"{self.get_sanitized_name()}_all_parameters.{extension}"
+
+    def write_run_table_file(self, path, dynamic_only, file_format):
+        """Writes the runs of the stage to a file, used by the export job.
+
+        Args:
+            path (str): path of the new file
+            dynamic_only (bool): switch to toggel between dynamic only and all parameters
+            file_format (str): xlsx, csv or parquet
+        """
+        df = self.get_run_table(dynamic_only)
+        if file_format == "csv":
+            df.to_csv(path, index=False)
+        elif file_format == "parquet":
+            df.to_parquet(path, index=False)
+        else:
+            df.to_excel(path, index=False)
+
+    def get_csv_stream_for_stage_dl(self, dynamic_only, chunk_size=65536):
+        """Returns the runs of the stage as CSV download. The rows are streamed from a server side cursor,
+        so the file is never held in memory as a whole and the download starts immediately.
+
+        Args:
+            dynamic_only (bool): switch to toggel between dynamic only and all parameters
+            chunk_size (int): number of characters sent at once
+
+        Returns:
+            Response: streamed CSV file with one row per run
+        """
+        layout = ExperimentalRoutines.get_layout_by_id(self.experimental_Routine_id)
+        positions = layout.get_columns(dynamic_only)
+        column_by_parameter_id = {
+            layout.parameter_ids[position]: column
+            for column, position in enumerate(positions)
+        }
+        static_values = {
+            column: layout.static_defaults[position]
+            for column, position in enumerate(positions)
+            if position in layout.static_defaults
+        }
+        data_types = [layout.data_types[position] for position in positions]
+        statement = (
+            db.select(ExperimentalRuns.id, Values.parameter_id, Values.value_as_str)
+            .outerjoin(Values, Values.experimental_runs_id == ExperimentalRuns.id)
+            .where(ExperimentalRuns.stage_id == self.id)
+            .order_by(ExperimentalRuns.id)
+            .execution_options(yield_per=1000)
+        )
+
+        def generate_rows():
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(
+                ["run_id"] + [layout.names[position] for position in positions]
+            )
+            rows = db.session.execute(statement)
+            for run_id, run_values in itertools.groupby(rows, key=lambda row: row[0]):
+                row = [""] * len(positions)
+                for column, value in static_values.items():
+                    row[column] = value
+                for _, parameter_id, value_as_str in run_values:
+                    column = column_by_parameter_id.get(parameter_id)
+                    if column is not None and column not in static_values:
+                        row[column] = cast_value_by_dtype_name(
+                            data_types[column], value_as_str
+                        )
+                writer.writerow([run_id] + row)
+                if buffer.tell() >= chunk_size:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate(0)
+            yield buffer.getvalue()
+
+        filename = self.get_download_filename(dynamic_only, "csv")
+        headers = {"Content-Disposition": f"attachment; filename={filename}"}
+        return Response(
+            stream_with_context(generate_rows()), mimetype="text/csv", headers=headers
+        )
+
+    def get_run_ids_by_parameter_range(self, parameter_id, minimum=None, maximum=None):
+        """Filters the runs of the stage by the value of a numeric parameter in SQL.
+
+        Args:
+            parameter_id (int): Database ID of a numeric parameter
+            minimum (float, optional): smallest value included
+            maximum (float, optional): largest value included
+
+        Returns:
+            list: Database IDs of the matching runs, sorted by the value of the parameter
+        """
+        statement = (
+            db.select(ExperimentalRuns.id)
+            .join(Values, Values.experimental_runs_id == ExperimentalRuns.id)
+            .where(
+                ExperimentalRuns.stage_id == self.id,
+                Values.parameter_id == parameter_id,
+                Values.value_as_float.is_not(None),
+            )
+            .order_by(Values.value_as_float, ExperimentalRuns.id)
+        )
+        if minimum is not None:
+            statement = statement.where(Values.value_as_float >= minimum)
+        if maximum is not None:
+            statement = statement.where(Values.value_as_float <= maximum)
+        return list(db.session.scalars(statement))
+
+    def get_parameter_statistics(self, parameter_id):
+        """Aggregates the values of a numeric parameter over the runs of the stage in SQL.
+
+        Args:
+            parameter_id (int): Database ID of a numeric parameter
 
-            df.apply(
-                self.add_or_update_run,
-                parameter_in_routine=parameters_in_routine,
-                axis=1,
+        Returns:
+            dict: count, min, max and mean of the values
+        """
+        count, minimum, maximum, mean = db.session.execute(
+            db.select(
+                db.func.count(Values.value_as_float),
+                db.func.min(Values.value_as_float),
+                db.func.max(Values.value_as_float),
+                db.func.avg(Values.value_as_float),
             )
+            .join(ExperimentalRuns, Values.experimental_runs_id == ExperimentalRuns.id)
+            .where(
+                ExperimentalRuns.stage_id == self.id,
+                Values.parameter_id == parameter_id,
+            )
+        ).one()
+        return {"count": count, "min": minimum, "max": maximum, "mean": mean}
+
+    def get_run_grid(self):
+        """Loads the runs of the stage with their values from one joined query, used to render the stage detail page.
 
-        except Exception as e:
-            flash(
-                f"There was an error during the call. \n Error Code: {e}",
-                "danger",
+        Returns:
+            list: one dict per run with run_id and run_values, run_values holds one cell per parameter in the order of the routine.
+            A cell is a dict with value_id and value, or None if the run has no value for the parameter.
+        """
+        layout = ExperimentalRoutines.get_layout_by_id(self.experimental_Routine_id)
+        rows = db.session.execute(
+            db.select(
+                ExperimentalRuns.id, Values.id, Values.parameter_id, Values.value_as_str
             )
-            return redirect(url_for("experiments.edit_stage", stage_id=self.id))
+            .outerjoin(Values, Values.experimental_runs_id == ExperimentalRuns.id)
+            .where(ExperimentalRuns.stage_id == self.id)
+            .order_by(ExperimentalRuns.id)
+        )
 
-    def get_excel_file_for_stage_dl(self, dynamic_only):
-        """_summary_
+        table_rows = []
+        for run_id, run_values in itertools.groupby(rows, key=lambda row: row[0]):
+            cells = [None] * len(layout)
+            for _, value_id, parameter_id, value_as_str in run_values:
+                column = layout.positions_by_id.get(parameter_id)
+                if column is None:
+                    continue
+                cells[column] = {
+                    "value_id": value_id,
+                    "value": cast_value_by_dtype_name(
+                        layout.data_types[column], value_as_str
+                    ),
+                }
+            table_rows.append({"run_id": run_id, "run_values": cells})
+        return table_rows
+
+    def get_run_table(self, dynamic_only):
+        """Builds the run<->parameter table of the stage from one joined query of runs and values.
+        Static parameters are filled with their default value.
 
         Args:
             dynamic_only (bool): switch to toggel between dynamic only and all parameters
 
         Returns:
-            _type_: _description_
+            pandas.DataFrame: one row per run, the column run_id followed by the parameters in the order of the routine
         """
-        ## if no runs present in stage, return a blank table with the correct headers
-        if len(self.get_runs_in_stage()) == 0:
-            if dynamic_only:
-                parameter_list = (
-                    ExperimentalRoutines.get_dynamic_parameter_names_in_routine_by_id(
-                        self.experimental_Routine_id
-                    )
-                )
+        layout = ExperimentalRoutines.get_layout_by_id(self.experimental_Routine_id)
+        positions = layout.get_columns(dynamic_only)
+        parameter_ids = [layout.parameter_ids[position] for position in positions]
+
+        rows = db.session.execute(
+            db.select(ExperimentalRuns.id, Values.parameter_id, Values.value_as_str)
+            .outerjoin(Values, Values.experimental_runs_id == ExperimentalRuns.id)
+            .where(ExperimentalRuns.stage_id == self.id)
+            .order_by(ExperimentalRuns.id)
+        ).all()
+        values = pd.DataFrame(rows, columns=["run_id", "parameter_id", "value_as_str"])
+        run_ids = values["run_id"].unique()
+
+        # pivot into one column per parameter id, runs without values keep empty cells
+        table = (
+            values.dropna(subset=["parameter_id"])
+            .drop_duplicates(subset=["run_id", "parameter_id"])
+            .pivot(index="run_id", columns="parameter_id", values="value_as_str")
+            .reindex(index=run_ids, columns=parameter_ids)
+        )
+
+        for position, parameter_id in zip(positions, parameter_ids):
+            if position in layout.static_defaults:
+                table[parameter_id] = layout.static_defaults[position]
             else:
-                parameter_list = (
-                    ExperimentalRoutines.get_parameter_names_in_routine_by_id(
-                        self.experimental_Routine_id
-                    )
+                table[parameter_id] = cast_column_by_dtype_name(
+                    table[parameter_id], layout.data_types[position]
                 )
-            # add the run_id column to the list of parameters
-            parameter_list.insert(0, "run_id")
-            parameter_value_pairs_in_stage = [
-                [(parameter, "")] for parameter in parameter_list
-            ]
-        # if runs present in stage, get the parameter value pairs for each run
-        else:
-            if dynamic_only:
-                # nested list comprehension to get the parameter value pairs for each run in the stage,
-                parameter_value_pairs_in_stage = [
-                    [("run_id", run.id)]
-                    + [
-                        value
-                        for value in run.get_parameter_value_pairs_in_run_dynamic_only()
-                    ]
-                    for run in self.get_runs_in_stage()
-                ]
-            else:
-                parameter_value_pairs_in_stage = [
-                    [("run_id", run.id)]
-                    + [value for value in run.get_parameter_value_pairs_in_run()]
-                    for run in self.get_runs_in_stage()
-                ]
 
-        data_list = []
-        for lst in parameter_value_pairs_in_stage:
-            run_dict = {}
-            for tup in lst:
-                run_dict[tup[0]] = tup[1]
-            data_list.append(run_dict)
+        table.columns = [layout.names[position] for position in positions]
+        table.index.name = "run_id"
+        return table.reset_index()
 
-        # Create the dataframe
-        df = pd.DataFrame(data_list)
+    def get_dataframe_with_runs_in_stage(self, dynamic_only=False, columns=None):
+        """Returns the runs of the stage as wide dataframe for analysis, built from one joined query, see get_run_table.
 
-        ## define a buffer to store dataframe excel output in
-        buffer = io.BytesIO()
-        df.to_excel(buffer, index=False)
+        Args:
+            dynamic_only (bool): switch to toggel between dynamic only and all parameters
+            columns (list, optional): names of the parameters to include, by default all
 
-        # alter the filename to inform about the dynamic_only parameter
+        Returns:
+            pandas.DataFrame: indexed by run_id, one column per parameter in the order of the routine with the dtype of its data type
+        """
+        df = self.get_run_table(dynamic_only).set_index("run_id")
+        if columns is not None:
+            df = df[list(columns)]
+        layout = ExperimentalRoutines.get_layout_by_id(self.experimental_Routine_id)
+        dtypes = {
+            name: DATAFRAME_DTYPES[data_type]
+            for name, data_type in zip(layout.names, layout.data_types)
+            if name in df.columns and data_type in DATAFRAME_DTYPES
+        }
+        return df.astype(dtypes)
 
-        if dynamic_only:
-            filename = f"{self.get_sanitized_name()}_dynamic_parameters.xlsx"
-        else:
-            filename = f"{self.get_sanitized_name()}_all_parameters.xlsx"
+    def get_run_telemetry(
+        self, first_run_id=None, last_run_id=None, device=None, observable=None
+    ):
+        """Returns the samples the telemetry collector recorded while runs of the stage were executed.
 
-        ## prepare headers for the download file to return to the browser
-        headers = {
-            "Content-Disposition": f"attachment; filename={filename}",
-            "Content-type": "application/vnd.ms-excel",
-        }
-        ## return buffer and header informations
-        return Response(
-            buffer.getvalue(), mimetype="application/vnd.ms-excel", headers=headers
+        Args:
+            first_run_id (int, optional): smallest run ID to include
+            last_run_id (int, optional): largest run ID to include
+            device (str, optional): only samples of this device
+            observable (str, optional): only samples of this observable
+
+        Returns:
+            list: (run_id, device, observable, timestamp, value) tuples ordered by run and timestamp, see TelemetrySample.get_run_samples
+        """
+        ### subquery of the run IDs, a list would bind one parameter per run
+        statement = db.select(ExperimentalRuns.id).where(
+            ExperimentalRuns.stage_id == self.id
         )
+        if first_run_id is not None:
+            statement = statement.where(ExperimentalRuns.id >= first_run_id)
+        if last_run_id is not None:
+            statement = statement.where(ExperimentalRuns.id <= last_run_id)
+        return TelemetrySample.get_run_samples(statement, device, observable)
+
+    def get_dataframe_with_run_telemetry(
+        self,
+        first_run_id=None,
+        last_run_id=None,
+        device=None,
+        observable=None,
+        with_parameters=False,
+    ):
+        """Returns the telemetry of runs of the stage as wide dataframe, see get_run_telemetry.
 
-    def get_dataframe_with_runs_in_stage(self):
-        runs = self.get_runs_in_stage()
-        df = pd.DataFrame()
-        for run in runs:
-            df = df.append(run.get_parameter_value_pairs_in_run(), ignore_index=True)
+        Args:
+            first_run_id (int, optional): smallest run ID to include
+            last_run_id (int, optional): largest run ID to include
+            device (str, optional): only samples of this device
+            observable (str, optional): only samples of this observable
+            with_parameters (bool): adds the parameters of the runs, see get_dataframe_with_runs_in_stage
+
+        Returns:
+            pandas.DataFrame: indexed by run_id and timestamp, one column "device.observable" per recorded observable
+        """
+        samples = pd.DataFrame(
+            self.get_run_telemetry(first_run_id, last_run_id, device, observable),
+            columns=["run_id", "device", "observable", "timestamp", "value"],
+        )
+        samples["channel"] = samples["device"] + "." + samples["observable"]
+        df = samples.pivot_table(
+            index=["run_id", "timestamp"],
+            columns="channel",
+            values="value",
+            aggfunc="first",
+        )
+        # the values are pivoted as objects, numeric observables get float columns again
+        df = df.infer_objects()
+        df.columns.name = None
+        if with_parameters:
+            df = df.join(self.get_dataframe_with_runs_in_stage(), on="run_id")
         return df
 
-    def sent_runs_to_station_by_ids(self, runs_ids):
-        for run_id in runs_ids:
-            run = ExperimentalRuns.get_run_by_id(run_id)
-            design = ExperimentalDesign.get_experimental_design_by_id(
-                self.experimental_design_id
-            )
-            station = ExperimentalStation.get_station_by_id(design.station_id)
+    def get_run_payloads(self, runs_ids):
+        """Builds the add_experiment form data of runs in the stage from one joined query of runs and values.
 
-            ## build run id from design name - stage name - run id
-            run_id = f"{design.name}-{self.get_sanitized_name()}-{run.id}"
+        Args:
+            runs_ids (list): Database IDs of runs in the stage, runs of other stages are skipped
 
-            experiment_meta_data = {
-                "experiment_id": run_id,
-                "experiment_type": ExperimentalRoutines.get_routine_name_by_id(
-                    self.experimental_Routine_id
+        Returns:
+            list: (run id, payload) tuples in the order of runs_ids
+        """
+        design = self.get_design()
+        experiment_type = ExperimentalRoutines.get_routine_name_by_id(
+            self.experimental_Routine_id
+        )
+        layout = ExperimentalRoutines.get_layout_by_id(self.experimental_Routine_id)
+
+        rows = db.session.execute(
+            db.select(ExperimentalRuns.id, Values.parameter_id, Values.value_as_str)
+            .outerjoin(Values, Values.experimental_runs_id == ExperimentalRuns.id)
+            .where(ExperimentalRuns.stage_id == self.id)
+        ).all()
+        values_by_run = {}
+        for run_id, parameter_id, value_as_str in rows:
+            run_values = values_by_run.setdefault(run_id, [])
+            position = layout.positions_by_id.get(parameter_id)
+            if position is not None:
+                run_values.append((position, value_as_str))
+
+        payloads = []
+        for run_id in runs_ids:
+            if run_id not in values_by_run:
+                continue
+            payload = {
+                "experiment_id": get_experiment_id(
+                    design.name, self.get_sanitized_name(), run_id
                 ),
+                "experiment_type": experiment_type,
             }
+            # sort the values by the order of parameters in the routine
+            for position, value_as_str in sorted(values_by_run[run_id]):
+                payload[layout.names[position]] = layout.get_cell(
+                    position, value_as_str
+                )
+            payloads.append((run_id, payload))
+        return payloads
 
-            experiment_data = dict(run.get_parameter_value_pairs_in_run())
-
-            joined_data = experiment_meta_data | experiment_data
-
-            try:
-                request_url = f"http://{station.address}/api/add_experiment"
-                r = requests.post(request_url, data=joined_data)
-                r.raise_for_status()
+    def sent_runs_to_station_by_ids(self, runs_ids, progress=None):
+        """Sends runs of the stage to the station of the design.
+        The runs are sent concurrently, a failing run does not stop the others. The status of all
+        accepted runs is set in one transaction afterwards.
 
-            except HTTPError as http_err:
-                flash(
-                    f"There was an error during the call.\n Error message from the station: {r.text} \n Error Code HTTP: {http_err}",
-                    "danger",
-                )
-                abort(500)
-            except requests.exceptions.RequestException as e:
-                flash(
-                    f"There was an error during the call.\n Error message from the station: {r.text} \n Error Code: {e}",
-                    "danger",
-                )
-                abort(500)
-            else:
-                flash(
-                    f"Experiment {run.id} was sent to station {station.name} successfully.",
-                    "success",
-                )
-                run.set_status(1)
+        Args:
+            runs_ids (list): Database IDs of runs in the stage
+            progress (callable, optional): called with the number of sent runs and the number of runs
 
-        return experiment_meta_data | experiment_data
+        Returns:
+            list: one RunDispatchResult per run
+        """
+        return self.get_design().sent_run_payloads_to_station(
+            self.get_run_payloads(runs_ids), progress
+        )
 
 
 class ParameterAliases(db.Model):
@@ -781,44 +1341,51 @@ class ParameterAliases(db.Model):
 
 class Values(db.Model, ModelMixin):
     __tablename__ = "values"
+    __table_args__ = (
+        db.Index(
+            "ix_values_parameter_id_value_as_float", "parameter_id", "value_as_float"
+        ),
+        ### a run has one value per parameter, also serves the lookups of the values of a run
+        db.UniqueConstraint(
+            "experimental_runs_id",
+            "parameter_id",
+            name="uq_values_experimental_runs_id_parameter_id",
+        ),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     parameter_id = db.Column(db.Integer, db.ForeignKey("parameters.id"), nullable=False)
     value_as_str = db.Column(db.String(100), unique=False, nullable=False)
+    ### numeric values are stored typed as well, so they can be filtered, sorted and aggregated in SQL
+    value_as_float = db.Column(db.Float, unique=False, nullable=True)
     experimental_runs_id = db.Column(
         db.Integer, db.ForeignKey("experimental_runs.id"), nullable=False
     )
 
     @hybrid_property
     def value(self):
-        def _cast_by_dtype_name(data_type, var):
-            trusted_types = ["int", "float", "complex", "bool", "str"]
-            if data_type in trusted_types:
-                if data_type == "int":
-                    return getattr(builtins, data_type)(float(var))
-                return getattr(builtins, data_type)(var)
-            return var
-
-        parameter = Parameters.get_parameter(self.parameter_id)
+        parameter = get_parameter_info(self.parameter_id)
 
-        return _cast_by_dtype_name(parameter.data_type, self.value_as_str)
+        return cast_value_by_dtype_name(parameter.data_type, self.value_as_str)
 
     def get_parameter_value_pair(self):
-        parameter = Parameters.get_parameter(self.parameter_id)
-        if parameter.get_if_static_param():
-            return parameter.name, parameter.get_default_value()
+        parameter = get_parameter_info(self.parameter_id)
+        if parameter.static_param:
+            return parameter.name, parameter.default_value
         else:
-            return (parameter.name, self.value)
+            return (
+                parameter.name,
+                cast_value_by_dtype_name(parameter.data_type, self.value_as_str),
+            )
 
     def get_parameter_value_dict(self):
-        parameter = Parameters.get_parameter(self.parameter_id)
-        if parameter.get_if_static_param():
-            return {parameter.name: parameter.get_default_value()}
-        else:
-            return {parameter.name: self.value}
+        return dict([self.get_parameter_value_pair()])
 
     def update_value(self, value):
         self.value_as_str = str(value)
+        self.value_as_float = get_value_as_float(
+            get_parameter_info(self.parameter_id).data_type, self.value_as_str
+        )
         self.save()
 
     @classmethod
@@ -826,11 +1393,33 @@ class Values(db.Model, ModelMixin):
         new_value = cls(
             parameter_id=parameter_id,
             value_as_str=str(value),
+            value_as_float=get_value_as_float(
+                get_parameter_info(parameter_id).data_type, str(value)
+            ),
             experimental_runs_id=experimental_run_id,
         )
         new_value.save()
         return new_value
 
+    @classmethod
+    def update_values_as_float_of_parameter(cls, parameter_id):
+        """Recalculates value_as_float of all values of a parameter, e.g. after its data type changed."""
+        data_type = get_parameter_info(parameter_id).data_type
+        rows = [
+            {
+                "id": value_id,
+                "value_as_float": get_value_as_float(data_type, value_as_str),
+            }
+            for value_id, value_as_str in db.session.execute(
+                db.select(cls.id, cls.value_as_str).where(
+                    cls.parameter_id == parameter_id
+                )
+            )
+        ]
+        if rows:
+            db.session.execute(db.update(cls), rows)
+        commit()
+
     @classmethod
     def get_value_by_run_id_and_parameter_id(cls, run_id, parameter_id):
         return cls.query.filter_by(
@@ -881,12 +1470,103 @@ class ExperimentalStation(db.Model, ModelMixin):
 
     def register_routine_in_station(self, routine):
         self.experiments_available.append(routine)
-        db.session.commit()
+        commit()
 
     def unregister_routine_in_station(self, routine):
         self.experiments_available.remove(routine)
         db.session.commit()
 
+    def get_client(self):
+        """Returns the pooled HTTP client for the API of this station."""
+        return get_station_client(self.address)
+
+    def sync_routines(self, catalog=None):
+        """Synchronises the routines of the station with its experiment types: new routines are added,
+        the parameters of changed routines are updated and routines the station does not know anymore are unregistered.
+
+        Args:
+            catalog (dict, optional): catalog of the station, requested from the station if not given
+
+        Returns:
+            RoutineSyncPlan: the applied changes
+        """
+        if catalog is None:
+            catalog = fetch_catalog(self.get_client())
+        plan = diff_catalog(catalog, self.get_all_routines())
+        self.apply_routine_sync_plan(plan)
+        return plan
+
+    def apply_routine_sync_plan(self, plan):
+        """Writes the changes of a RoutineSyncPlan in one transaction, nothing is written if a change fails."""
+
+        def new_parameter(name, spec):
+            return Parameters(
+                name=name,
+                unit=spec.unit,
+                note=None,
+                data_type=spec.data_type,
+                static_param=False,
+                default_value=0.0,
+            )
+
+        changed_data_types = []
+        with db_batch():
+            for routine_name, specs in plan.new.items():
+                routine = ExperimentalRoutines.add_routine(routine_name)
+                self.register_routine_in_station(routine)
+                routine.set_parameters(
+                    [new_parameter(name, spec) for name, spec in specs.items()]
+                )
+            for change in plan.changed:
+                routine = change.routine
+                parameters = [
+                    parameter
+                    for parameter in routine.parameters
+                    if parameter.name not in change.removed
+                ]
+                for parameter in parameters:
+                    spec = change.changed.get(parameter.name)
+                    if spec is None:
+                        continue
+                    if parameter.data_type != spec.data_type:
+                        changed_data_types.append(parameter.id)
+                    parameter.data_type = spec.data_type
+                    parameter.unit = spec.unit
+                parameters += [
+                    new_parameter(name, spec) for name, spec in change.added.items()
+                ]
+                routine.set_parameters(parameters)
+            for routine in plan.removed:
+                self.experiments_available.remove(routine)
+            for parameter_id in changed_data_types:
+                forget_parameter_info(parameter_id)
+                Values.update_values_as_float_of_parameter(parameter_id)
+
+    @classmethod
+    def sync_all_stations(cls, progress=None):
+        """Synchronises the routines of all stations, the experiment types of the stations are requested concurrently.
+
+        Args:
+            progress (callable, optional): called with the number of synchronised stations and the number of stations
+
+        Returns:
+            list: (station, RoutineSyncPlan or None, error or None) per station
+        """
+        stations = cls.get_all_stations()
+        catalogs = fetch_catalogs(
+            [station.get_client() for station in stations],
+            max_workers=current_app.config["STATION_SYNC_WORKERS"],
+        )
+        results = []
+        for done, (station, (catalog, error)) in enumerate(zip(stations, catalogs), 1):
+            plan = None
+            if error is None:
+                plan = station.sync_routines(catalog)
+            results.append((station, plan, error))
+            if progress is not None:
+                progress(done, len(stations))
+        return results
+
     def update(self, name, address, api_key, location):
         self.name = name
         self.address = address
@@ -896,28 +1576,15 @@ class ExperimentalStation(db.Model, ModelMixin):
 
     @classmethod
     def get_active_experiment_parameters(cls, station_id):
-        request_url = (
-            f"http://{cls.get_address_address(station_id)}/api/station_run_tables"
-        )
-        r = requests.get(request_url)
-        json_data_stream = json.loads(r.content.decode())
-        for run in json_data_stream:
-            if run["state"] == "Running":
-                return run["parameters"]
-        return None
+        """Returns the parameters of the running experiment, the run tables are cached for STATION_RUN_TABLES_TTL seconds."""
+        station = cls.get_station_by_id(station_id)
+        return station.get_client().run_tables.get_active_parameters()
 
     @classmethod
     def get_active_experiment_value_for_parameter(cls, station_id, parameter_name):
-        request_url = (
-            f"http://{cls.get_address_address(station_id)}/api/station_run_tables"
-        )
-        r = requests.get(request_url)
-        json_data_stream = json.loads(r.content.decode())
-        for run in json_data_stream:
-            if run["state"] == "Running":
-                for parameter in run["parameters"]:
-                    if parameter == parameter_name:
-                        return run["parameters"]
+        active_parameters = cls.get_active_experiment_parameters(station_id)
+        if active_parameters is not None and parameter_name in active_parameters:
+            return active_parameters
         return "None", 202
 
 
@@ -946,7 +1613,7 @@ class ExperimentalResults(db.Model, ModelMixin):
 
     id = db.Column(db.Integer, primary_key=True)
     experimental_runs_id = db.Column(
-        db.Integer, db.ForeignKey("experimental_runs.id"), nullable=False
+        db.Integer, db.ForeignKey("experimental_runs.id"), nullable=False, index=True
     )
     value = db.Column(db.String(60), unique=False, nullable=False)
     experimental_result_types_id = db.Column(
@@ -0,0 +1,193 @@
+"""Synchronising the routines of a station with its experiment types.
+
+The catalog of a station (``/api/get_experiment_types``) is compared in memory
+with the routines registered for the station, see :func:`diff_catalog`. The
+resulting :class:`RoutineSyncPlan` is applied by the station in one transaction.
+Catalogs of several stations are requested concurrently, the worker threads
+only get the station clients and never touch the database.
+"""
+import collections
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+ParameterSpec = collections.namedtuple("ParameterSpec", ["data_type", "unit"])
+
+
+def parse_catalog(data):
+    """Converts the response of get_experiment_types into a catalog.
+
+    Args:
+        data (dict): routine name -> {"parameters": {parameter name: [data type, unit]} or None}
+
+    Raises:
+        ValueError: if the response is no catalog, e.g. an error message of the station.
+            An empty catalog would unregister every routine of the station.
+
+    Returns:
+        dict: routine name -> {parameter name: ParameterSpec}, in the order of the station
+    """
+    if type(data) != dict:
+        raise ValueError("The station did not answer with its experiment types.")
+    catalog = {}
+    for routine_name, routine_data in data.items():
+        if routine_data is not None and type(routine_data) != dict:
+            raise ValueError(f"Invalid experiment type {routine_name} of the station.")
+        parameters = (routine_data or {}).get("parameters") or {}
+        if type(parameters) != dict:
+            raise ValueError(
+                f"Invalid parameters of the experiment type {routine_name}."
+            )
+        catalog[routine_name] = {
+            name: ParameterSpec(param[0], param[1])
+            for name, param in parameters.items()
+        }
+    return catalog
+
+
+def fetch_catalog(client):
+    """Requests the experiment types of a station.
+
+    Args:
+        client (StationClient): client for the API of the station
+
+    Raises:
+        ValueError: if the response is no catalog, see parse_catalog
+
+    Returns:
+        dict: catalog of the station, see parse_catalog
+    """
+    response = client.get("get_experiment_types")
+    response.raise_for_status()
+    return parse_catalog(json.loads(response.text))
+
+
+def fetch_catalogs(clients, max_workers=8):
+    """Requests the experiment types of several stations at the same time.
+
+    Args:
+        clients (list): StationClient per station
+        max_workers (int): maximum number of stations requested at the same time
+
+    Returns:
+        list: (catalog, error) per client in the order of the clients, error is None or the message of the failed request
+    """
+
+    def fetch(client):
+        try:
+            return fetch_catalog(client), None
+        except (requests.exceptions.RequestException, ValueError) as e:
+            return None, str(e)
+
+    if not clients:
+        return []
+    with ThreadPoolExecutor(
+        max_workers=max(1, min(max_workers, len(clients))),
+        thread_name_prefix="routine-sync",
+    ) as executor:
+        return list(executor.map(fetch, clients))
+
+
+class RoutineChange(object):
+    """Differences between a registered routine and its entry in the catalog of the station.
+
+    Args:
+        routine (ExperimentalRoutines): the registered routine
+        added (dict): parameter name -> ParameterSpec of new parameters
+        removed (list): names of parameters the station does not know anymore
+        changed (dict): parameter name -> ParameterSpec of parameters with a new data type or unit
+    """
+
+    def __init__(self, routine, added, removed, changed):
+        self.routine = routine
+        self.added = added
+        self.removed = removed
+        self.changed = changed
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed)
+
+
+class RoutineSyncPlan(object):
+    """Changes needed to bring the routines of a station in line with its catalog.
+
+    Args:
+        new (dict): routine name -> {parameter name: ParameterSpec} of routines to add
+        changed (list): RoutineChange per routine with a different parameter set
+        removed (list): registered routines that are not in the catalog anymore
+        unchanged (list): names of routines that are up to date
+    """
+
+    def __init__(self, new, changed, removed, unchanged):
+        self.new = new
+        self.changed = changed
+        self.removed = removed
+        self.unchanged = unchanged
+
+    def __bool__(self):
+        return bool(self.new or self.changed or self.removed)
+
+    def get_summary(self):
+        """Returns the names of the added, changed, removed and unchanged routines."""
+        return {
+            "added": list(self.new),
+            "changed": [change.routine.name for change in self.changed],
+            "removed": [routine.name for routine in self.removed],
+            "unchanged": list(self.unchanged),
+        }
+
+    def get_message(self):
+        return (
+            f"{len(self.new)} routines were added, {len(self.changed)} changed and "
+            f"{len(self.removed)} removed, {len(self.unchanged)} are up to date."
+        )
+
+
+def diff_catalog(catalog, routines):
+    """Compares the catalog of a station with the routines registered for the station.
+
+    Args:
+        catalog (dict): catalog of the station, see parse_catalog
+        routines (list): ExperimentalRoutines registered for the station
+
+    Returns:
+        RoutineSyncPlan: the changes, nothing is written
+    """
+    routines_by_name = {routine.name: routine for routine in routines}
+    new = {}
+    changed = []
+    unchanged = []
+    for routine_name, specs in catalog.items():
+        routine = routines_by_name.get(routine_name)
+        if routine is None:
+            new[routine_name] = specs
+            continue
+        parameters_by_name = {
+            parameter.name: parameter for parameter in routine.parameters
+        }
+        change = RoutineChange(
+            routine,
+            added={
+                name: spec
+                for name, spec in specs.items()
+                if name not in parameters_by_name
+            },
+            removed=[name for name in parameters_by_name if name not in specs],
+            changed={
+                name: spec
+                for name, spec in specs.items()
+                if name in parameters_by_name
+                and (
+                    parameters_by_name[name].data_type != spec.data_type
+                    or parameters_by_name[name].unit != spec.unit
+                )
+            },
+        )
+        if change:
+            changed.append(change)
+        else:
+            unchanged.append(routine_name)
+    removed = [routine for routine in routines if routine.name not in catalog]
+    return RoutineSyncPlan(new, changed, removed, unchanged)
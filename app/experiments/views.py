@@ -1,5 +1,8 @@
+import os
+import uuid
 from flask import (
     Blueprint,
+    current_app,
     render_template,
     url_for,
     redirect,
@@ -14,6 +17,7 @@ from .helper import get_if_xlsx_file
 # from datetime import datetime
 from flask import jsonify
 from .. import db
+from ..utils import db_batch
 import json
 from .forms import (
     NewStationForm,
@@ -36,6 +40,14 @@ from sqlalchemy import (
 from sqlalchemy.orm import sessionmaker
 from app.auth.models import Group, User
 from .helper import roles_required
+from .jobs import (
+    export_stage_job,
+    import_stage_job,
+    send_stages_job,
+    sync_all_stations_job,
+    sync_routines_job,
+)
+from ..jobs.runner import enqueue_job
 
 
 experiments_blueprint = Blueprint("experiments", __name__)
@@ -146,37 +158,30 @@ def delete_station(station_id):
 @roles_required("admin")
 def get_available_experiments_for_station(station_id):
     station_to_configure = ExperimentalStation.get_station_by_id(station_id)
-    routines_already_available = (
-        ExperimentalStation.get_all_routine_names_by_station_id(station_id)
+
+    job = enqueue_job(
+        f"Routine synchronisation with station {station_to_configure.name}",
+        sync_routines_job,
+        station_to_configure.id,
+        user_id=current_user.id,
+        return_url=url_for("experiments.routines_administration"),
     )
 
-    request_url = f"http://{station_to_configure.address_name}/api/get_experiment_types"
-
-    response = requests.get(request_url)
-
-    data = json.loads(response.text)
-
-    if type(data) == dict:
-        for new_routine_name, routine_data in data.items():
-            if new_routine_name not in routines_already_available:
-                new_routine = ExperimentalRoutines.add_routine(new_routine_name)
-                station_to_configure.register_routine_in_station(new_routine)
-                if routine_data["parameters"] is not None:
-                    for name, param in routine_data["parameters"].items():
-                        new_param = Parameters(
-                            name=name,
-                            unit=param[1],
-                            note=None,
-                            data_type=param[0],
-                            static_param=False,
-                            default_value=0.0,
-                        )
-                        new_param.save()
-                        new_routine.add_parameter(new_param)
-            else:
-                flash(f"Routine {new_routine_name} already exists.", "warning")
+    return redirect(url_for("jobs.job_detail", job_id=job.id))
 
-    return redirect(url_for("experiments.routines_administration"))
+
+@experiments_blueprint.route("/sync_all_stations", methods=["GET", "POST"])
+@login_required
+@roles_required("admin")
+def sync_all_stations():
+    job = enqueue_job(
+        "Routine synchronisation with all stations",
+        sync_all_stations_job,
+        user_id=current_user.id,
+        return_url=url_for("experiments.routines_administration"),
+    )
+
+    return redirect(url_for("jobs.job_detail", job_id=job.id))
 
 
 @experiments_blueprint.route("/new_experimental_design", methods=["GET", "POST"])
@@ -230,20 +235,15 @@ def list_design():
 @login_required
 def add_experimental_run(stage_id):
     try:
-        new_run = ExperimentalRuns(stage_id=stage_id)
-        new_run.save()
-        for sent_value in request.form.items():
-            value = sent_value[1].replace(",", ".")
-            new_value = Values(
-                parameter_id=sent_value[0],
-                value_as_str=value,
-                experimental_runs_id=new_run.id,
-            )
-            new_value.save()
+        ### the run and its values are written in one transaction, nothing is written if a value is invalid
+        with db_batch():
+            new_run = ExperimentalRuns(stage_id=stage_id)
+            new_run.save()
+            for sent_value in request.form.items():
+                value = sent_value[1].replace(",", ".")
+                Values.add_value(int(sent_value[0]), value, new_run.id)
     except ValueError:
         flash("At least one value coult not be converted to float.", "warning")
-        new_run.delete()
-        redirect(url_for("experiments.edit_stage", stage_id=stage_id))
 
     return redirect(url_for("experiments.edit_stage", stage_id=stage_id))
 
@@ -307,17 +307,8 @@ def edit_stage(stage_id):
     session["stage_id"] = stage_id
     ## grab list of parameters
     parameters = routine.get_parameters_in_routine()
-    ## 2. Grab experimental runs, if any
-    runs = stage.experimental_runs
-    ## 3. Grab all values for run and all parameters for values
-    table_rows = []
-    for run in runs:
-        run_vals = []
-        for value in run.run_values:
-            val = {"value_id": value.id, "value": value.value}
-            run_vals.append(val)
-        run_value_dict = {"run_id": run.id, "run_values": run_vals}
-        table_rows.append(run_value_dict)
+    ## grab the experimental runs with their values, one cell per parameter
+    table_rows = stage.get_run_grid()
 
     return render_template(
         "experiments/stage_detail.html",
@@ -386,13 +377,13 @@ def list_experimental_designs():
 @experiments_blueprint.route("/dl_design/<int:stage_id>", methods=["POST"])
 @login_required
 def design_data_download(stage_id):
-    """This function grabs all runs for a given stage_id and builds a row<->run wise dataframe, which gets converted to an excel spreadsheet. The spreadsheat is returnd as a file download.
+    """This function grabs all runs for a given stage_id and builds a row<->run wise table, which gets converted to an excel spreadsheet, a csv or a parquet file. The file is returnd as a download.
 
     Args:
         stage_id (int): Database ID for the stage
 
     Returns:
-        type: Response: Returns a Excel Sheet for with header information that is downloaded by the users browser.
+        type: Response: Returns a file with header information that is downloaded by the users browser.
     """
 
     if request.form["select_dl_mode"] == "dynamic_only":
@@ -400,7 +391,24 @@ def design_data_download(stage_id):
     elif request.form["select_dl_mode"] == "full":
         dynamic_only = False
 
-    return Stage.get_stage_by_id(stage_id).get_excel_file_for_stage_dl(dynamic_only)
+    stage = Stage.get_stage_by_id(stage_id)
+    ## xlsx is the default for forms without format selection
+    download_format = request.form.get("select_dl_format", "xlsx")
+    ## csv is streamed directly, the other formats are written by a background job
+    if download_format == "csv":
+        return stage.get_csv_stream_for_stage_dl(dynamic_only)
+    if download_format not in ["xlsx", "parquet"]:
+        download_format = "xlsx"
+    job = enqueue_job(
+        f"Export of stage {stage.name}",
+        export_stage_job,
+        stage.id,
+        dynamic_only,
+        download_format,
+        user_id=current_user.id,
+        return_url=url_for("experiments.edit_stage", stage_id=stage.id),
+    )
+    return redirect(url_for("jobs.job_detail", job_id=job.id))
 
 
 @experiments_blueprint.route("/api/sent_design/<int:stage_id>", methods=["GET", "POST"])
@@ -408,9 +416,49 @@ def design_data_download(stage_id):
 def api_sent_design(stage_id):
     stage = Stage.get_stage_by_id(stage_id)
 
-    stage.sent_all_runs_to_station()
+    job = enqueue_job(
+        f"Sending stage {stage.name} to the station",
+        send_stages_job,
+        stage.experimental_design_id,
+        [stage.id],
+        user_id=current_user.id,
+        return_url=url_for("experiments.edit_stage", stage_id=stage_id),
+    )
 
-    return redirect(url_for("experiments.edit_stage", stage_id=stage_id))
+    return redirect(url_for("jobs.job_detail", job_id=job.id))
+
+
+@experiments_blueprint.route("/api/stage_telemetry/<int:stage_id>", methods=["GET"])
+@login_required
+def api_stage_telemetry(stage_id):
+    """Returns the samples recorded while runs of the stage were executed, see Stage.get_run_telemetry.
+    Query arguments: first_run and last_run (run IDs), device and observable, all optional.
+
+    Args:
+        stage_id (int): Database ID for the stage
+
+    Returns:
+        json: {"stage_id", "runs": {run_id: {device: {observable: [[timestamp, value], ...]}}}}
+    """
+    stage = Stage.get_stage_by_id(stage_id)
+    try:
+        first_run_id, last_run_id = [
+            int(request.args[name]) if request.args.get(name) else None
+            for name in ["first_run", "last_run"]
+        ]
+    except ValueError as e:
+        abort(400, str(e))
+    runs = {}
+    for run_id, device, observable, timestamp, value in stage.get_run_telemetry(
+        first_run_id,
+        last_run_id,
+        request.args.get("device"),
+        request.args.get("observable"),
+    ):
+        runs.setdefault(run_id, {}).setdefault(device, {}).setdefault(
+            observable, []
+        ).append([timestamp, value])
+    return jsonify({"stage_id": stage.id, "runs": runs})
 
 
 @experiments_blueprint.route("/upload_stage/<int:stage_id>", methods=["POST"])
@@ -420,10 +468,9 @@ def upload_stage(stage_id):
         dynamic_only = True
     elif request.form["select_ul_mode"] == "full":
         dynamic_only = False
-    design_data_upload(
-        stage_id=stage_id, file=request.files["ul_file"], dynamic_only=dynamic_only
+    return design_data_upload(
+        stage_id=stage_id, file=request.files.get("ul_file"), dynamic_only=dynamic_only
     )
-    return redirect(url_for("experiments.edit_stage", stage_id=stage_id))
 
 
 def design_data_upload(stage_id, file, dynamic_only):
@@ -451,8 +498,21 @@ def design_data_upload(stage_id, file, dynamic_only):
             return redirect(url_for("experiments.edit_stage", stage_id=stage_id))
 
         stage = Stage.get_stage_by_id(stage_id)
-        stage.add_or_update_runs_from_excel_upload(file, dynamic_only)
-        return redirect(url_for("experiments.edit_stage", stage_id=stage.id))
+        ## the upload is only available during the request, keep it for the import job
+        upload_folder = os.path.join(current_app.instance_path, "uploads")
+        os.makedirs(upload_folder, exist_ok=True)
+        path = os.path.join(upload_folder, f"{uuid.uuid4().hex}.xlsx")
+        file.save(path)
+        job = enqueue_job(
+            f"Import into stage {stage.name}",
+            import_stage_job,
+            stage.id,
+            path,
+            dynamic_only,
+            user_id=current_user.id,
+            return_url=url_for("experiments.edit_stage", stage_id=stage.id),
+        )
+        return redirect(url_for("jobs.job_detail", job_id=job.id))
 
 
 @experiments_blueprint.route("/send_multiple_stages/<int:design_id>", methods=["POST"])
@@ -466,14 +526,16 @@ def send_multiple_stages(design_id):
         id_list = [int(id) for id in request.form.getlist("stages_to_be_sent")]
         ## compare both list to check for manipulated design ids in the web form
         checked_ids = [id for id in id_list if id in allowed_stages_ids]
-        for id in checked_ids:
-            api_sent_design(id)
-        flash(
-            message=f"{len(checked_ids)} Stages were submitted to the station.",
-            category="success",
+        job = enqueue_job(
+            f"Sending {len(checked_ids)} stages of design {design.name} to the station",
+            send_stages_job,
+            design.id,
+            checked_ids,
+            user_id=current_user.id,
+            return_url=url_for("experiments.edit_design", design_id=design_id),
         )
 
-        return redirect(url_for("experiments.edit_design", design_id=design_id))
+        return redirect(url_for("jobs.job_detail", job_id=job.id))
 
 
 @experiments_blueprint.route("/routines_administration", methods=["GET", "POST"])
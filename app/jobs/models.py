@@ -0,0 +1,117 @@
+import json
+import time
+from datetime import datetime
+
+from .. import db
+from ..utils import ModelMixin
+
+
+class Job(db.Model, ModelMixin):
+    """A long running action of the UI, executed by the JobRunner in a background thread.
+
+    The status goes from queued to running and ends with finished or failed. Progress is
+    reported as ``progress`` of ``total`` steps, the return value of the job function is
+    stored as JSON in ``result``.
+    """
+
+    __tablename__ = "jobs"
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    FINISHED = "finished"
+    FAILED = "failed"
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(255), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=True)
+    status = db.Column(db.String(20), nullable=False, default=QUEUED)
+    progress = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer, nullable=True)
+    message = db.Column(db.Text, nullable=True)
+    result_json = db.Column(db.Text, nullable=True)
+    # page the user returns to once the job is done
+    return_url = db.Column(db.String(255), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    # minimum seconds between two progress commits of a job
+    progress_interval = 0.5
+
+    @classmethod
+    def get_job_by_id(cls, id):
+        return cls.query.get_or_404(id)
+
+    @classmethod
+    def fail_interrupted_jobs(cls):
+        """Marks the queued and running jobs as failed.
+        Jobs run in the runner of the process that queued them, when the process starts
+        no job of the database has a live worker and it would stay unfinished forever.
+
+        Returns:
+            int: number of failed jobs
+        """
+        from sqlalchemy import inspect
+
+        if not inspect(db.engine).has_table(cls.__tablename__):
+            return 0
+        result = db.session.execute(
+            db.update(cls)
+            .where(cls.status.in_((cls.QUEUED, cls.RUNNING)))
+            .values(
+                status=cls.FAILED,
+                message="The job was interrupted by a restart of the server.",
+                finished_at=datetime.now(),
+            )
+        )
+        db.session.commit()
+        return result.rowcount
+
+    @property
+    def result(self):
+        if self.result_json is None:
+            return None
+        return json.loads(self.result_json)
+
+    @property
+    def is_done(self):
+        return self.status in (self.FINISHED, self.FAILED)
+
+    def set_progress(self, progress, total=None, message=None):
+        """Stores the progress of a running job.
+        Commits are throttled to one per progress_interval, except for the last step.
+
+        Args:
+            progress (int): number of finished steps
+            total (int, optional): number of steps of the job
+            message (str, optional): description of the current step
+        """
+        self.progress = progress
+        if total is not None:
+            self.total = total
+        if message is not None:
+            self.message = message
+        now = time.monotonic()
+        last_commit = getattr(self, "_last_progress_commit", None)
+        if (
+            last_commit is None
+            or now - last_commit >= self.progress_interval
+            or progress == self.total
+        ):
+            self._last_progress_commit = now
+            db.session.commit()
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "status": self.status,
+            "progress": self.progress,
+            "total": self.total,
+            "message": self.message,
+            "result": self.result,
+            "return_url": self.return_url,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
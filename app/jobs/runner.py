@@ -0,0 +1,117 @@
+"""In-process execution of long running UI actions.
+
+A view enqueues a job function and redirects to the status page of the job
+right away, the function runs in a thread of the :class:`JobRunner` with its
+own app context and database session. Job functions take the :class:`Job`
+as first argument, report their progress with ``job.set_progress`` and
+return a JSON serializable result. An exception marks the job as failed with
+the error as message.
+
+Every process has its own runner, jobs do not survive a restart of the
+process. The app marks the unfinished jobs as failed when it starts, see
+:meth:`Job.fail_interrupted_jobs`.
+"""
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from flask import current_app
+
+from .. import db
+from .models import Job
+
+
+class JobRunner(object):
+    """Thread pool executing the jobs of one app.
+
+    Args:
+        app (Flask): app whose context the jobs run in.
+        max_workers (int): number of jobs executed at the same time.
+    """
+
+    def __init__(self, app, max_workers=2):
+        self.app = app
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="job-runner"
+        )
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def enqueue(self, name, function, *args, user_id=None, return_url=None, **kwargs):
+        """Stores a new job and schedules ``function(job, *args, **kwargs)``.
+
+        Args:
+            name (str): description of the job shown to the user.
+            function (callable): job function, only pass ids and plain values as arguments.
+            user_id (int, optional): Database ID of the user who started the job.
+            return_url (str, optional): page the user returns to once the job is done.
+
+        Returns:
+            Job: the queued job.
+        """
+        job = Job(name=name, user_id=user_id, return_url=return_url)
+        db.session.add(job)
+        db.session.commit()
+        future = self._executor.submit(self._run, job.id, function, args, kwargs)
+        with self._lock:
+            self._futures[job.id] = future
+        future.add_done_callback(lambda _: self._forget(job.id))
+        return job
+
+    def wait(self, job_id, timeout=None):
+        """Blocks until a job of this runner is done."""
+        with self._lock:
+            future = self._futures.get(job_id)
+        if future is not None:
+            future.exception(timeout)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def _forget(self, job_id):
+        with self._lock:
+            self._futures.pop(job_id, None)
+
+    def _run(self, job_id, function, args, kwargs):
+        with self.app.app_context():
+            job = db.session.get(Job, job_id)
+            job.status = Job.RUNNING
+            job.started_at = datetime.now()
+            db.session.commit()
+            try:
+                result = function(job, *args, **kwargs)
+                job.result_json = json.dumps(result)
+                job.status = Job.FINISHED
+            except Exception as e:
+                db.session.rollback()
+                current_app.logger.exception("Job %s failed", job_id)
+                job.status = Job.FAILED
+                job.message = str(e) or e.__class__.__name__
+            job.finished_at = datetime.now()
+            db.session.commit()
+            db.session.remove()
+
+
+_runners = {}
+_runners_lock = threading.Lock()
+
+
+def get_job_runner():
+    """Returns the job runner of the current app, creating it on first use.
+
+    Returns:
+        JobRunner: runner for the current app.
+    """
+    app = current_app._get_current_object()
+    with _runners_lock:
+        runner = _runners.get(app)
+        if runner is None:
+            runner = JobRunner(app, max_workers=app.config["JOB_WORKERS"])
+            _runners[app] = runner
+        return runner
+
+
+def enqueue_job(name, function, *args, **kwargs):
+    """Enqueues a job in the runner of the current app, see :meth:`JobRunner.enqueue`."""
+    return get_job_runner().enqueue(name, function, *args, **kwargs)
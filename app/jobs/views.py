@@ -0,0 +1,112 @@
+import json
+import os
+import time
+
+from flask import (
+    Blueprint,
+    Response,
+    abort,
+    current_app,
+    jsonify,
+    render_template,
+    send_file,
+    stream_with_context,
+)
+from flask_login import current_user, login_required
+
+from .. import db
+from .models import Job
+
+
+jobs_blueprint = Blueprint("jobs", __name__)
+
+
+def get_job_of_current_user(job_id):
+    """Returns a job, aborts with 404 if it does not exist or belongs to another user."""
+    job = Job.get_job_by_id(job_id)
+    if job.user_id != current_user.id and not current_user.has_roles("admin"):
+        abort(404)
+    return job
+
+
+def get_job_export_path(file_name):
+    """Returns the path of a file written by a job into the exports folder of the instance."""
+    return os.path.join(current_app.instance_path, "exports", file_name)
+
+
+def remove_expired_exports(max_age):
+    """Deletes the files of the exports folder that are older than max_age.
+
+    Args:
+        max_age (float): seconds a file is kept for download.
+
+    Returns:
+        int: number of deleted files
+    """
+    folder = get_job_export_path("")
+    if not os.path.isdir(folder):
+        return 0
+    removed = 0
+    now = time.time()
+    for entry in os.scandir(folder):
+        if entry.is_file() and now - entry.stat().st_mtime > max_age:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                # deleted by another process or still open for a download
+                continue
+            removed += 1
+    return removed
+
+
+@jobs_blueprint.route("/jobs/<int:job_id>")
+@login_required
+def job_detail(job_id):
+    job = get_job_of_current_user(job_id)
+    return render_template("jobs/job_detail.html", job=job)
+
+
+@jobs_blueprint.route("/jobs/<int:job_id>/status")
+@login_required
+def job_status(job_id):
+    return jsonify(get_job_of_current_user(job_id).to_dict())
+
+
+@jobs_blueprint.route("/jobs/<int:job_id>/events")
+@login_required
+def job_events(job_id):
+    """returns a server sent event stream with the state of a job, an event is sent whenever the job changes.
+    The stream ends once the job is finished or failed.
+    """
+    job = get_job_of_current_user(job_id)
+    interval = current_app.config["JOB_EVENTS_INTERVAL"]
+
+    def get_updates():
+        last_state = None
+        while True:
+            # reload the job, it is updated by the thread of the job runner
+            db.session.refresh(job)
+            state = job.to_dict()
+            if state != last_state:
+                yield f"data:{json.dumps(state)}\n\n"
+                last_state = state
+            if job.is_done:
+                return
+            # end the read transaction, otherwise the changes of the runner are not visible
+            db.session.commit()
+            time.sleep(interval)
+
+    return Response(stream_with_context(get_updates()), mimetype="text/event-stream")
+
+
+@jobs_blueprint.route("/jobs/<int:job_id>/download")
+@login_required
+def job_download(job_id):
+    job = get_job_of_current_user(job_id)
+    result = job.result
+    if job.status != Job.FINISHED or not result or "file" not in result:
+        abort(404)
+    path = get_job_export_path(result["file"])
+    if not os.path.exists(path):
+        abort(404)
+    return send_file(path, as_attachment=True, download_name=result["download_name"])
@@ -0,0 +1,290 @@
+"""Compact in-memory buffers of the samples of the station update stream.
+
+The payloads of ``/api/get_updates`` hold one ``[timestamp, value]`` list per
+sample. Kept for an hour, these Python objects cost hundreds of bytes per
+sample. An :class:`ObservableBuffer` stores the samples of one observable in
+two preallocated float64 arrays (16 bytes per sample) that are used as a
+ring, and doubles its capacity when it is full. Slicing, resampling and
+serialising work on the arrays. Observables with text values fall back to an
+object array for the values.
+
+A :class:`StationBuffer` holds the buffers of all observables of a station for
+``max_age`` seconds, the :class:`StationUpdateHub` serves the snapshots of
+reconnecting clients from it, see hub.py.
+"""
+import math
+
+import numpy as np
+
+
+class ObservableBuffer(object):
+    """Samples of one observable in ascending order of their timestamps.
+
+    Args:
+        capacity (int): number of samples the buffer is preallocated for
+    """
+
+    def __init__(self, capacity=256):
+        self._timestamps = np.empty(capacity, dtype=np.float64)
+        self._values = np.empty(capacity, dtype=np.float64)
+        self._start = 0
+        self._length = 0
+
+    def __len__(self):
+        return self._length
+
+    @property
+    def capacity(self):
+        return len(self._timestamps)
+
+    @property
+    def nbytes(self):
+        """Memory of the arrays in bytes, text values are not included."""
+        return self._timestamps.nbytes + self._values.nbytes
+
+    @property
+    def is_numeric(self):
+        return self._values.dtype != object
+
+    def append(self, samples):
+        """Appends samples that are newer than the buffered ones.
+
+        Args:
+            samples (list): ``[timestamp, value]`` pairs, ascending timestamps
+        """
+        if not samples:
+            return
+        timestamps = np.fromiter(
+            (sample[0] for sample in samples), dtype=np.float64, count=len(samples)
+        )
+        values = self._to_array([sample[1] for sample in samples])
+
+        count = len(timestamps)
+        if self._length + count > self.capacity:
+            self._grow(self._length + count)
+        capacity = self.capacity
+        end = (self._start + self._length) % capacity
+        head = min(count, capacity - end)
+        self._timestamps[end : end + head] = timestamps[:head]
+        self._values[end : end + head] = values[:head]
+        self._timestamps[: count - head] = timestamps[head:]
+        self._values[: count - head] = values[head:]
+        self._length += count
+
+    def trim(self, before):
+        """Drops the samples older than a station timestamp, returns their number."""
+        dropped = sum(
+            int(np.searchsorted(timestamps, before, side="left"))
+            for timestamps, values in self._segments()
+        )
+        self._start = (self._start + dropped) % self.capacity
+        self._length -= dropped
+        return dropped
+
+    def clear(self):
+        self._start = 0
+        self._length = 0
+
+    def slice(self, after=None, until=None):
+        """Returns the samples in a time range.
+
+        Args:
+            after (float, optional): only samples newer than this station timestamp
+            until (float, optional): only samples up to this station timestamp
+
+        Returns:
+            tuple: arrays of the timestamps and the values
+        """
+        timestamp_parts = []
+        value_parts = []
+        for timestamps, values in self._segments():
+            first = 0
+            last = len(timestamps)
+            if after is not None:
+                first = np.searchsorted(timestamps, after, side="right")
+            if until is not None:
+                last = np.searchsorted(timestamps, until, side="right")
+            timestamp_parts.append(timestamps[first:last])
+            value_parts.append(values[first:last])
+        if not timestamp_parts:
+            return np.empty(0, dtype=np.float64), self._values[:0].copy()
+        return np.concatenate(timestamp_parts), np.concatenate(value_parts)
+
+    def resample(self, width, after=None, until=None):
+        """Averages the samples in a time range over buckets of equal width.
+
+        Args:
+            width (float): width of the buckets in seconds
+            after (float, optional): only samples newer than this station timestamp
+            until (float, optional): only samples up to this station timestamp
+
+        Returns:
+            tuple: arrays of the first timestamp and the mean value per bucket, text values keep the first value
+        """
+        timestamps, values = self.slice(after, until)
+        if not len(timestamps):
+            return timestamps, values
+        buckets = np.floor(timestamps / width)
+        starts = np.flatnonzero(np.diff(buckets)) + 1
+        starts = np.concatenate(([0], starts))
+        if not self.is_numeric:
+            return timestamps[starts], values[starts]
+        counts = np.diff(np.append(starts, len(timestamps)))
+        return timestamps[starts], np.add.reduceat(values, starts) / counts
+
+    def serialize(self, after=None, until=None):
+        """Returns the samples in a time range as ``[timestamp, value]`` pairs for a JSON payload."""
+        timestamps, values = self.slice(after, until)
+        if self.is_numeric:
+            # one conversion of the whole array, no Python object per sample before that
+            samples = np.column_stack((timestamps, values)).tolist()
+            # missing values are stored as NaN, which is not valid JSON
+            for index in np.flatnonzero(np.isnan(values)):
+                samples[index][1] = None
+            return samples
+        return [list(sample) for sample in zip(timestamps.tolist(), values.tolist())]
+
+    def _to_array(self, values):
+        if self.is_numeric and not any(isinstance(value, str) for value in values):
+            try:
+                return np.array(values, dtype=np.float64)
+            except (TypeError, ValueError):
+                pass
+        if self.is_numeric:
+            # text values, the buffer keeps the values as objects from now on
+            numbers = self._values
+            self._values = numbers.astype(object)
+            self._values[np.isnan(numbers)] = None
+        return np.fromiter(values, dtype=object, count=len(values))
+
+    def _segments(self):
+        """Returns the buffered samples as one or two (timestamps, values) views in ascending order."""
+        end = self._start + self._length
+        capacity = self.capacity
+        if self._length == 0:
+            return []
+        if end <= capacity:
+            return [
+                (self._timestamps[self._start : end], self._values[self._start : end])
+            ]
+        return [
+            (self._timestamps[self._start :], self._values[self._start :]),
+            (self._timestamps[: end - capacity], self._values[: end - capacity]),
+        ]
+
+    def _grow(self, required):
+        capacity = max(self.capacity, 1)
+        while capacity < required:
+            capacity *= 2
+        timestamps, values = self.slice()
+        self._timestamps = np.empty(capacity, dtype=np.float64)
+        self._values = np.empty(capacity, dtype=self._values.dtype)
+        self._timestamps[: self._length] = timestamps
+        self._values[: self._length] = values
+        self._start = 0
+
+
+class StationBuffer(object):
+    """Samples of all observables of a station during the last max_age seconds.
+
+    The buffer knows the station timestamp after which it holds every sample (``origin``),
+    so it can tell if it can replace a get_updates request, see :meth:`covers`.
+
+    Args:
+        max_age (float, optional): seconds the samples are kept, None keeps them all
+    """
+
+    def __init__(self, max_age=3600.0):
+        self.max_age = max_age
+        self.origin = None
+        self.timestamp = None
+        self._buffers = {}
+        self._metadata = {}
+
+    @property
+    def nbytes(self):
+        """Memory of the sample arrays in bytes."""
+        return sum(
+            buffer.nbytes
+            for observables in self._buffers.values()
+            for buffer in observables.values()
+        )
+
+    def extend(self, from_timestamp, payload):
+        """Adds the samples of a get_updates response.
+
+        Args:
+            from_timestamp (float): from_timestamp of the request, None for all samples since the start of the experiment
+            payload (dict): response of get_updates
+        """
+        from_timestamp = _parse_timestamp(from_timestamp)
+        timestamp = _parse_timestamp(payload["timestamp"])
+        if self.timestamp is None or from_timestamp != self.timestamp:
+            # the response does not continue the buffered samples
+            self.clear()
+            self.origin = -math.inf if from_timestamp is None else from_timestamp
+        for device, observables in payload["updates"].items():
+            for observable, samples in observables.items():
+                buffers = self._buffers.setdefault(device, {})
+                if observable not in buffers:
+                    buffers[observable] = ObservableBuffer()
+                buffers[observable].append(samples)
+        self.timestamp = timestamp
+        self._metadata = {
+            key: value for key, value in payload.items() if key != "updates"
+        }
+        if self.max_age is not None and timestamp is not None:
+            cutoff = timestamp - self.max_age
+            dropped = sum(
+                buffer.trim(cutoff)
+                for observables in self._buffers.values()
+                for buffer in observables.values()
+            )
+            if dropped:
+                self.origin = max(self.origin, cutoff)
+
+    def covers(self, after):
+        """Checks if the buffer holds every sample newer than a station timestamp, None for all since the start of the experiment."""
+        if self.origin is None or self.timestamp is None:
+            return False
+        if after is None:
+            return self.origin == -math.inf
+        return self.origin <= after
+
+    def clear(self):
+        self._buffers = {}
+        self._metadata = {}
+        self.origin = None
+        self.timestamp = None
+
+    def get_updates(self, after=None, until=None):
+        """Returns the buffered samples in a time range.
+
+        Args:
+            after (float, optional): only samples newer than this station timestamp
+            until (float, optional): only samples up to this station timestamp
+
+        Returns:
+            dict: ``{device: {observable: [[timestamp, value], ...]}}``, without observables that have no samples in the range
+        """
+        updates = {}
+        for device, observables in self._buffers.items():
+            for observable, buffer in observables.items():
+                samples = buffer.serialize(after, until)
+                if samples:
+                    updates.setdefault(device, {})[observable] = samples
+        return updates
+
+    def get_payload(self, after=None, until=None):
+        """Returns the buffered samples in a time range as get_updates response, see :meth:`get_updates`."""
+        payload = dict(self._metadata, updates=self.get_updates(after, until))
+        if until is not None and until != self.timestamp:
+            payload["timestamp"] = until
+        return payload
+
+
+def _parse_timestamp(timestamp):
+    try:
+        return float(timestamp)
+    except (TypeError, ValueError):
+        return None
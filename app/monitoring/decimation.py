@@ -0,0 +1,291 @@
+"""Server side decimation of the samples sent to the plots.
+
+Samples are ``[timestamp, value]`` pairs as delivered by ``/api/get_updates``.
+Long series are reduced to a target number of points before they are sent to
+the browsers, either with Largest-Triangle-Three-Buckets (keeps the visual
+shape of a line) or min-max (keeps the extremes of every bucket). The kept
+samples are the original ones, only fewer of them.
+
+The live messages of a stream only hold the samples of one poll interval. A
+time resolution is applied over the whole stream by a :class:`StreamDecimation`,
+which sends the samples of a time bucket once the bucket is closed.
+"""
+import collections
+import math
+
+import numpy as np
+
+
+METHODS = ["lttb", "minmax"]
+
+ChartResolution = collections.namedtuple(
+    "ChartResolution", ["points", "resolution", "method"]
+)
+
+
+def parse_chart_resolution(args, default_method="lttb"):
+    """Reads the decimation parameters of a chart data request.
+
+    Args:
+        args (dict): query arguments, ``points`` (maximum samples per observable and message),
+            ``resolution`` (seconds per sample) and ``method`` (lttb or minmax)
+        default_method (str): method if none is requested
+
+    Raises:
+        ValueError: if a parameter is invalid
+
+    Returns:
+        ChartResolution: None if neither points nor resolution are given, the samples are sent in full resolution then
+    """
+    points = args.get("points")
+    resolution = args.get("resolution")
+    method = args.get("method") or default_method
+    if method not in METHODS:
+        raise ValueError(f"Unknown decimation method {method}.")
+    points = int(points) if points else None
+    resolution = float(resolution) if resolution else None
+    if points is not None and points < 2:
+        raise ValueError("At least two points are needed.")
+    if resolution is not None and not resolution > 0:
+        raise ValueError("The resolution must be positive.")
+    if points is None and resolution is None:
+        return None
+    return ChartResolution(points, resolution, method)
+
+
+def lttb_indices(x, y, threshold):
+    """Selects samples with Largest-Triangle-Three-Buckets.
+
+    Args:
+        x (numpy.ndarray): timestamps, ascending
+        y (numpy.ndarray): values
+        threshold (int): number of samples to keep
+
+    Returns:
+        numpy.ndarray: indices of the kept samples, ascending
+    """
+    n = len(x)
+    if threshold >= n:
+        return np.arange(n)
+    if threshold < 3:
+        return np.array([0, n - 1][:threshold])
+    # the first and the last sample are always kept, the others are split into threshold - 2 buckets
+    edges = np.floor(np.linspace(1, n - 1, threshold - 1)).astype(int)
+    edges[-1] = n - 1
+    # averages of the following bucket, from cumulative sums
+    cumulative_x = np.concatenate(([0.0], np.cumsum(x)))
+    cumulative_y = np.concatenate(([0.0], np.cumsum(y)))
+    next_starts = np.append(edges[1:-1], n - 1)
+    next_ends = np.append(edges[2:], n)
+    widths = next_ends - next_starts
+    average_x = (cumulative_x[next_ends] - cumulative_x[next_starts]) / widths
+    average_y = (cumulative_y[next_ends] - cumulative_y[next_starts]) / widths
+
+    selected = np.empty(threshold, dtype=int)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        # twice the area of the triangles between the last kept sample, the candidates and the next average
+        areas = np.abs(
+            (x[a] - average_x[bucket]) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (average_y[bucket] - y[a])
+        )
+        a = start + int(np.argmax(areas))
+        selected[bucket + 1] = a
+    return selected
+
+
+def min_max_indices(y, threshold):
+    """Selects the minimum and the maximum of threshold / 2 buckets.
+
+    Args:
+        y (numpy.ndarray): values
+        threshold (int): maximum number of samples to keep
+
+    Returns:
+        numpy.ndarray: indices of the kept samples, ascending
+    """
+    n = len(y)
+    if threshold >= n:
+        return np.arange(n)
+    buckets = max(1, threshold // 2)
+    starts = np.floor(np.linspace(0, n, buckets + 1)[:-1]).astype(int)
+    widths = np.diff(np.append(starts, n))
+    positions = np.arange(n)
+    indices = []
+    for reduce in (np.fmin, np.fmax):
+        extremes = np.repeat(reduce.reduceat(y, starts), widths)
+        # first sample of every bucket that equals its extreme, buckets without numbers keep their first sample
+        candidates = np.where(y == extremes, positions, n)
+        first = np.minimum.reduceat(candidates, starts)
+        indices.append(np.where(first < n, first, starts))
+    return np.unique(np.concatenate(indices))
+
+
+def decimate_samples(samples, resolution):
+    """Reduces a series of samples to the requested resolution.
+
+    Args:
+        samples (list): ``[timestamp, value]`` pairs, ascending timestamps
+        resolution (ChartResolution): target of the decimation, None keeps all samples
+
+    Returns:
+        list: the kept samples, series with non numeric values are kept as they are
+    """
+    if resolution is None or len(samples) < 3:
+        return samples
+    try:
+        data = np.asarray(samples, dtype=float)
+    except (TypeError, ValueError):
+        return samples
+    if data.ndim != 2 or data.shape[1] != 2:
+        return samples
+
+    x, y = data[:, 0], data[:, 1]
+    targets = []
+    if resolution.points is not None:
+        targets.append(resolution.points)
+    if resolution.resolution is not None:
+        targets.append(math.floor((x[-1] - x[0]) / resolution.resolution) + 1)
+    threshold = max(2, min(targets))
+    if threshold >= len(samples):
+        return samples
+    if resolution.method == "minmax":
+        indices = min_max_indices(y, threshold)
+    else:
+        indices = lttb_indices(x, y, threshold)
+    return [samples[index] for index in indices]
+
+
+def decimate_updates(updates, resolution):
+    """Decimates every observable of an update payload.
+
+    Args:
+        updates (dict): ``{device: {observable: [[timestamp, value], ...]}}``
+        resolution (ChartResolution): target of the decimation, None keeps all samples
+
+    Returns:
+        dict: updates with the decimated samples
+    """
+    if resolution is None:
+        return updates
+    return {
+        device: {
+            observable: decimate_samples(samples, resolution)
+            for observable, samples in observables.items()
+        }
+        for device, observables in updates.items()
+    }
+
+
+class StreamDecimation(object):
+    """Decimation of the consecutive payloads of one event stream.
+
+    A payload of a live stream covers about one poll interval, decimated on its own it keeps
+    at least two samples of every observable. With a time resolution the timestamps are split
+    into buckets of ``resolution`` seconds. The samples of the latest bucket are held back until
+    a sample of a later bucket arrives, then the closed bucket is reduced to its minimum and
+    maximum (minmax) or to the sample Largest-Triangle-Three-Buckets selects (lttb).
+
+    Args:
+        resolution (ChartResolution): target of the decimation
+    """
+
+    def __init__(self, resolution):
+        self.resolution = resolution
+        # samples of the bucket that is not closed yet per (device, observable)
+        self._open_buckets = {}
+        # (timestamp, value) of the last sent sample per (device, observable), a corner of the next triangle
+        self._last_samples = {}
+
+    def decimate_updates(self, updates):
+        """Decimates the next payload of the stream, see :func:`decimate_updates`."""
+        if self.resolution.resolution is None:
+            return decimate_updates(updates, self.resolution)
+        return {
+            device: {
+                observable: self._decimate_samples((device, observable), samples)
+                for observable, samples in observables.items()
+            }
+            for device, observables in updates.items()
+        }
+
+    def _decimate_samples(self, key, samples):
+        samples = self._open_buckets.pop(key, []) + list(samples)
+        if not samples:
+            return samples
+        try:
+            timestamps = np.fromiter(
+                (sample[0] for sample in samples), dtype=float, count=len(samples)
+            )
+        except (TypeError, ValueError, IndexError):
+            return samples
+        try:
+            values = np.fromiter(
+                (np.nan if sample[1] is None else sample[1] for sample in samples),
+                dtype=float,
+                count=len(samples),
+            )
+        except (TypeError, ValueError, IndexError):
+            # labels, the first sample of every bucket is kept
+            values = None
+        buckets = np.floor(timestamps / self.resolution.resolution)
+        # timestamps that go backwards (a new experiment) start new buckets as well
+        starts = np.flatnonzero(np.diff(buckets, prepend=np.nan) != 0)
+        ends = np.append(starts[1:], len(samples))
+        self._open_buckets[key] = samples[starts[-1] :]
+
+        kept = []
+        for bucket in range(len(starts) - 1):
+            start, end = starts[bucket], ends[bucket]
+            if values is None:
+                indices = [start]
+            elif self.resolution.method == "minmax":
+                indices = self._min_max_indices(values, start, end)
+            else:
+                indices = [
+                    self._lttb_index(
+                        key, timestamps, values, start, end, ends[bucket + 1]
+                    )
+                ]
+            kept.extend(samples[index] for index in indices)
+            self._last_samples[key] = (
+                timestamps[indices[-1]],
+                values[indices[-1]] if values is not None else np.nan,
+            )
+        if self.resolution.points is not None and len(kept) > self.resolution.points:
+            kept = decimate_samples(kept, self.resolution._replace(resolution=None))
+        return kept
+
+    @staticmethod
+    def _min_max_indices(values, start, end):
+        bucket = values[start:end]
+        if np.isnan(bucket).all():
+            return [start]
+        return sorted(
+            {start + int(np.nanargmin(bucket)), start + int(np.nanargmax(bucket))}
+        )
+
+    def _lttb_index(self, key, timestamps, values, start, end, next_end):
+        """Selects the sample of a closed bucket that spans the largest triangle with the last sent
+        sample and the average of the following bucket, the first bucket of a stream keeps its first sample.
+        """
+        last = self._last_samples.get(key)
+        if last is None:
+            return start
+        next_values = values[end:next_end]
+        next_values = next_values[~np.isnan(next_values)]
+        if not len(next_values):
+            return start
+        average_x = timestamps[end:next_end].mean()
+        average_y = next_values.mean()
+        last_x, last_y = last
+        areas = np.abs(
+            (last_x - average_x) * (values[start:end] - last_y)
+            - (last_x - timestamps[start:end]) * (average_y - last_y)
+        )
+        if np.isnan(areas).all():
+            return start
+        return start + int(np.nanargmax(areas))
@@ -0,0 +1,522 @@
+"""Shared polling of the station update stream.
+
+A browser tab watching a station used to run its own polling loop against
+``/api/get_updates``. The :class:`StationUpdateHub` polls a station once per
+interval and fans the same payload out to every subscribed event stream. The
+poller thread stops as soon as the last subscriber is gone.
+
+Every message carries the station timestamp as event id. The hub keeps the
+latest messages in a ring buffer, so a reconnecting ``EventSource`` that sends
+its ``Last-Event-ID`` only receives the samples it missed.
+
+The samples of the last hour are also kept in a :class:`StationBuffer` of
+NumPy arrays, see buffers.py. Snapshots for clients the ring buffer does not
+reach back far enough for are served from it without asking the station. The
+responses are added to the buffer when a snapshot needs them, until then the
+hub keeps them unparsed.
+
+Subscribers may request decimated samples, see decimation.py. Every payload is
+decimated and formatted once per requested resolution and shared by all
+subscribers with that resolution. A time resolution is applied over the whole
+stream, not per poll, see :class:`StreamDecimation`.
+
+Full resolution messages forward the response of the station as it is. Its
+timestamp is read without parsing the whole document, see
+:class:`StationUpdate`. The response is only parsed if it is needed, for
+decimated subscribers or for a snapshot from the buffer. Forwarded responses
+are not compacted, the plots skip observables without samples.
+"""
+import collections
+import json
+import queue
+import re
+import threading
+
+import requests
+
+from ..experiments.client import loads
+from .buffers import StationBuffer
+from .decimation import StreamDecimation, decimate_updates
+
+### a number value of a "timestamp" key, devices and observables have objects and lists as values
+TIMESTAMP_PATTERN = re.compile(
+    rb'"timestamp"\s*:\s*(-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)\s*[,}]'
+)
+
+
+class Subscription(object):
+    """Message queue of one event stream client, created by :meth:`StationUpdateHub.subscribe`."""
+
+    def __init__(
+        self,
+        needs_snapshot,
+        snapshot_from,
+        maxsize,
+        resolution=None,
+        snapshot_until=None,
+    ):
+        self.needs_snapshot = needs_snapshot
+        self.snapshot_from = snapshot_from
+        # station timestamp of the last update published before the subscription, the following ones are queued
+        self.snapshot_until = snapshot_until
+        self.resolution = resolution
+        self.closed = False
+        self._queue = queue.Queue(maxsize=maxsize)
+
+    def put(self, message):
+        """Queues a message. Returns False if the client does not keep up with the stream."""
+        try:
+            self._queue.put_nowait(message)
+            return True
+        except queue.Full:
+            return False
+
+    def close(self):
+        self.closed = True
+        try:
+            self._queue.put_nowait(None)
+        except queue.Full:
+            pass
+
+    def __iter__(self):
+        while not self.closed:
+            message = self._queue.get()
+            if message is None:
+                break
+            yield message
+
+
+class StationUpdate(object):
+    """One get_updates response of a station, parsed on first use.
+
+    Args:
+        from_timestamp (float): from_timestamp of the request, None for all updates since the start of the experiment.
+        content (bytes): body of the response.
+
+    Raises:
+        ValueError: if the response has no timestamp.
+    """
+
+    def __init__(self, from_timestamp, content):
+        self.from_timestamp = from_timestamp
+        self.content = content
+        self._payload = None
+        self._messages = {}
+        match = TIMESTAMP_PATTERN.search(content)
+        if match is not None:
+            self.timestamp = json.loads(match.group(1))
+        else:
+            try:
+                self.timestamp = self.payload["timestamp"]
+            except (KeyError, TypeError) as e:
+                raise ValueError("The response has no timestamp.") from e
+
+    @property
+    def is_parsed(self):
+        return self._payload is not None
+
+    @property
+    def payload(self):
+        """The parsed response with compacted updates, see get_payload."""
+        if self._payload is None:
+            self._payload = get_payload(loads(self.content))
+        return self._payload
+
+    def get_message(self, resolution=None, decimation=None):
+        """Returns the server sent event message of the update, formatted once per resolution.
+
+        Args:
+            resolution (ChartResolution, optional): decimation of the samples, None forwards the response unchanged.
+            decimation (StreamDecimation, optional): decimation of the stream the update is published in.
+
+        Returns:
+            str: server sent event message.
+        """
+        message = self._messages.get(resolution)
+        if message is None:
+            if resolution is None:
+                message = format_event(self.timestamp, self.content)
+            else:
+                message = format_message(self.payload, resolution, decimation)
+            self._messages[resolution] = message
+        return message
+
+
+class StationUpdateHub(object):
+    """Polls ``get_updates`` of one station and distributes the payloads to all subscribers.
+
+    Args:
+        station_id (int): Database ID for the station.
+        client (StationClient): client for the API of the station.
+        interval (float): Seconds between two polls.
+        history_size (int): Number of messages kept for reconnecting clients.
+        max_queue_size (int): Number of pending messages after which a slow client is dropped.
+        buffer_seconds (float): Seconds the samples are kept for snapshots, see buffers.py. 0 disables the buffer.
+    """
+
+    def __init__(
+        self,
+        station_id,
+        client,
+        interval=1.0,
+        history_size=600,
+        max_queue_size=120,
+        buffer_seconds=3600.0,
+    ):
+        self.station_id = station_id
+        self.client = client
+        self.interval = interval
+        self.max_queue_size = max_queue_size
+        self._subscribers = []
+        # (from_timestamp, timestamp, payload, message) of the latest polls
+        self._history = collections.deque(maxlen=history_size)
+        # StreamDecimation of the published updates per time resolution
+        self._decimations = {}
+        self._buffer = StationBuffer(buffer_seconds) if buffer_seconds else None
+        # published updates that are not in the buffer yet, parsed when a snapshot needs them
+        self._pending = collections.deque()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._running = False
+        self._timestamp = None
+
+    @property
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    @property
+    def is_running(self):
+        with self._lock:
+            return self._running
+
+    def subscribe(self, last_event_id=None, resolution=None):
+        """Registers a new client and starts the poller if it is not running yet.
+
+        A freshly started poller requests the updates since ``last_event_id``, or since the start
+        of the experiment if the client has not seen any message yet. Clients joining a running
+        poller get the buffered messages they missed. If the buffer does not reach back far enough,
+        this is signaled with ``Subscription.needs_snapshot``, see :meth:`fetch_snapshot`.
+
+        Args:
+            last_event_id (float, optional): station timestamp of the last message the client received.
+            resolution (ChartResolution, optional): decimation of the samples, None for full resolution.
+
+        Returns:
+            Subscription: iterable of server sent event messages.
+        """
+        with self._lock:
+            if not self._running:
+                subscription = Subscription(
+                    False, None, self.max_queue_size, resolution
+                )
+                self._running = True
+                self._timestamp = last_event_id
+                self._history.clear()
+                self._decimations.clear()
+                self._wakeup.clear()
+                thread = threading.Thread(
+                    target=self._run,
+                    name=f"station-update-hub-{self.station_id}",
+                    daemon=True,
+                )
+                thread.start()
+            elif self._history_covers(last_event_id):
+                decimation = self._get_decimation(resolution)
+                missed_messages = []
+                for update in self._history:
+                    timestamp = parse_event_id(update.timestamp)
+                    if last_event_id is None or (
+                        timestamp is not None and timestamp > last_event_id
+                    ):
+                        missed_messages.append(
+                            update.get_message(resolution, decimation)
+                        )
+                subscription = Subscription(
+                    False,
+                    None,
+                    self.max_queue_size + len(missed_messages),
+                    resolution,
+                )
+                for message in missed_messages:
+                    subscription.put(message)
+            else:
+                subscription = Subscription(
+                    True,
+                    last_event_id,
+                    self.max_queue_size,
+                    resolution,
+                    snapshot_until=parse_event_id(self._timestamp),
+                )
+            self._subscribers.append(subscription)
+        return subscription
+
+    def _history_covers(self, last_event_id):
+        """Checks if the buffered messages contain every update after ``last_event_id``."""
+        if self._history:
+            origin = self._history[0].from_timestamp
+        else:
+            origin = self._timestamp
+        if origin is None:
+            return True
+        origin = parse_event_id(origin)
+        return (
+            origin is not None and last_event_id is not None and origin <= last_event_id
+        )
+
+    def unsubscribe(self, subscription):
+        """Removes a client, the poller stops with the last one."""
+        with self._lock:
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
+            if not self._subscribers:
+                self._wakeup.set()
+        subscription.close()
+
+    def fetch_snapshot(self, from_timestamp=None, resolution=None, until=None):
+        """Returns the updates a client missed, by default all since the start of the experiment.
+        They are taken from the buffer of the hub if it reaches back far enough, otherwise they are requested from the station.
+
+        Args:
+            from_timestamp (float, optional): station timestamp of the last message the client received.
+            resolution (ChartResolution, optional): decimation of the samples, None for full resolution.
+            until (float, optional): station timestamp of the last sample to include, ``Subscription.snapshot_until``.
+
+        Returns:
+            str: server sent event message.
+        """
+        with self._lock:
+            payload = None
+            if until is not None and self._buffer is not None:
+                self._merge_pending()
+                if self._buffer.covers(from_timestamp):
+                    payload = self._buffer.get_payload(from_timestamp, until)
+        if payload is not None:
+            return format_message(payload, resolution)
+        r = self.client.post("get_updates", data={"from_timestamp": from_timestamp})
+        return StationUpdate(from_timestamp, r.content).get_message(resolution)
+
+    def _needs_payload(self):
+        """Checks if the next update has to be parsed, otherwise it is forwarded unchanged."""
+        with self._lock:
+            return any(
+                subscription.resolution is not None
+                for subscription in self._subscribers
+            )
+
+    def _merge_pending(self):
+        """Adds the pending updates to the buffer, called with the lock held."""
+        try:
+            while self._pending:
+                update = self._pending.popleft()
+                self._buffer.extend(update.from_timestamp, update.payload)
+        except (TypeError, ValueError, KeyError):
+            # an invalid response or samples without numeric timestamps, snapshots are requested from the station
+            self._buffer.clear()
+            self._pending.clear()
+
+    def _trim_pending(self):
+        """Drops the pending updates that end before the time the buffer keeps, called with the lock held."""
+        latest = parse_event_id(self._pending[-1].timestamp)
+        if latest is None or self._buffer.max_age is None:
+            return
+        cutoff = latest - self._buffer.max_age
+        while len(self._pending) > 1:
+            timestamp = parse_event_id(self._pending[0].timestamp)
+            if timestamp is None or timestamp >= cutoff:
+                break
+            # the following update does not continue the buffer, it starts again from there
+            self._pending.popleft()
+
+    def _publish(self, update):
+        # the update is formatted once per resolution requested by the subscribers
+        with self._lock:
+            self._history.append(update)
+            if self._buffer is not None:
+                self._pending.append(update)
+                self._trim_pending()
+            dropped = []
+            for subscription in self._subscribers:
+                try:
+                    message = update.get_message(
+                        subscription.resolution,
+                        self._get_decimation(subscription.resolution),
+                    )
+                except (TypeError, ValueError, KeyError):
+                    # the response can not be decimated, the client reconnects
+                    message = None
+                if message is None or not subscription.put(message):
+                    dropped.append(subscription)
+            for subscription in dropped:
+                self._subscribers.remove(subscription)
+            if self._buffer is not None and update.is_parsed:
+                # parsed for decimated subscribers anyway, the buffer keeps the samples more compactly
+                self._merge_pending()
+        for subscription in dropped:
+            subscription.close()
+
+    def _get_decimation(self, resolution):
+        """Returns the StreamDecimation of a time resolution, None for other resolutions.
+        A new one decimates the buffered messages first, so the replayed history and the following
+        live messages are one stream. Called with the lock held.
+        """
+        if resolution is None or resolution.resolution is None:
+            return None
+        decimation = self._decimations.get(resolution)
+        if decimation is None:
+            decimation = StreamDecimation(resolution)
+            self._decimations[resolution] = decimation
+            for update in self._history:
+                try:
+                    # cached in the update for the subscribers of the resolution
+                    update.get_message(resolution, decimation)
+                except (TypeError, ValueError, KeyError):
+                    continue
+        return decimation
+
+    def _stop(self):
+        with self._lock:
+            subscribers = self._subscribers
+            self._subscribers = []
+            self._running = False
+        for subscription in subscribers:
+            subscription.close()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._subscribers:
+                    self._running = False
+                    # a new poller starts with a gap, free the samples until then
+                    if self._buffer is not None:
+                        self._buffer.clear()
+                        self._pending.clear()
+                    return
+            from_timestamp = self._timestamp
+            try:
+                r = self.client.post(
+                    "get_updates",
+                    data={"from_timestamp": from_timestamp},
+                )
+                update = StationUpdate(from_timestamp, r.content)
+                if self._needs_payload():
+                    # invalid responses end the streams here, not in the middle of publishing
+                    update.payload
+            except (requests.exceptions.RequestException, ValueError, KeyError):
+                # end all streams, the browsers reconnect and resume from their last event id
+                self._stop()
+                return
+            self._timestamp = update.timestamp
+            self._publish(update)
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+
+
+def format_message(payload, resolution=None, decimation=None):
+    """Formats a parsed get_updates response as server sent event message.
+
+    Args:
+        payload (dict): response of get_updates
+        resolution (ChartResolution, optional): decimation of the samples, None for full resolution.
+        decimation (StreamDecimation, optional): decimation of the stream the payload is sent in, replaces resolution.
+
+    Returns:
+        str: server sent event message.
+    """
+    if decimation is not None:
+        payload = dict(payload, updates=decimation.decimate_updates(payload["updates"]))
+    elif resolution is not None:
+        payload = dict(
+            payload, updates=decimate_updates(payload["updates"], resolution)
+        )
+    return format_event(payload["timestamp"], json.dumps(payload))
+
+
+def format_event(timestamp, data):
+    """Formats a JSON document as server sent event message with the station timestamp as id.
+
+    Args:
+        timestamp (float): station timestamp of the document
+        data (bytes): the JSON document, str works as well
+
+    Returns:
+        str: server sent event message.
+    """
+    return f"id:{json.dumps(timestamp)}\n{format_data(data)}"
+
+
+def format_data(data):
+    """Formats a JSON document as data field of a server sent event.
+
+    Args:
+        data (bytes): the JSON document, str works as well
+
+    Returns:
+        str: the data field, followed by the blank line that ends the event.
+    """
+    if isinstance(data, bytes):
+        data = data.decode()
+    if "\n" in data or "\r" in data:
+        # line breaks end the data field, outside of strings they are only whitespace in JSON
+        data = data.replace("\r", "").replace("\n", "")
+    return f"data:{data}\n\n"
+
+
+def get_payload(json_data_stream):
+    """Returns the response of get_updates with compacted updates, the payload of one message."""
+    json_data_stream["updates"] = compact_updates(json_data_stream["updates"])
+    return json_data_stream
+
+
+def compact_updates(updates):
+    """Drops devices and observables without new samples from an update payload.
+
+    Args:
+        updates (dict): ``{device: {observable: [[timestamp, value], ...]}}``
+
+    Returns:
+        dict: updates that contain at least one sample.
+    """
+    compacted = {}
+    for device, observables in updates.items():
+        observables = {
+            observable: samples
+            for observable, samples in observables.items()
+            if samples
+        }
+        if observables:
+            compacted[device] = observables
+    return compacted
+
+
+def parse_event_id(last_event_id):
+    """Converts a ``Last-Event-ID`` header into a station timestamp, None if it is missing or invalid."""
+    try:
+        return float(last_event_id)
+    except (TypeError, ValueError):
+        return None
+
+
+_hubs = {}
+_hubs_lock = threading.Lock()
+
+
+def get_station_update_hub(station_id, client, **kwargs):
+    """Returns the hub of a station, creating it on first use.
+
+    Args:
+        station_id (int): Database ID for the station.
+        client (StationClient): client for the API of the station.
+        **kwargs: passed to :class:`StationUpdateHub` when the hub is created.
+
+    Returns:
+        StationUpdateHub: hub for the station.
+    """
+    with _hubs_lock:
+        hub = _hubs.get(station_id)
+        if hub is None:
+            hub = StationUpdateHub(station_id, client, **kwargs)
+            _hubs[station_id] = hub
+        else:
+            hub.client = client
+        return hub
@@ -6,6 +6,226 @@ from .. import db
 from ..utils import ModelMixin
 
 
+class TelemetrySample(db.Model, ModelMixin):
+    """One sample of an observable of a station, recorded by the telemetry collector, see telemetry.py.
 
+    The table is append-only. Numeric samples are stored in ``value``, all others as text in ``value_as_str``.
+    """
 
+    __tablename__ = "telemetry_samples"
+    __table_args__ = (
+        ### serves the time range queries of one observable
+        db.Index(
+            "ix_telemetry_samples_channel_timestamp",
+            "station_id",
+            "device",
+            "observable",
+            "timestamp",
+        ),
+        ### serves the queries of the samples of a range of runs
+        db.Index("ix_telemetry_samples_run_timestamp", "run_id", "timestamp"),
+    )
 
+    id = db.Column(db.Integer, primary_key=True)
+    station_id = db.Column(db.Integer, db.ForeignKey("stations.id"), nullable=False)
+    ### current_experiment of the station when the sample was taken
+    experiment = db.Column(db.String(255), nullable=True)
+    ### run parsed from the experiment when the sample was recorded, no foreign key, the samples outlive deleted runs
+    run_id = db.Column(db.Integer, nullable=True)
+    device = db.Column(db.String(60), nullable=False)
+    observable = db.Column(db.String(60), nullable=False)
+    timestamp = db.Column(db.Float, nullable=False)
+    value = db.Column(db.Float, nullable=True)
+    value_as_str = db.Column(db.String(100), nullable=True)
+
+    @classmethod
+    def add_samples(cls, rows):
+        """Appends samples in one multi row insert.
+
+        Args:
+            rows (list): dicts with the columns of the table
+        """
+        if rows:
+            db.session.execute(db.insert(cls), rows)
+        db.session.commit()
+
+    @classmethod
+    def get_last_timestamps(cls, station_id):
+        """Returns the station timestamp of the newest recorded sample per observable of a station.
+
+        Args:
+            station_id (int): Database ID of the station
+
+        Returns:
+            dict: ``{(device, observable): timestamp}``
+        """
+        statement = (
+            db.select(cls.device, cls.observable, db.func.max(cls.timestamp))
+            .where(cls.station_id == station_id)
+            .group_by(cls.device, cls.observable)
+        )
+        return {
+            (device, observable): timestamp
+            for device, observable, timestamp in db.session.execute(statement)
+        }
+
+    @classmethod
+    def get_channels(cls, station_id, start=None, end=None):
+        """Lists the recorded observables of a station.
+
+        Args:
+            station_id (int): Database ID of the station
+            start (float, optional): station timestamp of the oldest sample to include
+            end (float, optional): station timestamp of the newest sample to include
+
+        Returns:
+            list: one dict per experiment, device and observable with the number of samples and their time range
+        """
+        statement = (
+            db.select(
+                cls.experiment,
+                cls.device,
+                cls.observable,
+                db.func.count(cls.id),
+                db.func.min(cls.timestamp),
+                db.func.max(cls.timestamp),
+            )
+            .where(cls.station_id == station_id)
+            .group_by(cls.experiment, cls.device, cls.observable)
+            .order_by(db.func.min(cls.timestamp), cls.device, cls.observable)
+        )
+        statement = cls._filter_time_range(statement, start, end)
+        return [
+            {
+                "experiment": experiment,
+                "device": device,
+                "observable": observable,
+                "samples": count,
+                "start": first,
+                "end": last,
+            }
+            for experiment, device, observable, count, first, last in db.session.execute(
+                statement
+            )
+        ]
+
+    @classmethod
+    def get_samples(
+        cls,
+        station_id,
+        device,
+        observable,
+        start=None,
+        end=None,
+        max_points=1000,
+        tiers=(1, 10, 60, 600, 3600),
+    ):
+        """Returns the samples of an observable in a time range. Ranges with more than max_points samples are
+        averaged in SQL over buckets of the smallest tier that keeps at most max_points buckets.
+
+        Args:
+            station_id (int): Database ID of the station
+            device (str): name of the device
+            observable (str): name of the observable
+            start (float, optional): station timestamp of the oldest sample to include
+            end (float, optional): station timestamp of the newest sample to include
+            max_points (int): maximum number of returned samples
+            tiers (tuple): bucket widths in seconds, ascending
+
+        Returns:
+            tuple: list of [timestamp, value] samples, bucket width in seconds (None for raw samples)
+        """
+        where = [
+            cls.station_id == station_id,
+            cls.device == device,
+            cls.observable == observable,
+        ]
+        count, first, last = db.session.execute(
+            cls._filter_time_range(
+                db.select(
+                    db.func.count(cls.id),
+                    db.func.min(cls.timestamp),
+                    db.func.max(cls.timestamp),
+                ).where(*where),
+                start,
+                end,
+            )
+        ).one()
+
+        if count <= max_points:
+            statement = (
+                db.select(cls.timestamp, cls.value, cls.value_as_str)
+                .where(*where)
+                .order_by(cls.timestamp)
+            )
+            samples = db.session.execute(cls._filter_time_range(statement, start, end))
+            return [
+                [timestamp, value if value is not None else value_as_str]
+                for timestamp, value, value_as_str in samples
+            ], None
+
+        # a range of span seconds touches at most span / width + 2 buckets
+        span = last - first
+        width = next(
+            (tier for tier in tiers if span / tier <= max_points - 2),
+            # wider than the largest tier
+            span / max(1, max_points - 2),
+        )
+        bucket = cls._get_bucket(width)
+        statement = (
+            db.select(db.func.min(cls.timestamp), db.func.avg(cls.value))
+            .where(*where, cls.value.is_not(None))
+            .group_by(bucket)
+            .order_by(bucket)
+        )
+        samples = db.session.execute(cls._filter_time_range(statement, start, end))
+        return [list(sample) for sample in samples], width
+
+    @classmethod
+    def get_run_samples(cls, runs, device=None, observable=None):
+        """Returns the samples recorded while the runs were executed.
+
+        Args:
+            runs (Select): query of the Database IDs of the runs, e.g. the runs of a stage
+            device (str, optional): only samples of this device
+            observable (str, optional): only samples of this observable
+
+        Returns:
+            list: (run_id, device, observable, timestamp, value) tuples ordered by run and timestamp, text values as str
+        """
+        statement = (
+            db.select(
+                cls.run_id,
+                cls.device,
+                cls.observable,
+                cls.timestamp,
+                cls.value,
+                cls.value_as_str,
+            )
+            # the IDs are selected by the database, the samples are looked up on the run index
+            .where(cls.run_id.in_(runs)).order_by(cls.run_id, cls.timestamp)
+        )
+        if device is not None:
+            statement = statement.where(cls.device == device)
+        if observable is not None:
+            statement = statement.where(cls.observable == observable)
+        return [
+            (*columns, value if value is not None else value_as_str)
+            for *columns, value, value_as_str in db.session.execute(statement)
+        ]
+
+    @classmethod
+    def _get_bucket(cls, width):
+        """Returns the number of the bucket of a sample as SQL expression."""
+        if db.engine.dialect.name == "sqlite":
+            # positive timestamps, the cast truncates like floor
+            return db.cast(cls.timestamp / width, db.Integer)
+        return db.func.floor(cls.timestamp / width)
+
+    @classmethod
+    def _filter_time_range(cls, statement, start, end):
+        if start is not None:
+            statement = statement.where(cls.timestamp >= start)
+        if end is not None:
+            statement = statement.where(cls.timestamp <= end)
+        return statement
@@ -0,0 +1,206 @@
+"""Recording of the station updates into the telemetry store.
+
+A :class:`TelemetryCollector` subscribes to the :class:`StationUpdateHub` of a
+station like a browser tab does, and appends every received sample to the
+``telemetry_samples`` table. Samples are written in batches. After a restart
+or a lost connection, the collector resumes after the newest stored sample of
+every observable.
+The collectors run in the process of ``flask collect-telemetry``.
+"""
+import threading
+import time
+
+from flask import current_app
+
+from .. import db
+from ..experiments.client import loads
+from ..experiments.models import ExperimentalStation, parse_run_id
+from .hub import get_station_update_hub
+from .models import TelemetrySample
+
+
+def get_sample_rows(station_id, payload, after=None):
+    """Converts an update payload into rows of the telemetry_samples table.
+
+    Args:
+        station_id (int): Database ID of the station
+        payload (dict): message of the update stream, ``{"current_experiment", "updates": {device: {observable: samples}}}``
+        after (dict, optional): ``{(device, observable): timestamp}``, samples of an observable up to its timestamp are already stored and skipped
+
+    Returns:
+        list: dicts with the columns of TelemetrySample
+    """
+    rows = []
+    experiment = payload.get("current_experiment")
+    run_id = parse_run_id(experiment)
+    for device, observables in payload["updates"].items():
+        for observable, samples in observables.items():
+            last_timestamp = after.get((device, observable)) if after else None
+            for timestamp, value in samples:
+                timestamp = float(timestamp)
+                if last_timestamp is not None and timestamp <= last_timestamp:
+                    continue
+                try:
+                    value, value_as_str = float(value), None
+                except (TypeError, ValueError):
+                    value, value_as_str = None, str(value)
+                rows.append(
+                    {
+                        "station_id": station_id,
+                        "experiment": experiment,
+                        "run_id": run_id,
+                        "device": device,
+                        "observable": observable,
+                        "timestamp": timestamp,
+                        "value": value,
+                        "value_as_str": value_as_str,
+                    }
+                )
+    return rows
+
+
+def parse_message(message):
+    """Returns the payload of a server sent event message of the hub."""
+    return loads(message.split("data:", 1)[1])
+
+
+class TelemetryCollector(object):
+    """Records the updates of one station in a background thread.
+
+    Args:
+        app (Flask): the app, the collector works in its app context
+        station_id (int): Database ID of the station
+        batch_size (int): number of samples written at once
+        flush_interval (float): seconds after which pending samples are written anyway
+        retry_interval (float): seconds between two attempts to reach an offline station
+    """
+
+    def __init__(
+        self, app, station_id, batch_size=500, flush_interval=5.0, retry_interval=10.0
+    ):
+        self.app = app
+        self.station_id = station_id
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_interval = retry_interval
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._hub = None
+        self._subscription = None
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self.run, name=f"telemetry-{self.station_id}", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Ends the subscription, pending samples are written before the thread ends."""
+        self._stopped.set()
+        with self._lock:
+            hub, subscription = self._hub, self._subscription
+        if subscription is not None:
+            hub.unsubscribe(subscription)
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def run(self):
+        with self.app.app_context():
+            while not self._stopped.is_set():
+                try:
+                    self.collect()
+                except Exception:
+                    current_app.logger.exception(
+                        f"Telemetry collection of station {self.station_id} failed."
+                    )
+                finally:
+                    # the session of the collector lives as long as the thread
+                    db.session.remove()
+                # the stream ended, the station went offline or the hub dropped the collector
+                self._stopped.wait(self.retry_interval)
+
+    def collect(self):
+        """Records the updates of the station until the stream ends."""
+        station = ExperimentalStation.get_station_by_id(self.station_id)
+        hub = get_station_update_hub(
+            self.station_id,
+            station.get_client(),
+            interval=current_app.config["STATION_UPDATE_INTERVAL"],
+            history_size=current_app.config["STATION_UPDATE_HISTORY"],
+            buffer_seconds=current_app.config["STATION_UPDATE_BUFFER"],
+        )
+        ### observables are resumed after their own newest sample, the stream starts after the oldest of them
+        last_timestamps = TelemetrySample.get_last_timestamps(self.station_id)
+        subscription = hub.subscribe(
+            min(last_timestamps.values()) if last_timestamps else None
+        )
+        with self._lock:
+            self._hub, self._subscription = hub, subscription
+        if self._stopped.is_set():
+            hub.unsubscribe(subscription)
+
+        rows = []
+        flushed_at = time.monotonic()
+        try:
+            messages = iter(subscription)
+            if subscription.needs_snapshot:
+                messages = _chain_snapshot(hub, subscription, messages)
+            for message in messages:
+                new_rows = get_sample_rows(
+                    self.station_id, parse_message(message), after=last_timestamps
+                )
+                for row in new_rows:
+                    key = (row["device"], row["observable"])
+                    last_timestamps[key] = max(
+                        row["timestamp"], last_timestamps.get(key, row["timestamp"])
+                    )
+                rows += new_rows
+                if len(rows) >= self.batch_size or (
+                    rows and time.monotonic() - flushed_at >= self.flush_interval
+                ):
+                    TelemetrySample.add_samples(rows)
+                    rows = []
+                    flushed_at = time.monotonic()
+        finally:
+            hub.unsubscribe(subscription)
+            if rows:
+                TelemetrySample.add_samples(rows)
+
+
+def _chain_snapshot(hub, subscription, messages):
+    """Yields the updates missed since the stored samples, then the live messages."""
+    yield hub.fetch_snapshot(
+        subscription.snapshot_from, until=subscription.snapshot_until
+    )
+    yield from messages
+
+
+def start_telemetry_collectors(app, station_ids=None):
+    """Starts a collector per station.
+
+    Args:
+        app (Flask): the app
+        station_ids (list, optional): Database IDs of the stations, by default all stations
+
+    Returns:
+        list: the started TelemetryCollectors
+    """
+    with app.app_context():
+        if station_ids is None:
+            station_ids = [
+                station.id for station in ExperimentalStation.get_all_stations()
+            ]
+    collectors = [
+        TelemetryCollector(
+            app,
+            station_id,
+            batch_size=app.config["TELEMETRY_BATCH_SIZE"],
+            flush_interval=app.config["TELEMETRY_FLUSH_INTERVAL"],
+            retry_interval=app.config["TELEMETRY_RETRY_INTERVAL"],
+        )
+        for station_id in station_ids
+    ]
+    for collector in collectors:
+        collector.start()
+    return collectors
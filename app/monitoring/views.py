@@ -9,12 +9,14 @@ from flask import (
     request,
     app,
     abort,
+    current_app,
     Response,
 )
 import time
 from flask_login import login_user, logout_user, login_required, current_user
 from app.auth.models import User
 from app.experiments.models import ExperimentalStation
+from app.experiments.client import get_station_client, loads
 import requests
 from requests.auth import HTTPBasicAuth
 from werkzeug.utils import secure_filename
@@ -26,6 +28,10 @@ from datetime import datetime
 from werkzeug.exceptions import HTTPException
 from requests.exceptions import HTTPError
 import os.path, time
+from concurrent.futures import ThreadPoolExecutor, wait
+from .decimation import parse_chart_resolution
+from .hub import format_data, get_station_update_hub, parse_event_id
+from .models import TelemetrySample
 
 
 monitoring_blueprint = Blueprint("monitoring", __name__)
@@ -38,44 +44,58 @@ def getDevicePlotData(deviceID, plot):
 
 @monitoring_blueprint.route("/device/chart-data/<int:deviceID>", methods=["GET"])
 def chart_data(deviceID):
-    ### Initial Timestamp is none, to get all updates from start of the experiment
-    timestamp = None
-    # build request url
-    request_url = (
-        f"http://{ExperimentalStation.get_address_address(deviceID)}/api/get_updates"
+    """returns a server sent event stream with the updates of a station. All clients watching the same station share one poller, see hub.py.
+    Each event only contains the samples since the previous one, a reconnecting client resumes after its Last-Event-ID.
+    The samples can be decimated on the server with the query arguments points, resolution and method, see decimation.py.
+    """
+    hub = get_station_update_hub(
+        deviceID,
+        ExperimentalStation.get_station_by_id(deviceID).get_client(),
+        interval=current_app.config["STATION_UPDATE_INTERVAL"],
+        history_size=current_app.config["STATION_UPDATE_HISTORY"],
+        buffer_seconds=current_app.config["STATION_UPDATE_BUFFER"],
     )
+    ### Without Last-Event-ID the client gets all updates from the start of the experiment
+    last_event_id = parse_event_id(request.headers.get("Last-Event-ID"))
+    ### ?points= and/or ?resolution= decimate the samples per observable, without them the samples are sent in full resolution (e.g. for export)
+    try:
+        resolution = parse_chart_resolution(
+            request.args, default_method=current_app.config["CHART_DATA_METHOD"]
+        )
+    except ValueError as e:
+        abort(400, str(e))
 
-    def get_updates(timestamp):
-        while True:
-            try:
-                r = requests.post(
-                    request_url,
-                    data={"from_timestamp": timestamp},
+    def get_updates():
+        subscription = hub.subscribe(last_event_id, resolution)
+        try:
+            ### the buffer of a running poller does not reach back far enough, fetch the missed updates once
+            if subscription.needs_snapshot:
+                yield hub.fetch_snapshot(
+                    subscription.snapshot_from,
+                    resolution,
+                    until=subscription.snapshot_until,
                 )
+            for message in subscription:
+                yield message
+        except (requests.exceptions.RequestException, ValueError):
+            pass
+        finally:
+            hub.unsubscribe(subscription)
 
-                json_data_stream = json.loads(r.content.decode())
-                json_dump = json.dumps(json_data_stream)
-                timestamp = json_data_stream["timestamp"]
-                yield f"data:{json_dump}\n\n"
-                time.sleep(1)
-            except requests.exceptions.RequestException as e:
-                break
-
-    return Response(get_updates(timestamp), mimetype="text/event-stream")
+    return Response(get_updates(), mimetype="text/event-stream")
 
 
 @monitoring_blueprint.route("/device/experiment-tables/<int:deviceID>")
 def experiment_table_data(deviceID):
     """returns generator for experiment tables and crawls for updates in the station"""
 
-    request_url = f"http://{ExperimentalStation.get_address_address(deviceID)}/api/station_run_tables"
+    ### the run tables are shared with the parameter lookups of the plots, see RunTablesCache
+    run_tables = ExperimentalStation.get_station_by_id(deviceID).get_client().run_tables
 
     def get_updates():
         while True:
-            r = requests.post(request_url)
-            json_data_stream = json.loads(r.content.decode())
-            json_dump = json.dumps(json_data_stream)
-            yield f"data:{json_dump}\n\n"
+            ### the response of the station is forwarded as it is, it was parsed once by the cache
+            yield format_data(run_tables.get_content())
             time.sleep(10)
 
     return Response(get_updates(), mimetype="text/event-stream")
@@ -84,20 +104,25 @@ def experiment_table_data(deviceID):
 @monitoring_blueprint.route("/overview", methods=["GET", "POST"])
 def deviceOverview():
     """Generates Device Overview, requests deviece list from API call. Uses experiments database information for list of devices and  adresses.
+    The stations are requested concurrently, stations that do not answer within STATION_OVERVIEW_TIMEOUT are shown as offline.
 
     Returns:
         render_template: renders a page for the user with Device information overview.
     """
+    timeout = current_app.config["STATION_OVERVIEW_TIMEOUT"]
 
-    def _helper(station):
-        request_url = (
-            f"http://{station.get_address_address(station.id)}/api/station_overview"
-        )
+    offline_station_dict = {
+        "status": "offline",
+        "running_experiment_name": "offline",
+        "total_experiments_queued": "offline",
+        "current_run_number": "offline",
+    }
 
+    def _helper(client):
         try:
-            r = requests.post(request_url)
+            r = client.post("station_overview", timeout=timeout)
 
-            json_data = json.loads(r.content.decode())
+            json_data = loads(r.content)
 
             if json_data["status"].lower() == "idle":
                 station_dict = {
@@ -136,22 +161,35 @@ def deviceOverview():
                 }
             return station_dict
         except requests.exceptions.RequestException as e:
-            station_dict = {
-                "status": "offline",
-                "running_experiment_name": "offline",
-                "total_experiments_queued": "offline",
-                "current_run_number": "offline",
-            }
-            return station_dict
+            return offline_station_dict
 
+    stations = ExperimentalStation.get_all_stations()
     device_details_list = []
 
-    for station in ExperimentalStation.get_all_stations():
-        station_info = station.__dict__
-        # merge the additonal infos from the request call into station info
-        station_info = station_info | _helper(station)
+    if stations:
+        # the worker threads only get the station clients, the database is not touched outside the request
+        executor = ThreadPoolExecutor(
+            max_workers=min(
+                len(stations), current_app.config["STATION_OVERVIEW_WORKERS"]
+            )
+        )
+        futures = [
+            executor.submit(_helper, station.get_client()) for station in stations
+        ]
+        wait(futures, timeout=timeout)
+        # do not wait for stations that missed the deadline
+        executor.shutdown(wait=False, cancel_futures=True)
+
+        for station, future in zip(stations, futures):
+            station_info = station.__dict__
+            if future.done() and not future.cancelled() and future.exception() is None:
+                station_overview = future.result()
+            else:
+                station_overview = offline_station_dict
+            # merge the additonal infos from the request call into station info
+            station_info = station_info | station_overview
 
-        device_details_list.append(station_info)
+            device_details_list.append(station_info)
 
     return render_template("monitoring/overview.html", devices=device_details_list)
 
@@ -267,8 +305,7 @@ def get_active_experiment_parameter_value(station_id):
     "/api/start/<string:station_address>", methods=["GET", "POST"]
 )
 def api_start(station_address):
-    request_url = f"http://{station_address}/api/start"
-    requests.post(request_url)
+    get_station_client(station_address).post("start")
     return "", 204
 
 
@@ -276,8 +313,7 @@ def api_start(station_address):
     "/api/stop/<string:station_address>", methods=["GET", "POST"]
 )
 def api_stop(station_address):
-    request_url = f"http://{station_address}/api/stop"
-    requests.post(request_url)
+    get_station_client(station_address).post("stop")
     return "", 204
 
 
@@ -332,13 +368,13 @@ def get_station_information(station_id, endpoint, *args, **kwargs):
         dict: Dictonary from endpoint json response data.
     """
 
-    # get corresponding  Adress for station_ID
-    request_url_base = get_station_address(station_id)
+    # get the client for the station_ID
+    client = ExperimentalStation.get_station_by_id(station_id).get_client()
 
     # add requested endpoint
-    request_url = f"http://{request_url_base}/api/{endpoint}"
+    request_url = client.url(endpoint)
     try:
-        r = requests.get(request_url)
+        r = client.get(endpoint)
         r.raise_for_status()
         return r
     except HTTPError as http_err:
@@ -355,6 +391,79 @@ def get_station_information(station_id, endpoint, *args, **kwargs):
         abort(500)
 
 
+@monitoring_blueprint.route(
+    "/api/monitoring/telemetry/<int:station_id>/channels", methods=["GET"]
+)
+def api_telemetry_channels(station_id):
+    """Lists the observables of a station recorded in the telemetry store.
+    The optional query arguments start and end (station timestamps) limit the time range.
+    """
+    ExperimentalStation.get_station_by_id(station_id)
+    try:
+        start, end = get_time_range(request.args)
+    except ValueError as e:
+        abort(400, str(e))
+    return jsonify(TelemetrySample.get_channels(station_id, start, end)), 200
+
+
+@monitoring_blueprint.route(
+    "/api/monitoring/telemetry/<int:station_id>", methods=["GET"]
+)
+def api_telemetry_samples(station_id):
+    """Returns the recorded samples of one observable of a station.
+    Query arguments: device and observable (required), start and end (station timestamps) and points.
+    Ranges with more than points samples are averaged over buckets, the bucket width in seconds is returned as well.
+    """
+    ExperimentalStation.get_station_by_id(station_id)
+    device = request.args.get("device")
+    observable = request.args.get("observable")
+    if not device or not observable:
+        abort(400, "device and observable are required.")
+    try:
+        start, end = get_time_range(request.args)
+        points = int(
+            request.args.get("points") or current_app.config["TELEMETRY_MAX_POINTS"]
+        )
+    except ValueError as e:
+        abort(400, str(e))
+    if points < 3:
+        abort(400, "At least three points are needed.")
+    samples, width = TelemetrySample.get_samples(
+        station_id,
+        device,
+        observable,
+        start,
+        end,
+        max_points=points,
+        tiers=current_app.config["TELEMETRY_TIERS"],
+    )
+    return (
+        jsonify(
+            {
+                "device": device,
+                "observable": observable,
+                "bucket_width": width,
+                "samples": samples,
+            }
+        ),
+        200,
+    )
+
+
+def get_time_range(args):
+    """Reads the start and end station timestamps of a query, None if not given.
+
+    Raises:
+        ValueError: if a timestamp is not a number
+    """
+    start = args.get("start")
+    end = args.get("end")
+    return (
+        float(start) if start else None,
+        float(end) if end else None,
+    )
+
+
 @monitoring_blueprint.route("/api/monitoring/get_station_overview/<int:station_id>")
 def api_get_station_overview(station_id):
     # add endpoint for overview
@@ -365,10 +474,7 @@ def api_get_station_overview(station_id):
 
 @monitoring_blueprint.route("/api/monitoring/get_station_details/<int:station_id>")
 def api_get_station_details(station_id):
-    # get corresponding Adress for station_ID
-    request_url_base = get_station_address(station_id)
-
     # add endpoint for overview
     endpoint = "station_details"
 
-    return get_station_information(request_url_base, endpoint)
+    return get_station_information(station_id, endpoint)
@@ -5,12 +5,13 @@ export class Plot_manager {
     this.source = new EventSource(url);
     console.log(experiment_url);
     this.experiment_url = experiment_url;
-    this.charts = [];
+    this.charts = new Map();
     this.generate_DOM_header();
     this.source.onmessage = (event) => this.on_source_event_function(event);
   }
 
   on_source_event_function(event) {
+    // Every event only carries the samples since the previous one, the EventSource resumes after its Last-Event-ID on reconnect
     const data = JSON.parse(event.data);
 
     // If first message switch true, set current experiment
@@ -20,42 +21,29 @@ export class Plot_manager {
       this.source_first_message = false;
     }
 
-    // If the experiment remains, update or create plots, otherwise destroy plots
-    if (this.current_experiment === data.current_experiment) {
-      this.create_or_update_plots(data);
-    } else {
-      if (this.charts.length > 0) {
-        for (const device of this.charts) {
-          for (const plot of device.plots) {
-            plot.plot.on_delete();
-          }
+    // If the experiment changes, destroy the plots of the previous one
+    if (this.current_experiment !== data.current_experiment) {
+      for (const device_plots of this.charts.values()) {
+        for (const plot of device_plots.values()) {
+          plot.on_delete();
         }
-        // empty charts object list
-        this.charts = [];
-        // set new current experiment and create new plots from data.update
-        this.current_experiment = data.current_experiment;
-        this.set_current_experiment(this.current_experiment);
-        this.create_or_update_plots(data);
       }
+      // empty charts
+      this.charts = new Map();
+      // set new current experiment and create new plots from data.update
+      this.current_experiment = data.current_experiment;
+      this.set_current_experiment(this.current_experiment);
     }
+    this.create_or_update_plots(data);
   }
 
   create_or_update_plots(data) {
-    // Iterate over all devices in update
+    // Iterate over the devices in the update, this.charts maps device -> observable -> plot
     for (const [device, device_values] of Object.entries(data.updates)) {
-      // check if device is allready registerd in decive object list
-      const charts_index = this.charts.findIndex((device_group) => {
-        return device_group.device === device;
-      });
-
-      // check will return -1 if not found, in that case, prepare new entry for new device
-      if (charts_index == -1) {
-        var device_group = {
-          device: device,
-          plots: [],
-        };
-        this.charts.push(device_group);
+      if (!this.charts.has(device)) {
+        this.charts.set(device, new Map());
       }
+      const device_plots = this.charts.get(device);
 
       // Iterate over all observabes for device
       for (const [observable, observable_values] of Object.entries(
@@ -66,33 +54,16 @@ export class Plot_manager {
           continue;
         }
 
-        if (charts_index >= 0) {
-          // console.log(this.charts[charts_index])
-          const plot_index = this.charts[charts_index].plots.findIndex(
-            (plot) => {
-              return plot.observable === observable;
-            }
+        const plot = device_plots.get(observable);
+        if (plot !== undefined) {
+          plot.update_data_storage(observable_values);
+          plot.update_plot_data();
+        } else {
+          const device_div = this.append_device_to_dom(device);
+          device_plots.set(
+            observable,
+            this.create_plot(device, observable, observable_values, device_div)
           );
-
-          if (plot_index > -1) {
-            this.charts[charts_index].plots[
-              plot_index
-            ].plot.update_data_storage(observable_values);
-            this.charts[charts_index].plots[plot_index].plot.update_plot_data();
-          } else {
-            var device_div = this.append_device_to_dom(device);
-
-            var charts_dict = {
-              observable: observable,
-              plot: this.create_plot(
-                device,
-                observable,
-                observable_values,
-                device_div
-              ),
-            };
-            this.charts[charts_index].plots.push(charts_dict);
-          }
         }
       }
     }
@@ -1,26 +1,109 @@
-from msilib.schema import Error
+from contextlib import contextmanager
+from functools import partial
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
 from . import db
 
+### key in the info dict of the session, counts the open db_batch blocks
+BATCH_DEPTH = "batch_depth"
+
+
+def in_batch():
+    """Returns True inside a db_batch block of the current session."""
+    return db.session.info.get(BATCH_DEPTH, 0) > 0
+
+
+def commit():
+    """Commits the session, inside a db_batch block the changes are only flushed and committed at the end of the batch."""
+    if in_batch():
+        db.session.flush()
+    else:
+        db.session.commit()
+
+
+@contextmanager
+def db_batch():
+    """Unit of work, all saves and deletes in the block are committed in one transaction.
+    If the block raises, everything is rolled back and the error is raised again. Nested blocks join the outer one.
+
+    Example:
+        with db_batch():
+            run.save()
+            for value in values:
+                value.save()
+
+    Yields:
+        Session: the session of the app
+    """
+    session = db.session
+    depth = session.info.get(BATCH_DEPTH, 0)
+    session.info[BATCH_DEPTH] = depth + 1
+    try:
+        yield session
+        if depth == 0:
+            session.commit()
+    except Exception:
+        if depth == 0:
+            session.rollback()
+        raise
+    finally:
+        session.info[BATCH_DEPTH] = depth
+
 
 class ModelMixin(object):
     def save(self):
-        # Save this model to the database.
+        # Save this model to the database, inside db_batch it is only flushed.
         try:
             db.session.add(self)
-            db.session.commit()
-        except:
-            db.session.rollback()
+            commit()
+        except Exception:
+            if not in_batch():
+                db.session.rollback()
+            raise
         return self
 
     def delete(self):
         try:
             db.session.delete(self)
-            db.session.commit()
-        except Exception as e:
-            db.session.rollback()
-            return Error
-
+            commit()
+        except Exception:
+            if not in_batch():
+                db.session.rollback()
+            raise
         return self
 
 
+def get_engine_options(config):
+    """Returns SQLALCHEMY_ENGINE_OPTIONS of the app, with the SERVER_ENGINE_OPTIONS for server databases.
+
+    Args:
+        config (dict): config of the app
+
+    Returns:
+        dict: engine options, unchanged for SQLite
+    """
+    options = dict(config.get("SQLALCHEMY_ENGINE_OPTIONS", {}))
+    if make_url(config["SQLALCHEMY_DATABASE_URI"]).get_backend_name() == "sqlite":
+        return options
+    return {**config.get("SERVER_ENGINE_OPTIONS", {}), **options}
+
+
+def set_sqlite_pragmas(pragmas, dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+def register_sqlite_pragmas(app):
+    """Sets the SQLITE_PRAGMAS of the app on every new connection of its engine, needs an app context."""
+    engine = db.engine
+    if engine.dialect.name == "sqlite" and app.config.get("SQLITE_PRAGMAS"):
+        event.listen(
+            engine, "connect", partial(set_sqlite_pragmas, app.config["SQLITE_PRAGMAS"])
+        )
+
+
 # Add your own utility classes and functions here.
@@ -20,6 +20,57 @@ class BaseConfig(object):
     USER_ENABLE_USERNAME = True  # Enable username authentication
     USER_REQUIRE_RETYPE_PASSWORD = False  # Simplify register form
     USER_EMAIL_SENDER_EMAIL = ""
+    # HTTP client for the station API, one connection pool per station.
+    STATION_CONNECT_TIMEOUT = 3.05  # seconds
+    STATION_READ_TIMEOUT = 10.0  # seconds
+    STATION_RETRIES = 2
+    STATION_RETRY_BACKOFF = 0.3
+    STATION_POOL_SIZE = 4  # simultaneous connections per station
+    STATION_RUN_TABLES_TTL = 2.0  # seconds a station_run_tables response is reused
+    # Polling of the station update stream, shared by all chart-data clients of a station.
+    STATION_UPDATE_INTERVAL = 1.0  # seconds between two get_updates calls
+    STATION_UPDATE_HISTORY = 600  # events kept for reconnecting clients
+    STATION_UPDATE_BUFFER = 3600.0  # seconds of samples kept for snapshots, 0 disables it
+    # Samples per observable and event sent to the plots of the station page, decimated on the server.
+    CHART_DATA_POINTS = 200
+    # Seconds shown by the plots, live samples are sent at one per CHART_DATA_WINDOW / CHART_DATA_POINTS seconds.
+    CHART_DATA_WINDOW = 600.0
+    CHART_DATA_METHOD = "lttb"  # lttb keeps the shape of a line, minmax the extremes
+    # Updates of the stations are recorded in the telemetry_samples table by `flask collect-telemetry`.
+    TELEMETRY_BATCH_SIZE = 500  # samples written at once
+    TELEMETRY_FLUSH_INTERVAL = (
+        5.0  # seconds after which pending samples are written anyway
+    )
+    TELEMETRY_RETRY_INTERVAL = (
+        10.0  # seconds between two attempts to reach an offline station
+    )
+    TELEMETRY_MAX_POINTS = (
+        1000  # samples per query, longer ranges are averaged over buckets
+    )
+    TELEMETRY_TIERS = (1, 10, 60, 600, 3600)  # bucket widths in seconds
+    # Stations on the overview page are requested concurrently.
+    STATION_OVERVIEW_TIMEOUT = 3.0  # seconds until a station is shown as offline
+    STATION_OVERVIEW_WORKERS = 16
+    # Runs posted to add_experiment at the same time. 1 keeps the order of the runs in the queue of
+    # the station, more workers are faster but the station queues the runs in the order they arrive.
+    STATION_DISPATCH_WORKERS = 1
+    # Experiment types of all stations are requested concurrently when the routines are synchronised.
+    STATION_SYNC_WORKERS = 8
+    # Background jobs for dispatch, routine synchronisation, import and export.
+    JOB_WORKERS = 2  # jobs executed at the same time per process
+    JOB_EVENTS_INTERVAL = 0.5  # seconds between two checks of the job progress stream
+    JOB_EXPORT_TTL = 24 * 3600  # seconds an exported file is kept for download
+    # Logged in users are loaded with their roles and groups once and reused for the following requests.
+    USER_CACHE_TTL = 30  # seconds, 0 loads the user on every request
+    # Pragmas set on every new SQLite connection, see app/utils.py and ProductionConfig.
+    SQLITE_PRAGMAS = {}
+    # Engine options for server databases (PostgreSQL, MySQL), SQLALCHEMY_ENGINE_OPTIONS takes precedence.
+    SERVER_ENGINE_OPTIONS = {
+        "pool_size": 10,
+        "max_overflow": 20,
+        "pool_pre_ping": True,  # replace connections closed by the server
+        "pool_recycle": 1800,  # seconds
+    }
 
     @staticmethod
     def configure(app):
@@ -42,6 +93,8 @@ class TestingConfig(BaseConfig):
 
     TESTING = True
     PRESERVE_CONTEXT_ON_EXCEPTION = False
+    # the tests share one session with the requests, cached users would overwrite its changes
+    USER_CACHE_TTL = 0
     SQLALCHEMY_DATABASE_URI = os.environ.get(
         "TEST_DATABASE_URL",
         "sqlite:///" + os.path.join(base_dir, "database-test.sqlite3"),
@@ -55,6 +108,13 @@ class ProductionConfig(BaseConfig):
         "DATABASE_URL", "sqlite:///" + os.path.join(base_dir, "database.sqlite3")
     )
     WTF_CSRF_ENABLED = True
+    SQLITE_PRAGMAS = {
+        "journal_mode": "WAL",  # readers do not block the writer
+        "synchronous": "NORMAL",  # safe with WAL, syncs at checkpoints only
+        "busy_timeout": 10000,  # ms a connection waits for a lock before "database is locked"
+        "cache_size": -32000,  # page cache per connection, negative values are KiB
+        "mmap_size": 268435456,  # bytes of the database file read via memory mapping
+    }
 
 
 config = dict(
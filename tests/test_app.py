@@ -2,6 +2,8 @@ from unittest import TestCase, main
 
 import os
 import sys
+import tempfile
+from functools import partial
 
 ### Add the parent directory to the path, otherwise the import of the app module will fail ###
 topdir = os.path.join(os.path.dirname(__file__), "..")
@@ -9,7 +11,12 @@ sys.path.append(topdir)
 
 
 from flask import Flask
+from sqlalchemy import create_engine, event
+
 from app import create_app, db
+from app.auth.models import Role, User, UserCache
+from app.utils import get_engine_options, set_sqlite_pragmas
+from config import ProductionConfig
 
 
 app = create_app(environment="testing")
@@ -109,6 +116,74 @@ class TestApp(TestCase):
         response = self.login("sam")
         self.assertIn(b"Login successful.", response.data)
 
+    def test_user_cache(self):
+        user = User(username="carol", email="carol@example.com", password="password")
+        user.roles = [Role.get_admin_role()]
+        user.save()
+        user_id = user.id
+        cache = app.extensions["user_cache"] = UserCache(ttl=60)
+        self.addCleanup(app.extensions.pop, "user_cache")
+        statements = []
+
+        def count(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        def load_user():
+            db.session.remove()
+            event.listen(db.engine, "before_cursor_execute", count)
+            try:
+                user = cache.get_user(user_id)
+                self.assertTrue(user.has_roles("admin"))
+                self.assertEqual(user.get_groups_names(), [])
+            finally:
+                event.remove(db.engine, "before_cursor_execute", count)
+            return user
+
+        load_user()
+        # user, roles and groups are loaded in one query, then taken from the cache
+        self.assertEqual(len(statements), 1)
+        self.assertFalse(load_user().is_admin)
+        self.assertEqual(len(statements), 1)
+
+        User.promote_user(user_id)
+        self.assertTrue(load_user().is_admin)
+        self.assertEqual(len(statements), 2)
+
+    def test_sqlite_pragmas(self):
+        # only production databases are switched to WAL
+        self.assertEqual(app.config["SQLITE_PRAGMAS"], {})
+        with tempfile.TemporaryDirectory() as directory:
+            engine = create_engine(
+                "sqlite:///" + os.path.join(directory, "database.sqlite3")
+            )
+            event.listen(
+                engine,
+                "connect",
+                partial(set_sqlite_pragmas, ProductionConfig.SQLITE_PRAGMAS),
+            )
+            with engine.connect() as connection:
+                pragmas = {
+                    name: connection.exec_driver_sql(f"PRAGMA {name}").scalar()
+                    for name in ["journal_mode", "synchronous", "busy_timeout"]
+                }
+            engine.dispose()
+        # synchronous 1 is NORMAL
+        self.assertEqual(
+            pragmas, {"journal_mode": "wal", "synchronous": 1, "busy_timeout": 10000}
+        )
+
+    def test_server_engine_options(self):
+        config = {
+            "SQLALCHEMY_DATABASE_URI": "postgresql://labs@localhost/labs",
+            "SQLALCHEMY_ENGINE_OPTIONS": {"pool_size": 5},
+            "SERVER_ENGINE_OPTIONS": {"pool_size": 10, "pool_pre_ping": True},
+        }
+        self.assertEqual(
+            get_engine_options(config), {"pool_size": 5, "pool_pre_ping": True}
+        )
+        config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///database.sqlite3"
+        self.assertEqual(get_engine_options(config), {"pool_size": 5})
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,796 @@
+from unittest import TestCase, main, mock
+
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+
+### Add the parent directory to the path, otherwise the import of the app module will fail ###
+topdir = os.path.join(os.path.dirname(__file__), "..")
+sys.path.append(topdir)
+
+
+import pandas as pd
+import requests
+from sqlalchemy import event, text
+from sqlalchemy.exc import IntegrityError
+
+from app import create_app, db
+from app.auth.models import User
+from app.experiments.client import RunTablesCache
+from app.experiments.models import (
+    ExperimentalDesign,
+    ExperimentalRoutines,
+    ExperimentalRuns,
+    ExperimentalStation,
+    Parameters,
+    Stage,
+    Values,
+    cast_value_by_dtype_name,
+    get_value_as_float,
+    parse_run_id,
+)
+from app.monitoring.models import TelemetrySample
+from app.monitoring.telemetry import get_sample_rows
+from app.utils import db_batch
+
+
+app = create_app(environment="testing")
+
+
+RUN_TABLES = [
+    {"state": "Finished", "type": "electrolysis", "parameters": {"current": 1.0}},
+    {"state": "Running", "type": "electrolysis", "parameters": {"current": 2.0}},
+]
+
+
+class TestRunTablesCache(TestCase):
+    def setUp(self):
+        self.client = mock.Mock()
+        self.release = threading.Event()
+
+        def post(endpoint, **kwargs):
+            self.release.wait(2.0)
+            response = mock.Mock()
+            response.content = json.dumps(RUN_TABLES).encode()
+            return response
+
+        self.client.post.side_effect = post
+
+    def test_concurrent_callers_share_one_request(self):
+        cache = RunTablesCache(self.client, ttl=60)
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(cache.get_run_tables()))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        self.release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [RUN_TABLES] * 5)
+        self.client.post.assert_called_once_with("station_run_tables")
+        # served from the cache until the ttl expires
+        self.assertEqual(cache.get_active_parameters(), {"current": 2.0})
+        # the response is kept for forwarding it unchanged
+        self.assertEqual(cache.get_content(), json.dumps(RUN_TABLES).encode())
+        self.assertEqual(self.client.post.call_count, 1)
+
+    def test_expired_cache_is_refreshed(self):
+        self.release.set()
+        cache = RunTablesCache(self.client, ttl=0)
+        cache.get_run_tables()
+        cache.get_run_tables()
+        self.assertEqual(self.client.post.call_count, 2)
+
+    def test_error_is_not_cached(self):
+        self.release.set()
+        cache = RunTablesCache(self.client, ttl=60)
+        self.client.post.side_effect = ValueError("station offline")
+        with self.assertRaises(ValueError):
+            cache.get_run_tables()
+        self.client.post.side_effect = None
+        self.client.post.return_value.content = b"[]"
+        self.assertEqual(cache.get_run_tables(), [])
+        self.assertIsNone(cache.get_active_parameters())
+
+
+class StageTestCase(TestCase):
+    """Creates a stage with the routine parameters temperature (float), cycles (int, static) and solvent (str)."""
+
+    def setUp(self):
+        self.client = app.test_client()
+        self.app_ctx = app.app_context()
+        self.app_ctx.push()
+        db.create_all()
+        user = User(username="alice", email="alice@example.com", password="password")
+        station = ExperimentalStation(
+            name="station", address="station:11123", api_key="key", location="lab"
+        )
+        self.parameters = [
+            Parameters(name="temperature", unit="C", data_type="float"),
+            Parameters(
+                name="cycles",
+                unit="-",
+                data_type="int",
+                static_param=True,
+                default_value=3.0,
+            ),
+            Parameters(name="solvent", unit="-", data_type="str"),
+        ]
+        routine = ExperimentalRoutines(name="electrolysis", parameters=self.parameters)
+        station.experiments_available.append(routine)
+        db.session.add_all([user, station, routine])
+        db.session.flush()
+        design = ExperimentalDesign(
+            name="design", user_id=user.id, station_id=station.id
+        )
+        db.session.add(design)
+        db.session.flush()
+        self.stage = Stage(
+            name="stage",
+            user_id=user.id,
+            experimental_Routine_id=routine.id,
+            experimental_design_id=design.id,
+        )
+        db.session.add(self.stage)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_ctx.pop()
+
+    def add_runs(self, rows):
+        df = pd.DataFrame(rows, columns=["temperature", "cycles", "solvent"])
+        return self.stage.add_or_update_runs_from_dataframe(df, dynamic_only=False)
+
+
+class TestStageImport(StageTestCase):
+    def test_add_and_update_runs(self):
+        self.assertEqual(self.add_runs([[20.5, 3, "MeCN"], [30.0, 3, "MeOH"]]), (2, 0))
+        runs = ExperimentalRuns.query.filter_by(stage_id=self.stage.id).all()
+        self.assertEqual(len(runs), 2)
+        self.assertEqual(Values.query.count(), 6)
+        self.assertEqual(
+            runs[0].get_parameter_value_pairs_in_run(),
+            [("temperature", 20.5), ("cycles", 3), ("solvent", "MeCN")],
+        )
+
+        df = pd.DataFrame(
+            {
+                "run_id": [runs[1].id, ""],
+                "temperature": [35.0, 40.0],
+                "cycles": [3, 3],
+                "solvent": ["EtOH", "H2O"],
+            }
+        )
+        self.assertEqual(
+            self.stage.add_or_update_runs_from_dataframe(df, dynamic_only=False),
+            (1, 1),
+        )
+        self.assertEqual(Values.query.count(), 9)
+        db.session.expire_all()
+        self.assertEqual(
+            dict(runs[1].get_parameter_value_pairs_in_run())["solvent"], "EtOH"
+        )
+
+    def test_dynamic_only(self):
+        df = pd.DataFrame({"temperature": [20.0], "solvent": ["MeCN"]})
+        self.assertEqual(
+            self.stage.add_or_update_runs_from_dataframe(df, dynamic_only=True),
+            (1, 0),
+        )
+        self.assertEqual(Values.query.count(), 2)
+
+    def test_invalid_frames_write_nothing(self):
+        invalid_frames = [
+            # missing value
+            pd.DataFrame({"temperature": [None], "cycles": [3], "solvent": ["MeCN"]}),
+            # unknown parameter
+            pd.DataFrame({"pressure": [1.0], "cycles": [3], "solvent": ["MeCN"]}),
+            # missing parameter
+            pd.DataFrame({"temperature": [1.0], "solvent": ["MeCN"]}),
+            # run of another stage
+            pd.DataFrame(
+                {"run_id": [999], "temperature": [1.0], "cycles": [3], "solvent": ["A"]}
+            ),
+        ]
+        for df in invalid_frames:
+            with self.assertRaises(ValueError):
+                self.stage.add_or_update_runs_from_dataframe(df, dynamic_only=False)
+        self.assertEqual(ExperimentalRuns.query.count(), 0)
+        self.assertEqual(Values.query.count(), 0)
+
+
+class TestTypedValues(StageTestCase):
+    def test_numeric_values_are_queried_in_sql(self):
+        self.add_runs([[20.5, 3, "MeCN"], [35.0, 3, "MeOH"], [30.0, 3, "H2O"]])
+        run_ids = [run.id for run in ExperimentalRuns.query.order_by("id")]
+        temperature, cycles, solvent = self.parameters
+        self.assertEqual(
+            Values.query.filter_by(parameter_id=solvent.id).first().value_as_float,
+            None,
+        )
+        self.assertEqual(
+            self.stage.get_run_ids_by_parameter_range(temperature.id, minimum=25.0),
+            [run_ids[2], run_ids[1]],
+        )
+        self.assertEqual(
+            self.stage.get_run_ids_by_parameter_range(temperature.id, maximum=30.0),
+            [run_ids[0], run_ids[2]],
+        )
+        self.assertEqual(
+            self.stage.get_parameter_statistics(temperature.id),
+            {"count": 3, "min": 20.5, "max": 35.0, "mean": 28.5},
+        )
+
+        Values.query.filter_by(parameter_id=temperature.id).first().update_value(40)
+        self.assertEqual(
+            self.stage.get_parameter_statistics(temperature.id)["max"], 40.0
+        )
+
+        # a text parameter becomes numeric
+        solvent.update_parameter(
+            solvent.id, solvent.name, solvent.unit, None, "float", False
+        )
+        self.assertEqual(self.stage.get_parameter_statistics(solvent.id)["count"], 0)
+        cycles.update_parameter(cycles.id, cycles.name, cycles.unit, None, "str", True)
+        self.assertEqual(self.stage.get_parameter_statistics(cycles.id)["count"], 0)
+
+    def test_bool_values(self):
+        for value_as_str, expected in [
+            ("False", 0.0),
+            ("0", 0.0),
+            ("false", 0.0),
+            ("True", 1.0),
+            ("1", 1.0),
+            ("maybe", None),
+        ]:
+            self.assertEqual(get_value_as_float("bool", value_as_str), expected)
+        self.assertFalse(cast_value_by_dtype_name("bool", "False"))
+        self.assertTrue(cast_value_by_dtype_name("bool", 1.0))
+        self.assertIsNone(cast_value_by_dtype_name("bool", "yes please"))
+
+    def test_unknown_bool_values_are_read_as_none(self):
+        self.add_runs([[20.5, 3, "true"], [35.0, 3, "MeOH"]])
+        solvent = self.parameters[2]
+        # the import does not validate the values of a parameter that becomes bool
+        solvent.update_parameter(
+            solvent.id, solvent.name, solvent.unit, None, "bool", False
+        )
+        cells = [run["run_values"][2]["value"] for run in self.stage.get_run_grid()]
+        self.assertEqual(cells, [True, None])
+        table = self.stage.get_run_table(dynamic_only=False)
+        self.assertEqual(table["solvent"].tolist(), [True, None])
+
+
+class TestQueryPlans(StageTestCase):
+    def get_query_plan(self, statement):
+        sql = statement.compile(db.engine, compile_kwargs={"literal_binds": True})
+        return " | ".join(
+            row[-1] for row in db.session.execute(text(f"EXPLAIN QUERY PLAN {sql}"))
+        )
+
+    def test_foreign_key_lookups_use_an_index(self):
+        lookups = {
+            "values": Values.query.filter_by(
+                experimental_runs_id=1, parameter_id=1
+            ).statement,
+            "experimental_runs": db.select(ExperimentalRuns).where(
+                ExperimentalRuns.stage_id == 1
+            ),
+            "stage": db.select(Stage).where(Stage.experimental_design_id == 1),
+            "experimental_design": db.select(ExperimentalDesign).where(
+                ExperimentalDesign.user_id == 1
+            ),
+        }
+        for table, statement in lookups.items():
+            plan = self.get_query_plan(statement)
+            self.assertIn(f"SEARCH {table} USING", plan)
+            self.assertNotIn(f"SCAN {table}", plan)
+
+    def test_one_value_per_run_and_parameter(self):
+        self.add_runs([[20.5, 3, "MeCN"]])
+        value = Values.query.first()
+        db.session.add(
+            Values(
+                parameter_id=value.parameter_id,
+                value_as_str="1.0",
+                experimental_runs_id=value.experimental_runs_id,
+            )
+        )
+        with self.assertRaises(IntegrityError):
+            db.session.commit()
+        db.session.rollback()
+
+
+class TestStageExport(StageTestCase):
+    def test_run_table(self):
+        self.add_runs([[20.5, 5, "MeCN"], [30.0, 5, "MeOH"]])
+        # runs without values keep empty cells
+        empty_run = ExperimentalRuns(stage_id=self.stage.id).save()
+        table = self.stage.get_run_table(dynamic_only=False)
+        self.assertEqual(
+            table.columns.tolist(), ["run_id", "temperature", "cycles", "solvent"]
+        )
+        self.assertEqual(table["run_id"].tolist()[-1], empty_run.id)
+        self.assertEqual(table["temperature"].tolist()[:2], [20.5, 30.0])
+        # static parameters are filled with the default value
+        self.assertEqual(table["cycles"].tolist(), [3, 3, 3])
+        self.assertEqual(table["solvent"].tolist()[:2], ["MeCN", "MeOH"])
+        self.assertTrue(pd.isna(table["solvent"].iloc[2]))
+
+        table = self.stage.get_run_table(dynamic_only=True)
+        self.assertEqual(table.columns.tolist(), ["run_id", "temperature", "solvent"])
+
+    def test_analysis_dataframe(self):
+        self.add_runs([[20.5, 5, "MeCN"], [30.0, 5, "MeOH"]])
+        empty_run = ExperimentalRuns(stage_id=self.stage.id).save()
+        df = self.stage.get_dataframe_with_runs_in_stage()
+        self.assertEqual(df.index.name, "run_id")
+        self.assertEqual(df.index[-1], empty_run.id)
+        self.assertEqual(
+            df.dtypes.astype(str).to_dict(),
+            {"temperature": "float64", "cycles": "Int64", "solvent": "string"},
+        )
+        self.assertEqual(df["cycles"].tolist(), [3, 3, 3])
+        self.assertTrue(pd.isna(df.loc[empty_run.id, "solvent"]))
+
+        df = self.stage.get_dataframe_with_runs_in_stage(dynamic_only=True)
+        self.assertEqual(df.columns.tolist(), ["temperature", "solvent"])
+        df = self.stage.get_dataframe_with_runs_in_stage(columns=["solvent"])
+        self.assertEqual(df["solvent"].tolist()[:2], ["MeCN", "MeOH"])
+
+    def test_empty_stage(self):
+        table = self.stage.get_run_table(dynamic_only=False)
+        self.assertEqual(len(table), 0)
+        self.assertEqual(
+            table.columns.tolist(), ["run_id", "temperature", "cycles", "solvent"]
+        )
+
+    def test_excel_export(self):
+        self.add_runs([[20.5, 3, "MeCN"]])
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "runs.xlsx")
+            self.stage.write_run_table_file(path, dynamic_only=True, file_format="xlsx")
+            table = pd.read_excel(path)
+        self.assertEqual(table.columns.tolist(), ["run_id", "temperature", "solvent"])
+
+    def test_csv_download(self):
+        self.add_runs([[20.5, 5, "MeCN"], [30.0, 5, "MeOH"]])
+        with app.test_request_context():
+            response = self.stage.get_csv_stream_for_stage_dl(
+                dynamic_only=False, chunk_size=1
+            )
+            self.assertTrue(response.is_streamed)
+            data = response.get_data(as_text=True)
+        table = pd.read_csv(io.StringIO(data))
+        pd.testing.assert_frame_equal(
+            table, self.stage.get_run_table(dynamic_only=False), check_dtype=False
+        )
+
+    def test_parquet_export(self):
+        self.add_runs([[20.5, 5, "MeCN"]])
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "runs.parquet")
+            self.stage.write_run_table_file(
+                path, dynamic_only=False, file_format="parquet"
+            )
+            table = pd.read_parquet(path)
+        self.assertEqual(table["cycles"].tolist(), [3])
+        self.assertEqual(table["solvent"].tolist(), ["MeCN"])
+
+
+class TestStageDetail(StageTestCase):
+    def count_page_queries(self):
+        statements = []
+
+        def count(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, "before_cursor_execute", count)
+        try:
+            # loaded objects are not reused by the next request
+            db.session.expire_all()
+            response = self.client.get(f"/edit_stage/{self.stage.id}")
+        finally:
+            event.remove(db.engine, "before_cursor_execute", count)
+        self.assertEqual(response.status_code, 200)
+        return response, len(statements)
+
+    def test_query_count_does_not_grow_with_runs(self):
+        with self.client.session_transaction() as session:
+            session["_user_id"] = str(self.stage.user_id)
+        self.add_runs([[20.5, 3, "MeCN"]] * 2)
+        _, queries_for_two_runs = self.count_page_queries()
+        self.add_runs([[30.0, 3, "MeOH"]] * 50)
+        response, queries_for_many_runs = self.count_page_queries()
+        self.assertEqual(queries_for_two_runs, queries_for_many_runs)
+        self.assertEqual(response.data.count(b"Delete Run"), 52)
+
+    def test_grid_follows_routine_order(self):
+        self.add_runs([[20.5, 3, "MeCN"]])
+        empty_run = ExperimentalRuns(stage_id=self.stage.id).save()
+        grid = self.stage.get_run_grid()
+        self.assertEqual(
+            [cell["value"] for cell in grid[0]["run_values"]], [20.5, 3, "MeCN"]
+        )
+        self.assertEqual(grid[1], {"run_id": empty_run.id, "run_values": [None] * 3})
+
+
+class TestParameterInfo(StageTestCase):
+    def test_parameters_are_loaded_once_per_request(self):
+        self.add_runs([[20.5, 5, "MeCN"], [30.0, 5, "MeOH"]])
+        values = Values.query.order_by(Values.id).all()
+        statements = []
+
+        def count(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        with app.test_request_context():
+            db.session.expire_all()
+            event.listen(db.engine, "before_cursor_execute", count)
+            try:
+                pairs = [value.get_parameter_value_pair() for value in values]
+            finally:
+                event.remove(db.engine, "before_cursor_execute", count)
+            parameter_queries = [s for s in statements if "FROM parameters" in s]
+            self.assertEqual(len(parameter_queries), 3)
+            # static parameters report their default value
+            self.assertEqual(
+                pairs[:3], [("temperature", 20.5), ("cycles", 3), ("solvent", "MeCN")]
+            )
+
+            # changes within the request are visible
+            self.parameters[1].toggle_static_parameter()
+            self.assertEqual(values[1].get_parameter_value_pair(), ("cycles", 5))
+
+
+class TestUnitOfWork(StageTestCase):
+    def test_batch_commits_once(self):
+        commits = []
+        event.listen(db.session(), "after_commit", commits.append)
+        with db_batch():
+            run = ExperimentalRuns(stage_id=self.stage.id)
+            run.save()
+            for parameter in self.parameters:
+                Values.add_value(parameter.id, "1", run.id)
+            run.set_status(1)
+        self.assertEqual(len(commits), 1)
+        self.assertEqual(Values.query.count(), 3)
+
+    def test_failed_batch_is_rolled_back_and_raised(self):
+        with self.assertRaises(IntegrityError):
+            with db_batch():
+                run = ExperimentalRuns(stage_id=self.stage.id)
+                run.save()
+                Values.add_value(self.parameters[0].id, "1", run.id)
+                Values.add_value(self.parameters[0].id, "2", run.id)
+        self.assertEqual(ExperimentalRuns.query.count(), 0)
+        self.assertEqual(Values.query.count(), 0)
+
+        # outside of a batch errors are raised as well
+        with self.assertRaises(IntegrityError):
+            ExperimentalRuns(stage_id=None).save()
+
+
+class TestRoutineLayout(StageTestCase):
+    def test_layout_is_cached_until_the_parameters_change(self):
+        self.add_runs([[20.5, 5, "MeCN"]])
+        run = ExperimentalRuns.query.one()
+        routine_id = self.stage.experimental_Routine_id
+        layout = ExperimentalRoutines.get_layout_by_id(routine_id)
+        self.assertEqual(
+            layout.positions, {"temperature": 0, "cycles": 1, "solvent": 2}
+        )
+        self.assertEqual(layout.dynamic, [True, False, True])
+        self.assertEqual(layout.static_defaults, {1: 3})
+        self.assertIs(ExperimentalRoutines.get_layout_by_id(routine_id), layout)
+        self.assertEqual(
+            run.get_parameter_value_pairs_in_run_dynamic_only(),
+            [("temperature", 20.5), ("solvent", "MeCN")],
+        )
+
+        self.parameters[1].set_default_value(4)
+        self.assertEqual(
+            run.get_parameter_value_pairs_in_run(),
+            [("temperature", 20.5), ("cycles", 4), ("solvent", "MeCN")],
+        )
+        self.parameters[1].toggle_static_parameter()
+        self.assertEqual(
+            run.get_parameter_value_pairs_in_run_dynamic_only(),
+            [("temperature", 20.5), ("cycles", 5), ("solvent", "MeCN")],
+        )
+
+        routine = ExperimentalRoutines.get_routine(routine_id)
+        routine.set_parameters([self.parameters[0], self.parameters[2]])
+        self.assertEqual(
+            run.get_parameter_value_pairs_in_run(),
+            [("temperature", 20.5), ("solvent", "MeCN")],
+        )
+        self.assertEqual(
+            self.stage.get_run_payloads([run.id])[0][1],
+            {
+                "experiment_id": f"design-stage-{run.id}",
+                "experiment_type": "electrolysis",
+                "solvent": "MeCN",
+                "temperature": 20.5,
+            },
+        )
+
+
+class TestRunTelemetry(StageTestCase):
+    def setUp(self):
+        super().setUp()
+        self.add_runs([[20.5, 5, "MeCN"], [30.0, 5, "MeOH"], [40.0, 5, "MeOH"]])
+        self.runs = ExperimentalRuns.query.filter_by(stage_id=self.stage.id).all()
+        station_id = self.stage.get_experimental_station().id
+        for timestamp, experiment in [
+            (1, f"design-stage-{self.runs[0].id}"),
+            (2, f"design-stage-{self.runs[1].id}"),
+            (3, "manual test"),
+        ]:
+            TelemetrySample.add_samples(
+                get_sample_rows(
+                    station_id,
+                    {
+                        "current_experiment": experiment,
+                        "updates": {
+                            "pump": {
+                                "flow": [[timestamp, timestamp * 1.5]],
+                                "state": [[timestamp, "on"]],
+                            }
+                        },
+                    },
+                )
+            )
+
+    def test_run_id_is_parsed_from_the_experiment(self):
+        run_id = self.runs[1].id
+        self.assertEqual(parse_run_id(f"design-stage-{run_id}"), run_id)
+        for experiment_id in [
+            None,
+            "",
+            "manual test",
+            "design-stage-",
+            # experiments that were not sent as runs of the stage
+            f"calib-{run_id}",
+            f"other-stage-{run_id}",
+            f"design-stage-0{run_id}",
+            f"design-stage-{run_id} repeated",
+            "design-stage-999",
+        ]:
+            self.assertIsNone(parse_run_id(experiment_id))
+
+    def test_telemetry_of_a_range_of_runs(self):
+        samples = self.stage.get_run_telemetry(first_run_id=self.runs[1].id)
+        self.assertEqual(
+            samples,
+            [
+                (self.runs[1].id, "pump", "flow", 2.0, 3.0),
+                (self.runs[1].id, "pump", "state", 2.0, "on"),
+            ],
+        )
+        samples = self.stage.get_run_telemetry(observable="flow")
+        self.assertEqual(
+            [sample[0] for sample in samples], [r.id for r in self.runs[:2]]
+        )
+
+    def test_runs_are_selected_in_a_subquery(self):
+        self.add_runs([[20.5, 3, "MeCN"]] * 20)
+        stage = db.session.get(Stage, self.stage.id)
+        executed = []
+
+        def record(conn, cursor, statement, parameters, *args):
+            executed.append((statement, parameters))
+
+        event.listen(db.engine, "before_cursor_execute", record)
+        try:
+            stage.get_run_telemetry()
+        finally:
+            event.remove(db.engine, "before_cursor_execute", record)
+        # one query, its parameters do not grow with the number of runs
+        self.assertEqual(len(executed), 1)
+        statement, parameters = executed[0]
+        self.assertIn("FROM experimental_runs", statement)
+        self.assertEqual(len(parameters), 1)
+
+    def test_telemetry_dataframe(self):
+        df = self.stage.get_dataframe_with_run_telemetry(with_parameters=True)
+        self.assertEqual(df.index.names, ["run_id", "timestamp"])
+        self.assertEqual(
+            df.columns.tolist(),
+            ["pump.flow", "pump.state", "temperature", "cycles", "solvent"],
+        )
+        self.assertEqual(df["pump.flow"].dtype, "float64")
+        self.assertEqual(df.loc[(self.runs[1].id, 2.0), "solvent"], "MeOH")
+
+        df = self.stage.get_dataframe_with_run_telemetry(last_run_id=0)
+        self.assertEqual(len(df), 0)
+
+    def test_telemetry_api(self):
+        with self.client.session_transaction() as session:
+            session["_user_id"] = str(self.stage.user_id)
+        response = self.client.get(
+            f"/api/stage_telemetry/{self.stage.id}?last_run={self.runs[0].id}"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json["runs"],
+            {
+                str(self.runs[0].id): {
+                    "pump": {"flow": [[1.0, 1.5]], "state": [[1.0, "on"]]}
+                }
+            },
+        )
+        response = self.client.get(f"/api/stage_telemetry/{self.stage.id}?first_run=x")
+        self.assertEqual(response.status_code, 400)
+
+
+class TestStageDispatch(StageTestCase):
+    def post(self, url, data=None, **kwargs):
+        self.assertTrue(url.endswith("/api/add_experiment"))
+        self.payloads.append(data)
+        response = mock.Mock()
+        response.ok = data["solvent"] != "invalid"
+        response.status_code = 200 if response.ok else 422
+        response.text = "" if response.ok else "unknown solvent"
+        return response
+
+    def setUp(self):
+        super().setUp()
+        self.payloads = []
+        patcher = mock.patch.object(requests.Session, "post", side_effect=self.post)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_failed_run_does_not_stop_the_others(self):
+        self.add_runs([[20.5, 5, "MeCN"], [30.0, 5, "invalid"], [40.0, 5, "MeOH"]])
+        runs = ExperimentalRuns.query.filter_by(stage_id=self.stage.id).all()
+        results = self.stage.sent_all_runs_to_station()
+        self.assertEqual([result.sent for result in results], [True, False, True])
+        self.assertEqual(results[1].error, "HTTP 422: unknown solvent")
+        # the station queues the runs in the order of the stage
+        self.assertEqual(
+            [payload["solvent"] for payload in self.payloads],
+            ["MeCN", "invalid", "MeOH"],
+        )
+        self.assertEqual(
+            self.payloads[0],
+            {
+                "experiment_id": f"design-stage-{runs[0].id}",
+                "experiment_type": "electrolysis",
+                "temperature": 20.5,
+                "cycles": 3,
+                "solvent": "MeCN",
+            },
+        )
+        db.session.expire_all()
+        self.assertEqual([run.status for run in runs], [1, 0, 1])
+
+    def test_status_is_set_in_chunks(self):
+        self.add_runs([[20.5, 5, "MeCN"]] * 5)
+        run_ids = [run.id for run in ExperimentalRuns.query.order_by("id")]
+        parameter_counts = []
+
+        def record(conn, cursor, statement, parameters, *args):
+            if statement.startswith("UPDATE experimental_runs"):
+                parameter_counts.append(len(parameters))
+
+        event.listen(db.engine, "before_cursor_execute", record)
+        try:
+            ExperimentalRuns.set_status_by_ids(run_ids, 1, chunk_size=2)
+        finally:
+            event.remove(db.engine, "before_cursor_execute", record)
+        # status and at most two IDs per statement
+        self.assertEqual(parameter_counts, [3, 3, 2])
+        db.session.expire_all()
+        self.assertEqual(ExperimentalRuns.query.filter_by(status=1).count(), 5)
+
+    def test_unreachable_station(self):
+        self.add_runs([[20.5, 5, "MeCN"], [30.0, 5, "MeOH"]])
+        with mock.patch.object(
+            requests.Session, "post", side_effect=requests.exceptions.ConnectionError()
+        ) as post:
+            results = self.stage.sent_all_runs_to_station()
+        self.assertEqual(post.call_count, 1)
+        self.assertEqual([result.sent for result in results], [False, False])
+        self.assertEqual(ExperimentalRuns.query.filter_by(status=1).count(), 0)
+
+
+CATALOG = {
+    "electrolysis": {
+        "parameters": {
+            "temperature": ["float", "K"],
+            "solvent": ["str", "-"],
+            "pressure": ["float", "bar"],
+        }
+    },
+    "titration": {"parameters": {"volume": ["float", "mL"]}},
+}
+
+
+class TestRoutineSync(StageTestCase):
+    def get(self, url, **kwargs):
+        self.assertTrue(url.endswith("/api/get_experiment_types"))
+        if "offline" in url:
+            raise requests.exceptions.ConnectionError("station offline")
+        response = mock.Mock()
+        response.text = json.dumps(self.catalog)
+        return response
+
+    def setUp(self):
+        super().setUp()
+        self.catalog = CATALOG
+        patcher = mock.patch.object(requests.Session, "get", side_effect=self.get)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.station = ExperimentalStation.query.one()
+        self.station.register_routine_in_station(
+            ExperimentalRoutines(name="retired", parameters=[])
+        )
+
+    def test_sync_applies_the_differences(self):
+        self.add_runs([[20.5, 5, "MeCN"]])
+        plan = self.station.sync_routines()
+        self.assertEqual(
+            plan.get_summary(),
+            {
+                "added": ["titration"],
+                "changed": ["electrolysis"],
+                "removed": ["retired"],
+                "unchanged": [],
+            },
+        )
+        db.session.expire_all()
+        routines = {
+            routine.name: routine for routine in self.station.get_all_routines()
+        }
+        self.assertEqual(list(routines), ["electrolysis", "titration"])
+        self.assertEqual(
+            routines["electrolysis"].get_parameter_names_in_routine(),
+            ["temperature", "solvent", "pressure"],
+        )
+        self.assertEqual(self.parameters[0].unit, "K")
+        self.assertEqual(
+            routines["titration"].get_parameters_in_routine()[0].data_type, "float"
+        )
+        self.assertEqual(
+            self.stage.get_run_table(dynamic_only=False).columns.tolist(),
+            ["run_id", "temperature", "solvent", "pressure"],
+        )
+
+        # the second sync has nothing to do
+        self.assertFalse(self.station.sync_routines())
+
+    def test_sync_all_stations(self):
+        offline = ExperimentalStation(
+            name="offline", address="offline:11123", api_key="key", location="lab"
+        )
+        offline.save()
+        results = ExperimentalStation.sync_all_stations()
+        self.assertEqual(
+            [(station.name, error) for station, _, error in results],
+            [("station", None), ("offline", "station offline")],
+        )
+        self.assertEqual(results[0][1].get_summary()["added"], ["titration"])
+        self.assertEqual(offline.get_all_routines(), [])
+
+    def test_malformed_catalog_changes_nothing(self):
+        routines = self.station.get_all_routines()
+        for self.catalog in [[], None, {"error": "device not ready"}]:
+            with self.assertRaises(ValueError):
+                self.station.sync_routines()
+            results = ExperimentalStation.sync_all_stations()
+            self.assertIsNone(results[0][1])
+            self.assertIsNotNone(results[0][2])
+            db.session.expire_all()
+            self.assertEqual(self.station.get_all_routines(), routines)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+from unittest import TestCase, main
+
+import io
+import json
+import os
+import sys
+import time
+
+### Add the parent directory to the path, otherwise the import of the app module will fail ###
+topdir = os.path.join(os.path.dirname(__file__), "..")
+sys.path.append(topdir)
+
+
+import pandas as pd
+from flask import g
+
+from app import create_app, db
+from app.auth.models import User
+from app.experiments.models import (
+    ExperimentalDesign,
+    ExperimentalRoutines,
+    ExperimentalStation,
+    Parameters,
+    Stage,
+)
+from app.jobs.models import Job
+from app.jobs.runner import enqueue_job, get_job_runner
+from app.jobs.views import remove_expired_exports
+
+
+app = create_app(environment="testing")
+
+
+def counting_job(job, steps):
+    for step in range(1, steps + 1):
+        job.set_progress(step, steps)
+    job.message = "done"
+    return {"steps": steps}
+
+
+def failing_job(job):
+    raise ValueError("station offline")
+
+
+class TestJobs(TestCase):
+    def setUp(self):
+        self.client = app.test_client()
+        self.app_ctx = app.app_context()
+        self.app_ctx.push()
+        db.create_all()
+        self.user = User(
+            username="alice", email="alice@example.com", password="password"
+        )
+        self.other_user = User(
+            username="bob", email="bob@example.com", password="password"
+        )
+        db.session.add_all([self.user, self.other_user])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_ctx.pop()
+
+    def login(self, user):
+        with self.client.session_transaction() as session:
+            session["_user_id"] = str(user.id)
+        # the app context of the test is shared with the requests, forget the loaded user
+        g.pop("_login_user", None)
+
+    def run_job(self, *args, **kwargs):
+        job = enqueue_job(*args, user_id=self.user.id, **kwargs)
+        self.assertEqual(job.status, Job.QUEUED)
+        get_job_runner().wait(job.id, timeout=5)
+        db.session.refresh(job)
+        return job
+
+    def test_finished_job(self):
+        job = self.run_job("count", counting_job, 3)
+        self.assertEqual(job.status, Job.FINISHED)
+        self.assertEqual((job.progress, job.total), (3, 3))
+        self.assertEqual(job.message, "done")
+        self.assertEqual(job.result, {"steps": 3})
+        self.assertIsNotNone(job.finished_at)
+
+    def test_failed_job(self):
+        job = self.run_job("fail", failing_job)
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.message, "station offline")
+        self.assertIsNone(job.result)
+
+    def test_status_and_events(self):
+        job = self.run_job("count", counting_job, 2)
+        self.login(self.user)
+        self.assertIn(b"<h2>count</h2>", self.client.get(f"/jobs/{job.id}").data)
+        response = self.client.get(f"/jobs/{job.id}/status")
+        self.assertEqual(response.json["status"], Job.FINISHED)
+        self.assertEqual(response.json["result"], {"steps": 2})
+
+        # the stream ends with the finished job
+        response = self.client.get(f"/jobs/{job.id}/events")
+        self.assertEqual(response.mimetype, "text/event-stream")
+        events = response.get_data(as_text=True).split("\n\n")
+        self.assertEqual(json.loads(events[0][len("data:") :])["status"], Job.FINISHED)
+
+        self.login(self.other_user)
+        self.assertEqual(self.client.get(f"/jobs/{job.id}/status").status_code, 404)
+
+    def test_interrupted_jobs_fail(self):
+        queued = Job(name="queued", user_id=self.user.id)
+        running = Job(name="running", user_id=self.user.id, status=Job.RUNNING)
+        finished = Job(name="finished", user_id=self.user.id, status=Job.FINISHED)
+        db.session.add_all([queued, running, finished])
+        db.session.commit()
+
+        # done on start up of the app
+        self.assertEqual(Job.fail_interrupted_jobs(), 2)
+        self.assertEqual((queued.status, running.status), (Job.FAILED, Job.FAILED))
+        self.assertIsNotNone(running.finished_at)
+        self.assertEqual(finished.status, Job.FINISHED)
+
+        # the event stream of the detail page ends
+        self.login(self.user)
+        response = self.client.get(f"/jobs/{running.id}/events")
+        events = response.get_data(as_text=True).split("\n\n")
+        self.assertEqual(json.loads(events[0][len("data:") :])["status"], Job.FAILED)
+
+    def test_expired_exports_are_removed(self):
+        folder = os.path.join(app.instance_path, "exports")
+        os.makedirs(folder, exist_ok=True)
+        old_file = os.path.join(folder, "job-old.csv")
+        new_file = os.path.join(folder, "job-new.csv")
+        for path in (old_file, new_file):
+            with open(path, "w") as f:
+                f.write("run_id\n")
+        expired = time.time() - 2 * 3600
+        os.utime(old_file, (expired, expired))
+
+        self.assertEqual(remove_expired_exports(3600), 1)
+        self.assertFalse(os.path.exists(old_file))
+        self.assertTrue(os.path.exists(new_file))
+        os.remove(new_file)
+
+    def test_export_job(self):
+        station = ExperimentalStation(
+            name="station", address="station:11123", api_key="key", location="lab"
+        )
+        routine = ExperimentalRoutines(
+            name="electrolysis",
+            parameters=[Parameters(name="temperature", unit="C", data_type="float")],
+        )
+        db.session.add_all([station, routine])
+        db.session.flush()
+        design = ExperimentalDesign(
+            name="design", user_id=self.user.id, station_id=station.id
+        )
+        db.session.add(design)
+        db.session.flush()
+        stage = Stage(
+            name="stage",
+            user_id=self.user.id,
+            experimental_Routine_id=routine.id,
+            experimental_design_id=design.id,
+        )
+        db.session.add(stage)
+        db.session.commit()
+        stage.add_or_update_runs_from_dataframe(
+            pd.DataFrame({"temperature": [20.5, 30.0]}), dynamic_only=False
+        )
+
+        self.login(self.user)
+        response = self.client.post(
+            f"/dl_design/{stage.id}",
+            data={"select_dl_mode": "full", "select_dl_format": "parquet"},
+        )
+        self.assertEqual(response.status_code, 302)
+        job = Job.query.one()
+        self.assertTrue(response.location.endswith(f"/jobs/{job.id}"))
+        get_job_runner().wait(job.id, timeout=5)
+
+        # the session of the test context is shared with the requests
+        db.session.refresh(job)
+        self.assertEqual(job.status, Job.FINISHED)
+        response = self.client.get(f"/jobs/{job.id}/download")
+        self.assertIn(
+            "stage_all_parameters.parquet", response.headers["Content-Disposition"]
+        )
+        table = pd.read_parquet(io.BytesIO(response.get_data()))
+        self.assertEqual(table["temperature"].tolist(), [20.5, 30.0])
+        response.close()
+        os.remove(os.path.join(app.instance_path, "exports", f"job-{job.id}.parquet"))
+
+
+if __name__ == "__main__":
+    main()
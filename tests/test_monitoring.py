@@ -0,0 +1,588 @@
+from unittest import TestCase, main, mock
+
+import json
+import os
+import sys
+import threading
+import time
+
+### Add the parent directory to the path, otherwise the import of the app module will fail ###
+topdir = os.path.join(os.path.dirname(__file__), "..")
+sys.path.append(topdir)
+
+
+import numpy as np
+import requests
+
+from app import create_app, db
+from app.experiments.models import ExperimentalStation
+from app.monitoring.buffers import ObservableBuffer, StationBuffer
+from app.monitoring.decimation import (
+    ChartResolution,
+    decimate_samples,
+    parse_chart_resolution,
+)
+from app.monitoring.hub import (
+    StationUpdate,
+    StationUpdateHub,
+    _hubs,
+    compact_updates,
+    format_data,
+)
+from app.monitoring.models import TelemetrySample
+from app.monitoring.telemetry import TelemetryCollector, get_sample_rows
+
+
+app = create_app(environment="testing")
+
+
+def station_response(timestamp, updates=None):
+    response = mock.Mock()
+    response.content = json.dumps(
+        {
+            "timestamp": timestamp,
+            "current_experiment": "design-stage-1",
+            "updates": updates or {"pump": {"flow": [[timestamp, 1.0]]}},
+        }
+    ).encode()
+    return response
+
+
+class TestStationUpdateHub(TestCase):
+    def setUp(self):
+        self.timestamps = iter(range(1, 10000))
+        # every release lets the poller perform one more request
+        self.polls = threading.Semaphore(0)
+
+        def post(*args, **kwargs):
+            if not self.polls.acquire(timeout=2.0):
+                raise requests.exceptions.ConnectionError()
+            return station_response(next(self.timestamps))
+
+        self.client = mock.Mock()
+        self.post = self.client.post
+        self.post.side_effect = post
+        self.hub = StationUpdateHub(1, self.client, interval=0.0, history_size=3)
+
+    def tearDown(self):
+        self.hub._stop()
+
+    def wait_for(self, condition, timeout=2.0):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                self.fail("condition not met in time")
+            time.sleep(0.005)
+
+    def poll(self, subscription, count=1):
+        messages = iter(subscription)
+        self.polls.release(count)
+        return [next(messages) for _ in range(count)]
+
+    def test_subscribers_share_one_poller(self):
+        first = self.hub.subscribe()
+        self.assertFalse(first.needs_snapshot)
+        self.assertTrue(self.poll(first)[0].startswith("id:1\n"))
+
+        second = self.hub.subscribe(last_event_id=1.0)
+        self.assertFalse(second.needs_snapshot)
+        # both streams receive the very same payload from a single request
+        self.assertEqual(self.poll(first), [next(iter(second))])
+        self.assertEqual(self.hub.subscriber_count, 2)
+
+    def test_new_client_gets_buffered_history(self):
+        first = self.hub.subscribe()
+        self.poll(first, 2)
+        # the buffer still reaches back to the start of the experiment
+        second = self.hub.subscribe()
+        self.assertFalse(second.needs_snapshot)
+        messages = iter(second)
+        self.assertTrue(next(messages).startswith("id:1\n"))
+        self.assertTrue(next(messages).startswith("id:2\n"))
+
+    def test_snapshot_when_history_is_exhausted(self):
+        first = self.hub.subscribe()
+        self.poll(first, 5)
+        # the oldest messages were dropped from the buffer of three
+        late = self.hub.subscribe()
+        self.assertTrue(late.needs_snapshot)
+        self.assertIsNone(late.snapshot_from)
+        resumed = self.hub.subscribe(last_event_id=3.0)
+        self.assertFalse(resumed.needs_snapshot)
+        self.assertTrue(next(iter(resumed)).startswith("id:4\n"))
+        outdated = self.hub.subscribe(last_event_id=1.0)
+        self.assertTrue(outdated.needs_snapshot)
+        self.assertEqual(outdated.snapshot_from, 1.0)
+
+    def test_snapshot_from_buffer(self):
+        first = self.hub.subscribe()
+        self.poll(first, 5)
+        late = self.hub.subscribe()
+        self.assertEqual(late.snapshot_until, 5.0)
+        # the station only returns the samples of one poll, the buffer has them all
+        message = self.hub.fetch_snapshot(None, until=late.snapshot_until)
+        self.assertTrue(message.startswith("id:5\n"))
+        payload = json.loads(message.split("data:", 1)[1])
+        self.assertEqual(
+            payload["updates"]["pump"]["flow"], [[t, 1.0] for t in range(1, 6)]
+        )
+        self.assertEqual(payload["current_experiment"], "design-stage-1")
+        message = self.hub.fetch_snapshot(3.0, until=4.0)
+        self.assertEqual(
+            json.loads(message.split("data:", 1)[1])["updates"],
+            {"pump": {"flow": [[4.0, 1.0]]}},
+        )
+
+    def test_full_resolution_is_forwarded_unparsed(self):
+        for buffer_seconds in [0, app.config["STATION_UPDATE_BUFFER"]]:
+            client = mock.Mock()
+            client.post.return_value = station_response(1)
+            hub = StationUpdateHub(2, client, buffer_seconds=buffer_seconds)
+            with mock.patch("app.monitoring.hub.loads") as loads:
+                subscription = hub.subscribe()
+                message = next(iter(subscription))
+                hub.unsubscribe(subscription)
+                self.wait_for(lambda: not hub.is_running)
+                loads.assert_not_called()
+            self.assertEqual(
+                message, f"id:1\ndata:{station_response(1).content.decode()}\n\n"
+            )
+
+    def test_buffer_parses_responses_for_snapshots_only(self):
+        hub = StationUpdateHub(2, self.client, interval=0.0, buffer_seconds=2.5)
+        self.addCleanup(hub._stop)
+        subscription = hub.subscribe()
+        self.poll(subscription, 5)
+        # the updates that end before the last 2.5 seconds are dropped unparsed
+        self.assertEqual([update.timestamp for update in hub._pending], [3, 4, 5])
+        self.assertFalse(any(update.is_parsed for update in hub._pending))
+        message = hub.fetch_snapshot(2.0, until=5.0)
+        self.assertEqual(len(hub._pending), 0)
+        self.assertEqual(
+            json.loads(message.split("data:", 1)[1])["updates"]["pump"]["flow"],
+            [[3.0, 1.0], [4.0, 1.0], [5.0, 1.0]],
+        )
+
+    def test_compact_updates(self):
+        updates = {
+            "pump": {"flow": [[1, 2.0]], "pressure": []},
+            "valve": {"position": []},
+        }
+        self.assertEqual(compact_updates(updates), {"pump": {"flow": [[1, 2.0]]}})
+
+    def test_poller_stops_with_last_subscriber(self):
+        first = self.hub.subscribe()
+        second = self.hub.subscribe()
+        self.poll(first)
+        self.hub.unsubscribe(first)
+        self.assertTrue(self.hub.is_running)
+        self.hub.unsubscribe(second)
+        self.polls.release()
+        self.wait_for(lambda: not self.hub.is_running)
+        self.assertLessEqual(self.post.call_count, 2)
+
+    def test_decimated_subscribers(self):
+        updates = {"pump": {"flow": [[t, float(t % 7)] for t in range(100)]}}
+        self.post.side_effect = lambda *args, **kwargs: station_response(1, updates)
+        full = self.hub.subscribe()
+        decimated = self.hub.subscribe(resolution=ChartResolution(10, None, "lttb"))
+        # both streams get the same poll, decimated for one of them
+        samples = [
+            json.loads(next(iter(subscription)).split("data:", 1)[1])["updates"]
+            for subscription in (full, decimated)
+        ]
+        self.assertEqual(len(samples[0]["pump"]["flow"]), 100)
+        self.assertEqual(len(samples[1]["pump"]["flow"]), 10)
+
+    def test_time_resolution_over_small_deltas(self):
+        # every poll returns one second of samples at 10 Hz
+        def post(*args, **kwargs):
+            if not self.polls.acquire(timeout=2.0):
+                raise requests.exceptions.ConnectionError()
+            second = next(self.timestamps)
+            samples = [[second - 1 + t / 10, float(t)] for t in range(10)]
+            return station_response(second, {"pump": {"flow": samples}})
+
+        self.post.side_effect = post
+        subscription = self.hub.subscribe(resolution=ChartResolution(200, 5.0, "lttb"))
+        samples = self.get_samples(self.poll(subscription, 20))
+        # one sample per closed bucket of 5 seconds, not two samples per poll, the last bucket is still open
+        self.assertEqual([sample[0] // 5 for sample in samples], [0.0, 1.0, 2.0])
+
+    def post_sine(self, *args, **kwargs):
+        # every poll returns one second of a 10 Hz sine, with a spike at 4.7 seconds
+        if not self.polls.acquire(timeout=2.0):
+            raise requests.exceptions.ConnectionError()
+        second = next(self.timestamps)
+        samples = []
+        for t in range(10):
+            timestamp = round(second - 1 + t / 10, 1)
+            value = 100.0 if timestamp == 4.7 else np.sin(timestamp)
+            samples.append([timestamp, value])
+        return station_response(second, {"pump": {"flow": samples}})
+
+    def get_samples(self, messages):
+        samples = []
+        for message in messages:
+            updates = json.loads(message.split("data:", 1)[1])["updates"]
+            samples.extend(updates.get("pump", {}).get("flow", []))
+        return samples
+
+    def test_time_resolution_keeps_extremes(self):
+        self.post.side_effect = self.post_sine
+        subscription = self.hub.subscribe(
+            resolution=ChartResolution(200, 3.0, "minmax")
+        )
+        samples = self.get_samples(self.poll(subscription, 8))
+        self.assertIn([4.7, 100.0], samples)
+        # minimum and maximum of the closed buckets 0-3 and 3-6 seconds
+        self.assertEqual(len(samples), 4)
+
+    def test_history_is_decimated_as_stream(self):
+        self.hub = StationUpdateHub(1, self.client, interval=0.0, history_size=10)
+        self.post.side_effect = self.post_sine
+        full = self.hub.subscribe()
+        self.poll(full, 8)
+        subscription = self.hub.subscribe(
+            resolution=ChartResolution(200, 3.0, "minmax")
+        )
+        messages = iter(subscription)
+        samples = self.get_samples([next(messages) for _ in range(8)])
+        self.assertIn([4.7, 100.0], samples)
+        self.assertEqual(len(samples), 4)
+
+    def test_station_error_ends_streams(self):
+        self.post.side_effect = ValueError("no json")
+        subscription = self.hub.subscribe()
+        self.assertEqual(list(subscription), [])
+        self.wait_for(lambda: not self.hub.is_running)
+
+
+class TestStationUpdate(TestCase):
+    def test_timestamp_without_parsing(self):
+        content = b'{\n  "updates": {"timestamp": {"timestamp": [[1, 2]]}},\n  "timestamp": 12.5e0\n}'
+        update = StationUpdate(None, content)
+        self.assertEqual(update.timestamp, 12.5)
+        self.assertIsNone(update._payload)
+        # line breaks would end the data field of the event
+        self.assertEqual(
+            update.get_message(),
+            'id:12.5\ndata:{  "updates": {"timestamp": {"timestamp": [[1, 2]]}},  "timestamp": 12.5e0}\n\n',
+        )
+
+    def test_timestamp_from_parsed_response(self):
+        update = StationUpdate(None, b'{"timestamp": null, "updates": {"pump": {}}}')
+        self.assertIsNone(update.timestamp)
+        self.assertEqual(update.payload["updates"], {})
+        with self.assertRaises(ValueError):
+            StationUpdate(None, b"<html>Internal Server Error</html>")
+
+    def test_decimated_message(self):
+        updates = {"pump": {"flow": [[t, float(t)] for t in range(10)]}}
+        update = StationUpdate(None, station_response(10, updates).content)
+        message = update.get_message(ChartResolution(3, None, "lttb"))
+        self.assertTrue(message.startswith("id:10\n"))
+        self.assertEqual(
+            json.loads(message.split("data:", 1)[1])["updates"]["pump"]["flow"],
+            [[0, 0.0], [1, 1.0], [9, 9.0]],
+        )
+        self.assertIs(update.get_message(ChartResolution(3, None, "lttb")), message)
+        self.assertEqual(format_data(b"[1,\n2]"), "data:[1,2]\n\n")
+
+
+class TestBuffers(TestCase):
+    def test_ring_grows_and_wraps(self):
+        buffer = ObservableBuffer(capacity=4)
+        buffer.append([[1, 1.0], [2, 2.0], [3, 3.0]])
+        buffer.trim(3)
+        # the next samples wrap around the end of the arrays
+        buffer.append([[4, 4.0], [5, 5.0]])
+        self.assertEqual(buffer.capacity, 4)
+        self.assertEqual(buffer.serialize(), [[3.0, 3.0], [4.0, 4.0], [5.0, 5.0]])
+        buffer.append([[t, float(t)] for t in range(6, 10)])
+        self.assertEqual(buffer.capacity, 8)
+        self.assertEqual(len(buffer), 7)
+        timestamps, values = buffer.slice(after=4, until=7)
+        self.assertEqual(timestamps.tolist(), [5.0, 6.0, 7.0])
+        timestamps, values = buffer.resample(2)
+        self.assertEqual(timestamps.tolist(), [3.0, 4.0, 6.0, 8.0])
+        self.assertEqual(values.tolist(), [3.0, 4.5, 6.5, 8.5])
+
+    def test_text_values(self):
+        buffer = ObservableBuffer()
+        buffer.append([[1, 1.0], [2, None]])
+        self.assertTrue(buffer.is_numeric)
+        buffer.append([[3, "on"]])
+        self.assertFalse(buffer.is_numeric)
+        self.assertEqual(buffer.serialize(after=1), [[2.0, None], [3.0, "on"]])
+
+    def test_station_buffer_keeps_max_age(self):
+        buffer = StationBuffer(max_age=3600)
+        self.assertFalse(buffer.covers(None))
+        observables = [f"sensor{i}" for i in range(20)]
+        timestamp = None
+        # two hours of 20 observables with 10 samples per second
+        for second in range(0, 7200, 10):
+            samples = (second + np.arange(100) / 10).tolist()
+            payload = {
+                "timestamp": second + 10,
+                "updates": {
+                    "station": {
+                        name: [[t, 1.0] for t in samples] for name in observables
+                    }
+                },
+            }
+            buffer.extend(timestamp, payload)
+            timestamp = second + 10
+        self.assertFalse(buffer.covers(None))
+        self.assertTrue(buffer.covers(3600))
+        self.assertFalse(buffer.covers(3599))
+        updates = buffer.get_updates(after=7199)
+        self.assertEqual(len(updates["station"]), 20)
+        self.assertEqual(updates["station"]["sensor0"][0], [7199.1, 1.0])
+        # an hour is 36000 samples per observable, kept in a few megabytes
+        self.assertEqual(len(buffer.get_updates()["station"]["sensor0"]), 36000)
+        self.assertLess(buffer.nbytes, 25 * 2**20)
+
+    def test_station_buffer_gap(self):
+        buffer = StationBuffer()
+        buffer.extend(None, {"timestamp": 2, "updates": {"pump": {"flow": [[1, 1]]}}})
+        self.assertTrue(buffer.covers(None))
+        # the poller was restarted, the samples in between are missing
+        buffer.extend(5, {"timestamp": 6, "updates": {"pump": {"flow": [[6, 1]]}}})
+        self.assertFalse(buffer.covers(None))
+        self.assertTrue(buffer.covers(5))
+        self.assertEqual(
+            buffer.get_payload(),
+            {"timestamp": 6, "updates": {"pump": {"flow": [[6.0, 1.0]]}}},
+        )
+
+
+class TestDecimation(TestCase):
+    def setUp(self):
+        self.samples = [[t / 10, 1.0] for t in range(1000)]
+        self.samples[500][1] = 50.0
+        self.samples[700][1] = -20.0
+
+    def test_lttb_keeps_shape(self):
+        kept = decimate_samples(self.samples, ChartResolution(50, None, "lttb"))
+        self.assertEqual(len(kept), 50)
+        self.assertEqual(kept[0], self.samples[0])
+        self.assertEqual(kept[-1], self.samples[-1])
+        self.assertIn([50.0, 50.0], kept)
+        self.assertIn([70.0, -20.0], kept)
+        self.assertEqual(kept, sorted(kept))
+
+    def test_min_max_keeps_extremes(self):
+        kept = decimate_samples(self.samples, ChartResolution(20, None, "minmax"))
+        self.assertLessEqual(len(kept), 20)
+        self.assertIn([50.0, 50.0], kept)
+        self.assertIn([70.0, -20.0], kept)
+
+    def test_resolution_in_seconds(self):
+        # 99.9 seconds at one sample per 10 seconds
+        kept = decimate_samples(self.samples, ChartResolution(None, 10.0, "lttb"))
+        self.assertEqual(len(kept), 10)
+
+    def test_short_and_non_numeric_series_are_kept(self):
+        resolution = ChartResolution(2, None, "lttb")
+        self.assertEqual(
+            decimate_samples(self.samples[:2], resolution), self.samples[:2]
+        )
+        labels = [[t, "open"] for t in range(10)]
+        self.assertEqual(decimate_samples(labels, resolution), labels)
+
+    def test_parse_chart_resolution(self):
+        self.assertIsNone(parse_chart_resolution({}))
+        self.assertEqual(
+            parse_chart_resolution({"points": "200"}),
+            ChartResolution(200, None, "lttb"),
+        )
+        for args in [{"points": "1"}, {"points": "x"}, {"resolution": "-1"}]:
+            with self.assertRaises(ValueError):
+                parse_chart_resolution(args)
+        with self.assertRaises(ValueError):
+            parse_chart_resolution({"points": "10", "method": "average"})
+
+
+class TestDeviceOverview(TestCase):
+    def setUp(self):
+        self.client = app.test_client()
+        self.app_ctx = app.app_context()
+        self.app_ctx.push()
+        db.create_all()
+        for name in ["fast", "slow"]:
+            ExperimentalStation(
+                name=name, address=f"{name}:11123", api_key="key", location="lab"
+            ).save()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_ctx.pop()
+
+    def test_slow_station_is_shown_offline(self):
+        app.config["STATION_OVERVIEW_TIMEOUT"] = 0.2
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def post(url, **kwargs):
+            self.assertIn("timeout", kwargs)
+            if url.startswith("http://slow"):
+                release.wait(2.0)
+            response = mock.Mock()
+            response.content = json.dumps(
+                {
+                    "status": "Running",
+                    "running_experiment_name": "design-stage-1",
+                    "total_experiments_queued": 3,
+                    "current_run_number": 1,
+                }
+            ).encode()
+            return response
+
+        with mock.patch.object(requests.Session, "post", side_effect=post):
+            started = time.monotonic()
+            response = self.client.get("/overview")
+            self.assertLess(time.monotonic() - started, 1.5)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"Status: Running", response.data)
+        self.assertIn(b"Status: offline", response.data)
+
+
+class TestTelemetry(TestCase):
+    def setUp(self):
+        self.client = app.test_client()
+        self.app_ctx = app.app_context()
+        self.app_ctx.push()
+        db.create_all()
+        self.station = ExperimentalStation(
+            name="station", address="station:11123", api_key="key", location="lab"
+        ).save()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_ctx.pop()
+
+    def add_samples(self, timestamps, device="pump", observable="flow"):
+        TelemetrySample.add_samples(
+            get_sample_rows(
+                self.station.id,
+                {
+                    "current_experiment": "design-stage-1",
+                    "updates": {
+                        device: {observable: [[t, float(t % 10)] for t in timestamps]}
+                    },
+                },
+            )
+        )
+
+    def test_sample_rows(self):
+        payload = {
+            "current_experiment": "design-stage-1",
+            "updates": {"pump": {"flow": [[1, 1.5], [2, 2]], "state": [[2, "on"]]}},
+        }
+        rows = get_sample_rows(1, payload, after={("pump", "flow"): 1})
+        self.assertEqual(
+            [(row["timestamp"], row["value"], row["value_as_str"]) for row in rows],
+            [(2.0, 2.0, None), (2.0, None, "on")],
+        )
+        self.assertEqual(rows[0]["experiment"], "design-stage-1")
+
+    def test_raw_and_downsampled_samples(self):
+        self.add_samples(range(1, 101))
+        samples, width = TelemetrySample.get_samples(
+            self.station.id, "pump", "flow", start=11, end=20
+        )
+        self.assertIsNone(width)
+        self.assertEqual(samples[0], [11.0, 1.0])
+        self.assertEqual(len(samples), 10)
+
+        samples, width = TelemetrySample.get_samples(
+            self.station.id, "pump", "flow", max_points=12, tiers=(1, 10, 60)
+        )
+        self.assertEqual(width, 10)
+        self.assertEqual(len(samples), 11)
+        # averages of the buckets [10, 20), [20, 30), ...
+        self.assertEqual(samples[1], [10.0, 4.5])
+
+    def test_telemetry_api(self):
+        self.add_samples(range(1, 51))
+        self.add_samples([5], observable="pressure")
+        response = self.client.get(
+            f"/api/monitoring/telemetry/{self.station.id}/channels"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(c["observable"], c["samples"]) for c in response.json],
+            [("flow", 50), ("pressure", 1)],
+        )
+
+        response = self.client.get(
+            f"/api/monitoring/telemetry/{self.station.id}"
+            "?device=pump&observable=flow&start=41&points=5"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json["bucket_width"], 10)
+        self.assertEqual(response.json["samples"], [[41.0, 5.0], [50.0, 0.0]])
+
+        for query in ["", "?device=pump", "?device=pump&observable=flow&start=x"]:
+            response = self.client.get(
+                f"/api/monitoring/telemetry/{self.station.id}{query}"
+            )
+            self.assertEqual(response.status_code, 400)
+
+    def test_collector_resumes_after_stored_samples(self):
+        self.add_samples([1, 2])
+        # the pressure samples were stored up to 1 when the collector stopped
+        self.add_samples([1], observable="pressure")
+        requests_from = []
+        station_client = mock.Mock()
+
+        def post(endpoint, data=None, **kwargs):
+            requests_from.append(data["from_timestamp"])
+            if len(requests_from) > 1:
+                raise requests.exceptions.ConnectionError()
+            return station_response(
+                3,
+                {
+                    "pump": {
+                        "flow": [[2, 2.0], [3, 3.0]],
+                        "pressure": [[1, 1.0], [2, 2.0], [3, 3.0]],
+                    }
+                },
+            )
+
+        station_client.post.side_effect = post
+        self.addCleanup(_hubs.clear)
+        collector = TelemetryCollector(app, self.station.id, batch_size=100)
+        with mock.patch.object(
+            ExperimentalStation, "get_client", return_value=station_client
+        ):
+            collector.collect()
+
+        self.assertEqual(requests_from[0], 1)
+        for observable in ["flow", "pressure"]:
+            samples, _ = TelemetrySample.get_samples(
+                self.station.id, "pump", observable
+            )
+            self.assertEqual(samples, [[1.0, 1.0], [2.0, 2.0], [3.0, 3.0]])
+
+    def test_live_samples_are_filtered_per_observable(self):
+        payload = {
+            "current_experiment": "manual test",
+            "updates": {"pump": {"flow": [[5, 1.0]], "pressure": [[3, 2.0], [6, 1.0]]}},
+        }
+        # the flow is ahead of the pressure, the late pressure sample at 3 is kept
+        rows = get_sample_rows(
+            1, payload, after={("pump", "flow"): 5, ("pump", "pressure"): 2}
+        )
+        self.assertEqual(
+            [(row["observable"], row["timestamp"]) for row in rows],
+            [("pressure", 3.0), ("pressure", 6.0)],
+        )
+
+
+if __name__ == "__main__":
+    main()